@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+from card import stream_of, station_text
+from diff import STATE_COMPLETED
+
+logger = logging.getLogger("DiscordStartggManager")
+
+# Discordの上限 (Embedの本文・1メッセージのEmbedの合計・1メッセージのEmbedの数)
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_EMBED_TOTAL_LIMIT = 6000
+MESSAGE_EMBED_COUNT_LIMIT = 10
+
+# エントラントID → 表示名
+NameLookup = Callable[[object], Optional[str]]
+
+
+# 対戦台1台分の表示内容
+class BoardSlot:
+    __slots__ = ("set_id", "round_text", "entrant_ids", "scores")
+
+    def __init__(self, set_id, round_text: Optional[str], entrant_ids: tuple, scores: tuple[int, int]):
+        self.set_id = set_id
+        self.round_text = round_text
+        self.entrant_ids = entrant_ids
+        self.scores = scores
+
+    @classmethod
+    def from_node(cls, node: dict) -> "BoardSlot":
+        entrant_ids = tuple(((s or {}).get("entrant") or {}).get("id") for s in node.get("slots") or [])
+        winners = [g.get("winnerId") for g in node.get("games") or [] if g]
+        scores = tuple(sum(1 for w in winners if w == e) for e in entrant_ids[:2]) if len(entrant_ids) >= 2 else (0, 0)
+        return cls(node["id"], node.get("fullRoundText"), entrant_ids, scores)
+
+    def key(self) -> tuple:
+        return (self.set_id, self.round_text, self.entrant_ids, self.scores)
+
+
+def _station_key(station) -> tuple:
+    try:
+        return (0, int(station), "")
+    except (TypeError, ValueError):
+        return (1, 0, str(station))
+
+
+def _fits(embeds: list[list[str]], embed_limit: int, message_limit: int, max_embeds: int) -> bool:
+    sizes = [sum(len(line) for line in lines) + len(lines) - 1 for lines in embeds]
+    return len(embeds) <= max_embeds and all(size <= embed_limit for size in sizes) and sum(sizes) <= message_limit
+
+
+# Embedの本文の行を，Discordの上限に収まるようにメッセージごと・Embedごとに分ける
+# layout に前回の分け方 (メッセージごとのEmbedごとの行数) を渡すと，収まる限りそれに合わせる
+# (1行の長さが変わっても境目がずれず，変化のないメッセージを編集せずに済む)
+def paginate(
+    lines: list[str],
+    embed_limit: int = EMBED_DESCRIPTION_LIMIT - 96,
+    message_limit: int = MESSAGE_EMBED_TOTAL_LIMIT - 500,  # タイトルの分を空けておく
+    max_embeds: int = MESSAGE_EMBED_COUNT_LIMIT,
+    layout: Optional[list[list[int]]] = None,
+) -> list[list[list[str]]]:
+    lines = [line[:embed_limit] for line in lines]
+    if layout and sum(sum(counts) for counts in layout) == len(lines):
+        messages, start = [], 0
+        for counts in layout:
+            embeds = []
+            for count in counts:
+                embeds.append(lines[start:start + count])
+                start += count
+            messages.append(embeds)
+        if all(_fits(embeds, embed_limit, message_limit, max_embeds) for embeds in messages):
+            return messages
+
+    # 新しく分けるときは，後で行が長くなっても同じ分け方で収まるように余裕を持たせる
+    embed_limit = int(embed_limit * 0.85)
+    message_limit = int(message_limit * 0.85)
+    messages: list[list[list[str]]] = []
+    embeds: list[list[str]] = []
+    current: list[str] = []
+    size = 0   # 作成中のEmbedの文字数
+    total = 0  # 作成中のメッセージの文字数
+    for line in lines:
+        added = len(line) + (1 if current else 0)
+        if current and size + added > embed_limit:
+            embeds.append(current)
+            current, size = [], 0
+            added = len(line)
+        if total + added > message_limit or (not current and len(embeds) >= max_embeds):
+            if current:
+                embeds.append(current)
+            if embeds:
+                messages.append(embeds)
+            embeds, current, size, total = [], [], 0, 0
+            added = len(line)
+        current.append(line)
+        size += added
+        total += added
+
+    if current:
+        embeds.append(current)
+    if embeds:
+        messages.append(embeds)
+    return messages or [[[]]]
+
+
+# 大会ごとの対戦台の一覧 (ピン留めしたメッセージを定期的に編集する)
+# セットの変化を受け取るたびに手元の一覧だけを更新し，Discordへの反映は interval 秒に1回までにまとめる
+# 内容が変わったメッセージだけを編集し，上限を超えたら複数のメッセージに分ける
+class StationBoard:
+    def __init__(
+        self,
+        title: str,
+        stream_count: int,
+        names: NameLookup,
+        get_channel: Callable[[], Awaitable[Optional[discord.abc.Messageable]]],
+        message_ids: Optional[list[int]] = None,
+        on_messages: Optional[Callable[[list[int]], None]] = None,
+        interval: float = 10,
+    ):
+        self.title = title
+        self.stream_count = stream_count
+        self.names = names
+        self.get_channel = get_channel
+        self.message_ids = list(message_ids or [])
+        self.on_messages = on_messages
+        self.interval = interval
+        self.slots: dict = {}   # {station: BoardSlot}
+        self.max_station = 0
+        self.edits = 0
+        self.updates = 0
+        self._where: dict = {}  # {set_id: station}
+        self._rendered: list[Optional[tuple]] = [None] * len(self.message_ids)  # 最後に反映した内容
+        self._layout: Optional[list[list[int]]] = None  # 前回の分け方
+        self._last_flush = 0.0
+        self._dirty = False
+        self._worker: Optional[asyncio.Task] = None
+
+    # セット1件分の最新のノードを反映する．一覧が変わったかを返す
+    def apply(self, node: dict) -> bool:
+        set_id = node["id"]
+        station = (node.get("station") or {}).get("number")
+        occupied = station is not None and node.get("state") != STATE_COMPLETED
+        changed = False
+
+        old = self._where.get(set_id)
+        if old is not None and (not occupied or old != station):
+            del self._where[set_id]
+            if self.slots.get(old) is not None and self.slots[old].set_id == set_id:
+                del self.slots[old]
+                changed = True
+
+        if occupied:
+            slot = BoardSlot.from_node(node)
+            previous = self.slots.get(station)
+            if previous is None or previous.key() != slot.key():
+                if previous is not None and previous.set_id != set_id:
+                    self._where.pop(previous.set_id, None)
+                self.slots[station] = slot
+                self._where[set_id] = station
+                changed = True
+            if isinstance(station, int) and station > self.max_station:
+                self.max_station = station
+                changed = True
+
+        if changed:
+            self.updates += 1
+            self._schedule()
+        return changed
+
+    def _name(self, entrant_id) -> str:
+        if entrant_id is None:
+            return "TBD"
+        return self.names(entrant_id) or "?"
+
+    def render_line(self, station) -> str:
+        label = station_text(station, stream_of(station, self.stream_count))
+        slot = self.slots.get(station)
+        if slot is None:
+            return f"{label} ─ 空き"
+        names = [self._name(e) for e in slot.entrant_ids[:2]] + ["TBD"] * (2 - len(slot.entrant_ids[:2]))
+        text = f"{label} {names[0]} **{slot.scores[0]} - {slot.scores[1]}** {names[1]}"
+        if slot.round_text:
+            text += f" ({slot.round_text})"
+        return text
+
+    # 対戦台 1〜N (これまでに使われた最大の番号) と，番号以外の対戦台
+    def lines(self) -> list[str]:
+        stations = set(range(1, self.max_station + 1)) | set(self.slots)
+        return [self.render_line(s) for s in sorted(stations, key=_station_key)]
+
+    # メッセージごとのEmbedの本文
+    def pages(self) -> list[list[str]]:
+        pages = paginate(self.lines(), layout=self._layout)
+        self._layout = [[len(lines) for lines in embeds] for embeds in pages]
+        return [["\n".join(lines) for lines in embeds] for embeds in pages]
+
+    def _schedule(self):
+        self._dirty = True
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._dirty:
+            wait = self._last_flush + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"[WARNING] 対戦台の一覧を更新できませんでした: {self.title} ({e})")
+
+    def _embed(self, description: str, index: int, count: int) -> discord.Embed:
+        title = self.title if count == 1 else f"{self.title} ({index + 1}/{count})"
+        return discord.Embed(title=title, description=description or "─", color=discord.Color.dark_grey())
+
+    # 内容が変わったメッセージだけを編集し，足りなければ送信，余れば削除する
+    async def flush(self):
+        pages = self.pages()
+        channel = await self.get_channel()
+        if channel is None:
+            return
+        embed_count = sum(len(p) for p in pages)
+        numbered = 0
+        ids_changed = False
+        for index, page in enumerate(pages):
+            embeds = []
+            for description in page:
+                embeds.append(self._embed(description, numbered, embed_count))
+                numbered += 1
+            rendered = tuple((e.title, e.description) for e in embeds)
+
+            if index < len(self.message_ids):
+                if self._rendered[index] == rendered:
+                    continue
+                try:
+                    await channel.get_partial_message(self.message_ids[index]).edit(embeds=embeds)
+                    self.edits += 1
+                    self._rendered[index] = rendered
+                    continue
+                except discord.NotFound:
+                    # 消されたメッセージは送り直す
+                    logger.warning(f"[WARNING] 対戦台の一覧のメッセージが見つからないため送り直します: {self.title}")
+
+            message = await channel.send(embeds=embeds)
+            if index < len(self.message_ids):
+                self.message_ids[index] = message.id
+                self._rendered[index] = rendered
+            else:
+                self.message_ids.append(message.id)
+                self._rendered.append(rendered)
+            ids_changed = True
+            if index == 0:
+                try:
+                    await message.pin(reason="対戦台の一覧")
+                except discord.HTTPException as e:
+                    logger.warning(f"[WARNING] 対戦台の一覧をピン留めできませんでした: {self.title} ({e})")
+
+        # 一覧が短くなったら余ったメッセージを消す
+        for message_id in self.message_ids[len(pages):]:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.HTTPException:
+                pass
+            ids_changed = True
+        del self.message_ids[len(pages):]
+        del self._rendered[len(pages):]
+
+        if ids_changed and self.on_messages is not None:
+            self.on_messages(list(self.message_ids))
+
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    # 一覧を片付ける (通知先が変わったときに，前のチャンネルのメッセージを消す．消せばピン留めも外れる)
+    async def remove(self):
+        self.stop()
+        channel = await self.get_channel()
+        if channel is not None:
+            for message_id in self.message_ids:
+                try:
+                    await channel.get_partial_message(message_id).delete()
+                except discord.HTTPException as e:
+                    logger.warning(f"[WARNING] 前の対戦台の一覧を削除できませんでした: {self.title} ({e})")
+        self.message_ids.clear()
+        self._rendered.clear()
@@ -0,0 +1,175 @@
+"""ワーカー間のメッセージバス用の小さなRedis互換ブローカー (Redisを用意できない環境向け)
+
+    python apps/broker.py --port 6380
+    BUS_URL=redis://127.0.0.1:6380 WORKER_ROLE=poller  python apps/main.py
+    BUS_URL=redis://127.0.0.1:6380 WORKER_ROLE=discord python apps/main.py
+
+対応するコマンドは bus.RespBus が使うものだけ (PING / GET / SET [NX|XX] [PX|EX] / DEL / PEXPIRE / PUBLISH / SUBSCRIBE / UNSUBSCRIBE)
+データはメモリ上にだけ持つ
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from bus import RespError, encode_command, read_reply
+
+logger = logging.getLogger("DiscordStartggManager")
+
+
+def _simple(text: str) -> bytes:
+    return f"+{text}\r\n".encode()
+
+
+def _error(text: str) -> bytes:
+    return f"-ERR {text}\r\n".encode()
+
+
+def _integer(value: int) -> bytes:
+    return f":{value}\r\n".encode()
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return f"${len(value)}\r\n".encode() + value + b"\r\n"
+
+
+class BrokerServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 6380):
+        self.host = host
+        self.port = port
+        self._keys: dict[bytes, tuple[bytes, Optional[float]]] = {}  # {key: (value, 期限)}
+        self._subscribers: dict[bytes, set[asyncio.StreamWriter]] = {}
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"✅ ブローカーを起動しました: {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _value(self, key: bytes) -> Optional[bytes]:
+        item = self._keys.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._keys[key]
+            return None
+        return value
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels: set[bytes] = set()
+        self._clients.add(writer)
+        try:
+            while True:
+                try:
+                    args = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+                    break
+                except RespError as e:
+                    writer.write(_error(str(e)))
+                    continue
+                if not isinstance(args, list) or not args:
+                    writer.write(_error("invalid command"))
+                    continue
+                name = args[0].decode().upper()
+                if name == "QUIT":
+                    writer.write(_simple("OK"))
+                    break
+                writer.write(self._execute(name, args[1:], writer, channels))
+                await writer.drain()
+        finally:
+            self._clients.discard(writer)
+            for channel in channels:
+                self._subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+    def _execute(self, name: str, args: list[bytes], writer: asyncio.StreamWriter, channels: set[bytes]) -> bytes:
+        if name == "PING":
+            return _simple("PONG")
+        if name == "AUTH":
+            return _simple("OK")
+        if name == "GET":
+            return _bulk(self._value(args[0]))
+        if name == "SET":
+            return self._set(args)
+        if name == "DEL":
+            count = 0
+            for key in args:
+                if self._value(key) is not None:
+                    del self._keys[key]
+                    count += 1
+            return _integer(count)
+        if name == "PEXPIRE":
+            value = self._value(args[0])
+            if value is None:
+                return _integer(0)
+            self._keys[args[0]] = (value, time.monotonic() + int(args[1]) / 1000)
+            return _integer(1)
+        if name == "PUBLISH":
+            receivers = self._subscribers.get(args[0], set())
+            frame = encode_command(b"message", args[0], args[1])
+            for receiver in receivers:
+                receiver.write(frame)
+            return _integer(len(receivers))
+        if name == "SUBSCRIBE":
+            out = []
+            for channel in args:
+                channels.add(channel)
+                self._subscribers.setdefault(channel, set()).add(writer)
+                out.append(b"*3\r\n" + _bulk(b"subscribe") + _bulk(channel) + _integer(len(channels)))
+            return b"".join(out)
+        if name == "UNSUBSCRIBE":
+            out = []
+            for channel in args or list(channels):
+                channels.discard(channel)
+                self._subscribers.get(channel, set()).discard(writer)
+                out.append(b"*3\r\n" + _bulk(b"unsubscribe") + _bulk(channel) + _integer(len(channels)))
+            return b"".join(out)
+        return _error(f"unknown command '{name}'")
+
+    # SET key value [NX|XX] [PX ms|EX sec]
+    def _set(self, args: list[bytes]) -> bytes:
+        key, value = args[0], args[1]
+        options = [a.decode().upper() for a in args[2:]]
+        expires_at = None
+        for i, option in enumerate(options):
+            if option in ("PX", "EX") and i + 1 < len(options):
+                ttl = int(options[i + 1])
+                expires_at = time.monotonic() + (ttl / 1000 if option == "PX" else ttl)
+        exists = self._value(key) is not None
+        if ("NX" in options and exists) or ("XX" in options and not exists):
+            return _bulk(None)
+        self._keys[key] = (value, expires_at)
+        return _simple("OK")
+
+
+async def serve(host: str, port: int):
+    server = BrokerServer(host, port)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="ワーカー間のメッセージバス用のRedis互換ブローカー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
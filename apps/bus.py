@@ -0,0 +1,338 @@
+import asyncio
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger("DiscordStartggManager")
+
+# 受け取ったメッセージを処理する (同じ購読のメッセージは届いた順に1件ずつ呼ばれる)
+MessageHandler = Callable[[dict], Awaitable[None]]
+
+
+# ワーカー間のメッセージのやり取り (発行・購読) と，リーダー選出に使う期限付きのキー
+class MessageBus(ABC):
+    name = "base"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, message: dict):
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str, handler: MessageHandler):
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str):
+        ...
+
+    # key が空いていれば owner として取得し，すでに owner のものなら期限を延ばす．取得できたかを返す
+    @abstractmethod
+    async def acquire(self, key: str, owner: str, ttl_sec: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def release(self, key: str, owner: str):
+        ...
+
+
+# 同じプロセス内のバス (ワーカーを1つのプロセスで動かすとき・計測用)
+class MemoryBus(MessageBus):
+    name = "memory"
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._keys: dict[str, tuple[str, Optional[float]]] = {}  # {key: (value, 期限)}
+        self._queues: dict[str, list[asyncio.Queue]] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def publish(self, channel: str, message: dict):
+        for queue in self._queues.get(channel, []):
+            queue.put_nowait(message)
+
+    # 発行済みのメッセージをすべて処理し終えるまで待つ
+    async def drain(self):
+        for queues in list(self._queues.values()):
+            for queue in queues:
+                await queue.join()
+
+    def subscribe(self, channel: str, handler: MessageHandler):
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues.setdefault(channel, []).append(queue)
+        self._tasks.append(asyncio.get_running_loop().create_task(_consume(channel, queue, handler)))
+
+    def _value(self, key: str) -> Optional[str]:
+        item = self._keys.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= self.clock():
+            del self._keys[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._value(key)
+
+    async def set(self, key: str, value: str):
+        self._keys[key] = (value, None)
+
+    async def acquire(self, key: str, owner: str, ttl_sec: float) -> bool:
+        current = self._value(key)
+        if current is not None and current != owner:
+            return False
+        self._keys[key] = (owner, self.clock() + ttl_sec)
+        return True
+
+    async def release(self, key: str, owner: str):
+        if self._value(key) == owner:
+            del self._keys[key]
+
+
+async def _consume(channel: str, queue: asyncio.Queue, handler: MessageHandler):
+    while True:
+        message = await queue.get()
+        try:
+            await handler(message)
+        except Exception as e:
+            logger.error(f"[ERROR] メッセージの処理に失敗しました: {channel} ({e})")
+        finally:
+            queue.task_done()
+
+
+class RespError(Exception):
+    pass
+
+
+# RESP (Redisのプロトコル) の応答を1つ読む
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        size = int(body)
+        if size < 0:
+            return None
+        data = await reader.readexactly(size + 2)
+        return data[:-2]
+    if kind == b"*":
+        size = int(body)
+        if size < 0:
+            return None
+        return [await read_reply(reader) for _ in range(size)]
+    raise RespError(f"unknown reply: {line!r}")
+
+
+def encode_command(*args) -> bytes:
+    out = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        out.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(out)
+
+
+# Redis互換のブローカー (Redis本体 / broker.py) を使うバス
+# redis://[:password@]host:port の形式で指定する．使うコマンドは PUBLISH / SUBSCRIBE / GET / SET / PEXPIRE / DEL だけ
+class RespBus(MessageBus):
+    name = "resp"
+
+    def __init__(self, url: str, retry_delay: float = 1):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.retry_delay = retry_delay
+        self._conn: Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._lock = asyncio.Lock()
+        self._handlers: dict[str, MessageHandler] = {}
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._listener: Optional[asyncio.Task] = None
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await writer.drain()
+            await read_reply(reader)
+        return reader, writer
+
+    async def start(self):
+        async with self._lock:
+            if self._conn is None:
+                self._conn = await self._connect()
+        logger.info(f"✅ メッセージバスに接続しました: {self.host}:{self.port}")
+
+    async def close(self):
+        tasks = self._tasks + ([self._listener] if self._listener else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._listener = None
+        if self._conn is not None:
+            self._conn[1].close()
+            self._conn = None
+
+    # コマンドを1つ送って応答を待つ (切断されていればつなぎ直して1回だけやり直す)
+    async def command(self, *args):
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = await self._connect()
+                    reader, writer = self._conn
+                    writer.write(encode_command(*args))
+                    await writer.drain()
+                    return await read_reply(reader)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    if self._conn is not None:
+                        self._conn[1].close()
+                    self._conn = None
+                    if attempt:
+                        raise
+
+    async def publish(self, channel: str, message: dict):
+        await self.command("PUBLISH", channel, json.dumps(message, separators=(",", ":")))
+
+    def subscribe(self, channel: str, handler: MessageHandler):
+        queue: asyncio.Queue = asyncio.Queue()
+        self._handlers[channel] = handler
+        self._queues[channel] = queue
+        loop = asyncio.get_running_loop()
+        self._tasks.append(loop.create_task(_consume(channel, queue, handler)))
+        # 購読するチャンネルが増えたら，購読用の接続を張り直す
+        if self._listener is not None:
+            self._listener.cancel()
+        self._listener = loop.create_task(self._listen())
+
+    # 購読専用の接続で受信する．切れたらつなぎ直して購読し直す
+    async def _listen(self):
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                writer.write(encode_command("SUBSCRIBE", *self._handlers))
+                await writer.drain()
+                while True:
+                    reply = await read_reply(reader)
+                    if not isinstance(reply, list) or len(reply) < 3 or reply[0] != b"message":
+                        continue
+                    channel = reply[1].decode()
+                    queue = self._queues.get(channel)
+                    if queue is not None:
+                        queue.put_nowait(json.loads(reply[2]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[WARNING] メッセージバスの購読が切断されました: {e}")
+                await asyncio.sleep(self.retry_delay)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self.command("GET", key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, value: str):
+        await self.command("SET", key, value)
+
+    # 期限を延ばす前に持ち主を確認する (確認と延長の間に期限が切れることはない程度に早めに延長する前提)
+    async def acquire(self, key: str, owner: str, ttl_sec: float) -> bool:
+        ttl_ms = max(1, int(ttl_sec * 1000))
+        if await self.command("SET", key, owner, "NX", "PX", ttl_ms) == "OK":
+            return True
+        if await self.get(key) == owner:
+            await self.command("PEXPIRE", key, ttl_ms)
+            return True
+        return False
+
+    async def release(self, key: str, owner: str):
+        if await self.get(key) == owner:
+            await self.command("DEL", key)
+
+
+def build_bus(url: str) -> MessageBus:
+    if not url or url == "memory":
+        return MemoryBus()
+    if url.startswith(("redis://", "resp://")):
+        return RespBus(url)
+    raise RuntimeError(f"Unknown BUS_URL: {url}")
+
+
+# 大会ごとのリーダー選出
+# 期限付きのキー (leader:<slug>) を取れたワーカーだけがその大会をポーリングする
+# 期限の1/3ごとに延長し，延長できなければ (ワーカーが止まれば) 期限切れの後に別のワーカーが引き継ぐ
+class LeaderElector:
+    def __init__(
+        self,
+        bus: MessageBus,
+        owner: str,
+        ttl_sec: float = 15,
+        on_elected: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        self.bus = bus
+        self.owner = owner
+        self.ttl_sec = ttl_sec
+        self.on_elected = on_elected
+        self.leading: set[str] = set()
+
+    def is_leader(self, name: str) -> bool:
+        return name in self.leading
+
+    async def campaign(self, names: list[str]) -> set[str]:
+        for name in names:
+            try:
+                won = await self.bus.acquire(f"leader:{name}", self.owner, self.ttl_sec)
+            except Exception as e:
+                logger.warning(f"[WARNING] リーダーの確認に失敗しました: {name} ({e})")
+                won = False
+            if won and name not in self.leading:
+                self.leading.add(name)
+                logger.info(f"✅ 大会 {name} のポーリングを担当します (worker = {self.owner})")
+                if self.on_elected:
+                    await self.on_elected(name)
+            elif not won and name in self.leading:
+                self.leading.discard(name)
+                logger.warning(f"[WARNING] 大会 {name} のポーリングの担当を外れました (worker = {self.owner})")
+        # 登録を解除された大会は手放す
+        for name in self.leading - set(names):
+            await self.resign(name)
+        return self.leading
+
+    async def resign(self, name: str):
+        self.leading.discard(name)
+        try:
+            await self.bus.release(f"leader:{name}", self.owner)
+        except Exception as e:
+            logger.warning(f"[WARNING] リーダーの解除に失敗しました: {name} ({e})")
+
+    async def resign_all(self):
+        for name in list(self.leading):
+            await self.resign(name)
@@ -0,0 +1,82 @@
+from collections import deque
+from typing import Optional
+
+# ポーリングの間隔を決めた理由
+BURST = "burst"            # 呼び出し・報告が集中している
+ACTIVE = "active"          # 対戦中のセットがある・最近変化があった
+IDLE = "idle"              # しばらく変化がない
+RATE_LIMIT = "rate_limit"  # レート制限の残りが少ない
+
+
+# 大会ごとのポーリングの間隔
+# 直近の変化の件数・対戦中のセットの数・最後の変化からの時間・レート制限の残りから次の間隔を決める
+# 時刻は呼び出し側が渡す (UNIX秒)
+class PollCadence:
+    def __init__(
+        self,
+        base_interval: float = 2,
+        min_interval: float = 1,
+        max_interval: float = 30,
+        idle_after: float = 120,
+        burst_changes: int = 30,
+        window_sec: float = 60,
+        low_headroom: float = 0.2,
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.idle_after = idle_after
+        self.burst_changes = burst_changes
+        self.window_sec = window_sec
+        self.low_headroom = low_headroom
+        self.interval = base_interval
+        self.reason = ACTIVE
+        self.last_change_at: Optional[float] = None
+        self.cost = 0.0  # 1回のポーリングのリクエスト数 (指数移動平均)
+        self._recent: deque = deque()  # [(時刻, 変化の件数)]
+
+    # 1回のポーリングの結果を記録する
+    def record(self, now: float, changes: int, requests: int):
+        # 起動直後は変化があったものとして扱う (いきなり間隔を伸ばさない)
+        if changes or self.last_change_at is None:
+            self.last_change_at = now
+        if changes:
+            self._recent.append((now, changes))
+        while self._recent and self._recent[0][0] <= now - self.window_sec:
+            self._recent.popleft()
+        requests = max(1, requests)
+        self.cost = requests if not self.cost else 0.7 * self.cost + 0.3 * requests
+
+    # 直近 window_sec 秒の変化の件数
+    @property
+    def recent_changes(self) -> int:
+        return sum(count for _, count in self._recent)
+
+    # in_progress: 対戦中・呼び出し済みのセットの数
+    # headroom: レート制限の残り (0〜1)
+    # budget_interval: ポーリングに割り当てたリクエスト数に収まる最短の間隔
+    # (間隔, 理由) を返す
+    def next_interval(self, now: float, in_progress: int, headroom: float = 1.0, budget_interval: float = 0.0) -> tuple[float, str]:
+        since = now - self.last_change_at if self.last_change_at is not None else 0.0
+        # 対戦中のセットがあれば報告が来るはずなので，しばらくは間隔を空けない
+        grace = self.idle_after * (3 if in_progress else 1)
+
+        if self.recent_changes >= self.burst_changes:
+            interval, reason = self.min_interval, BURST
+        elif since < grace:
+            interval, reason = self.base_interval, ACTIVE
+        else:
+            # 変化のない時間が長いほど間隔を倍々に伸ばす
+            steps = 1 + (since - grace) / self.idle_after
+            interval, reason = self.base_interval * 2 ** min(steps, 16), IDLE
+
+        limited = max(interval, budget_interval)
+        if headroom < self.low_headroom:
+            # 残りが少ないほど最大で2倍まで伸ばす
+            limited = max(limited, self.base_interval) * (2 - max(0.0, headroom) / self.low_headroom)
+        if limited > interval:
+            interval, reason = limited, RATE_LIMIT
+
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+        self.reason = reason
+        return self.interval, reason
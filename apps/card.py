@@ -0,0 +1,105 @@
+from typing import Optional
+
+import discord
+
+# 対戦カードの状態
+CARD_ACTIVE = "active"                  # スコア入力受付中
+CARD_FINISHED = "finished"              # 選手がスコアを送信した / start.gg側でスコア付きで終了した
+CARD_FINISHED_STAFF = "finished_staff"  # start.gg側で勝敗だけ登録された
+
+# 配信台の種類
+STREAM_MAIN = "main"
+STREAM_SUB = "sub"
+
+UNKNOWN_ROUND = "不明なラウンド"
+
+
+# 対戦台の番号から配信台かどうかを判定する (1番は配信台，stream_count番までがサブ配信台)
+def stream_of(station, stream_count: int) -> Optional[str]:
+    try:
+        number = int(station)
+    except (TypeError, ValueError):
+        return None
+    if number == 1:
+        return STREAM_MAIN
+    if number <= stream_count:
+        return STREAM_SUB
+    return None
+
+
+def station_text(station, stream: Optional[str]) -> str:
+    label = f"🖥️ **Station {station if station is not None else '?'}**"
+    if stream == STREAM_MAIN:
+        return f"{label} 🎥**配信台**"
+    if stream == STREAM_SUB:
+        return f"{label} 🎥**サブ配信台**"
+    return label
+
+
+# 対戦カード1枚分の内容
+# 文字列を書き換えるのではなく，この内容から毎回Embedを組み立てる
+class MatchCard:
+    __slots__ = ("round_text", "station", "stream", "names", "tags", "scores", "status", "winner", "_header")
+
+    def __init__(
+        self,
+        round_text: Optional[str],
+        station,
+        stream: Optional[str],
+        names: tuple[str, str],
+        tags: Optional[tuple[str, str]] = None,
+    ):
+        self.round_text = round_text or UNKNOWN_ROUND
+        self.station = station
+        self.stream = stream
+        self.names = names         # Embedに表示する名前 (個人戦はメンション，チーム戦はチーム名)
+        self.tags = tags or names  # 勝敗だけ表示するときの名前
+        self.scores = [0, 0]
+        self.status = CARD_ACTIVE
+        self.winner: Optional[int] = None  # 0 / 1
+        self._header: Optional[str] = None
+
+    # 対戦台の移動 (ラウンド・対戦台の部分だけ作り直す)
+    def move(self, station, stream: Optional[str]):
+        self.station = station
+        self.stream = stream
+        self._header = None
+
+    def set_scores(self, s1: Optional[int], s2: Optional[int]):
+        self.scores[0] = s1 or 0
+        self.scores[1] = s2 or 0
+
+    def finish(self, s1: Optional[int] = None, s2: Optional[int] = None, winner: Optional[int] = None):
+        if s1 is None and s2 is None:
+            self.status = CARD_FINISHED_STAFF
+            self.winner = winner
+        else:
+            self.set_scores(s1, s2)
+            self.status = CARD_FINISHED
+
+    # 受付を再開する (送信したスコア報告が取り下げられたとき)
+    def reopen(self):
+        self.status = CARD_ACTIVE
+        self.winner = None
+
+    @property
+    def header(self) -> str:
+        if self._header is None:
+            self._header = f"🏷️ {self.round_text}\n\n{station_text(self.station, self.stream)}\n\n"
+        return self._header
+
+    def render(self) -> str:
+        if self.status == CARD_FINISHED_STAFF:
+            w = self.winner or 0
+            return (
+                "✅ **この試合は終了しました\n（スタッフにより処理されました）**\n\n"
+                f"{self.header}{self.tags[w]} (**WIN**)\nvs\n{self.tags[1 - w]} (**LOSE**)"
+            )
+
+        body = f"{self.names[0]} ({self.scores[0]})\nvs\n{self.names[1]} ({self.scores[1]})"
+        if self.status == CARD_FINISHED:
+            return f"✅ **この試合は終了しました**\n\n{self.header}{body}"
+        return self.header + body
+
+    def embed(self) -> discord.Embed:
+        return discord.Embed(description=self.render(), color=discord.Color.blue())
@@ -0,0 +1,143 @@
+from typing import Optional
+
+# start.ggのセットの状態
+STATE_COMPLETED = 3
+STATE_CALLED = 6
+# 対戦中 (2)・呼び出し済み (6)
+ACTIVE_STATES = (2, STATE_CALLED)
+
+# 変更の種類
+CALLED = "called"                # 対戦台が割り当てられた
+STATION_MOVED = "station_moved"  # 対戦台が変わった
+SCORE_CHANGED = "score_changed"  # 試合中にスコアが変わった
+COMPLETED = "completed"          # 試合が終了した
+CORRECTED = "corrected"          # 終了した試合の勝者・スコアが修正された
+RESET = "reset"                  # 終了した試合が差し戻された
+
+
+# セット1件分の要約 (ノード全体は保持しない)
+class SetSnapshot:
+    __slots__ = ("id", "state", "station", "winner_id", "game_winners", "digest")
+
+    def __init__(self, set_id, state=None, station=None, winner_id=None, game_winners=(), digest=None):
+        self.id = set_id
+        self.state = state
+        self.station = station
+        self.winner_id = winner_id
+        self.game_winners = game_winners
+        self.digest = digest
+
+    @classmethod
+    def from_node(cls, node: dict) -> "SetSnapshot":
+        station = (node.get("station") or {}).get("number")
+        game_winners = tuple(g.get("winnerId") for g in node.get("games") or [] if g)
+        entrants = tuple(((s or {}).get("entrant") or {}).get("id") for s in node.get("slots") or [])
+        state = node.get("state")
+        winner_id = node.get("winnerId")
+        digest = hash((state, station, winner_id, game_winners, entrants, node.get("fullRoundText")))
+        return cls(node["id"], state, station, winner_id, game_winners, digest)
+
+    # 終了したセットは対戦台・勝者と変化の判定に使う値だけを残す (ゲームごとの勝者の修正・差し戻しは digest で分かる)
+    def compact(self) -> "SetSnapshot":
+        return SetSnapshot(self.id, self.state, self.station, self.winner_id, digest=self.digest)
+
+
+class SetEvent:
+    __slots__ = ("kind", "node", "current", "previous")
+
+    def __init__(self, kind: str, node: dict, current: SetSnapshot, previous: Optional[SetSnapshot]):
+        self.kind = kind
+        self.node = node
+        self.current = current
+        self.previous = previous
+
+
+# 前回の要約と比べて，変化があったものだけをイベントとして返す
+class SetDiffer:
+    def __init__(self):
+        self.snapshots: dict = {}
+        self.in_progress = 0  # 対戦中・呼び出し済みのセットの数
+
+    def _store(self, current: SetSnapshot):
+        previous = self.snapshots.get(current.id)
+        if previous is not None and previous.state in ACTIVE_STATES:
+            self.in_progress -= 1
+        if current.state in ACTIVE_STATES:
+            self.in_progress += 1
+        self.snapshots[current.id] = current.compact() if current.state == STATE_COMPLETED else current
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    def __contains__(self, set_id) -> bool:
+        return set_id in self.snapshots
+
+    def digest_of(self, set_id):
+        snap = self.snapshots.get(set_id)
+        return snap.digest if snap else None
+
+    def station_of(self, set_id):
+        snap = self.snapshots.get(set_id)
+        return snap.station if snap else None
+
+    # 再起動時に保存済みの対戦台だけを戻す (状態は次回の取得で埋まる)
+    def restore(self, set_id, station):
+        self._store(SetSnapshot(set_id, station=station))
+
+    # 通知せずに記録だけする (初回の読み込み)．対戦台が変わったかを返す
+    def seed(self, node: dict) -> bool:
+        current = SetSnapshot.from_node(node)
+        previous = self.snapshots.get(current.id)
+        self._store(current)
+        return previous is None or previous.station != current.station
+
+    def diff(self, node: dict) -> list[SetEvent]:
+        current = SetSnapshot.from_node(node)
+        previous = self.snapshots.get(current.id)
+        if previous is not None and previous.digest == current.digest:
+            return []
+        self._store(current)
+
+        events: list[SetEvent] = []
+        prev_station = previous.station if previous else None
+        prev_state = previous.state if previous else None
+
+        if current.station is not None and current.station != prev_station:
+            kind = CALLED if prev_station is None else STATION_MOVED
+            events.append(SetEvent(kind, node, current, previous))
+
+        finished = current.state == STATE_COMPLETED
+        was_finished = prev_state == STATE_COMPLETED
+
+        if finished and not was_finished:
+            events.append(SetEvent(COMPLETED, node, current, previous))
+        elif was_finished and not finished:
+            events.append(SetEvent(RESET, node, current, previous))
+        elif finished and was_finished:
+            # 終了後にスタッフが勝者・スコアを直した (ここに来るのは digest が変わったときだけ)
+            events.append(SetEvent(CORRECTED, node, current, previous))
+        # 再起動時に戻した要約 (状態なし) はスコアが分からないので比べない
+        elif not finished and previous is not None and previous.state is not None and previous.game_winners != current.game_winners:
+            events.append(SetEvent(SCORE_CHANGED, node, current, previous))
+
+        return events
+
+
+# ワーカー間で受け渡すときの形 (セット1件分のイベント → dict)
+# 変化の判定は検出した側で済んでいるので，前回の要約は対戦台だけを渡す
+def encode_events(events: list[SetEvent]) -> dict:
+    previous = events[0].previous
+    return {
+        "node": events[0].node,
+        "kinds": [e.kind for e in events],
+        "previous_station": previous.station if previous else None,
+    }
+
+
+def decode_events(item: dict) -> list[SetEvent]:
+    node = item["node"]
+    current = SetSnapshot.from_node(node)
+    previous = None
+    if item.get("previous_station") is not None:
+        previous = SetSnapshot(current.id, station=item["previous_station"])
+    return [SetEvent(kind, node, current, previous) for kind in item["kinds"]]
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+import discord
+
+logger = logging.getLogger("DiscordStartggManager")
+
+
+# メッセージごとの編集キュー
+# 送信待ちの編集は上書きでまとめ (最新のembed/viewが勝つ)，呼び出し元は待たずに戻る
+# レート制限のバケットごとの待ち合わせは discord.py 側が行う
+class MessageEditQueue:
+    def __init__(self, min_interval: float = 0.3):
+        self.min_interval = min_interval
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._pending: dict[int, tuple[discord.Message, dict]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, message: discord.Message, **fields):
+        key = message.id
+        pending = self._pending.get(key)
+        if pending:
+            self.coalesced += 1
+            fields = {**pending[1], **fields}
+        self._pending[key] = (message, fields)
+
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.get_running_loop().create_task(self._run(key))
+
+    async def _run(self, key: int):
+        try:
+            while key in self._pending:
+                message, fields = self._pending.pop(key)
+                try:
+                    await message.edit(**fields)
+                    self.sent += 1
+                except discord.HTTPException as e:
+                    self.failed += 1
+                    logger.warning(f"[WARNING] メッセージの編集に失敗しました: message_id = {key} ({e})")
+
+                # 連打された場合は少し待って，その間の変更を1回の編集にまとめる
+                if key in self._pending:
+                    await asyncio.sleep(self.min_interval)
+        finally:
+            self._workers.pop(key, None)
+
+    async def drain(self):
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
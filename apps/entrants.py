@@ -0,0 +1,182 @@
+import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+
+# 参加者 (チームの場合は複数人)
+class Player:
+    __slots__ = ("gamer_tag", "discord_id")
+
+    def __init__(self, gamer_tag: str, discord_id: Optional[int]):
+        self.gamer_tag = gamer_tag
+        self.discord_id = discord_id
+
+
+# エントラント (start.ggの参加枠)
+class Entrant:
+    __slots__ = ("id", "name", "players")
+
+    def __init__(self, entrant_id, name: str, players: list[Player]):
+        self.id = entrant_id
+        self.name = name
+        self.players = players
+
+    @classmethod
+    def from_node(cls, node: dict) -> "Entrant":
+        players = []
+        for part in node.get("participants") or []:
+            discord_id = None
+            for auth in ((part.get("user") or {}).get("authorizations") or []):
+                if auth.get("type") == "DISCORD":
+                    ext_id = auth.get("externalId")
+                    if ext_id and ext_id.isdigit():
+                        discord_id = int(ext_id)
+                        break
+            players.append(Player(part.get("gamerTag", "Unknown"), discord_id))
+        return cls(node["id"], node.get("name") or "Unknown", players)
+
+
+# 複数の取得処理を並行して動かし，届いたページから順に返す
+# 各取得処理は emit にページを渡す．どれかが失敗したら残りを止めて例外を送出する
+async def stream_pages(jobs: list[Callable[[Callable[[list], None]], Awaitable[None]]]) -> AsyncIterator[list]:
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.ensure_future(asyncio.gather(*(job(queue.put_nowait) for job in jobs)))
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+                continue
+            getter.cancel()
+            producer.result()
+            while not queue.empty():
+                yield queue.get_nowait()
+            return
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+
+# 進行中の取得1回分 (届いたページを順に貯め，後から加わった呼び出し元にも最初から渡す)
+class _Fetch:
+    def __init__(self):
+        self.pages: list[list[Entrant]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def push(self, page: list[Entrant]):
+        self.pages.append(page)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[list[Entrant]]:
+        index = 0
+        while True:
+            while index < len(self.pages):
+                index += 1
+                yield self.pages[index - 1]
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._wakeup.wait()
+
+
+# エントラントID → 名前・Discord ID の対応表
+# 大会中はほとんど変化しないので，ポーリングとは別にまれに取り直す
+# loader はノードのリストをページごとに返す非同期イテレータ
+# 取得は同時に1回だけ行い，途中から呼ばれた場合もすでに届いたページから順に受け取る
+# background は期限切れの一覧を裏で取り直すときに loader に渡す引数 (呼び出し元の優先度を引き継がない)
+class EntrantDirectory:
+    def __init__(self, loader: Callable[..., AsyncIterator[list[dict]]], ttl_sec: float = 600, background: Optional[dict] = None):
+        self.loader = loader
+        self.ttl_sec = ttl_sec
+        self.background = background or {}
+        self.entrants: dict = {}
+        self.loaded_at = 0.0
+        self.fetches = 0
+        self._fetch: Optional[_Fetch] = None
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self.loaded_at >= self.ttl_sec
+
+    # 進行中の取得があればそれに加わり，なければ始める
+    def _start(self, kwargs: dict) -> _Fetch:
+        if self._fetch is None:
+            fetch = _Fetch()
+            fetch.task = asyncio.get_running_loop().create_task(self._run(fetch, kwargs))
+            self._fetch = fetch
+            self.fetches += 1
+        return self._fetch
+
+    async def _run(self, fetch: _Fetch, kwargs: dict):
+        entrants: dict = {}
+        try:
+            async for nodes in self.loader(**kwargs):
+                page = [Entrant.from_node(n) for n in nodes if n]
+                for entrant in page:
+                    entrants[entrant.id] = entrant
+                # 取得中でも届いた分はすぐに引けるようにする (全件そろったら入れ替える)
+                self.entrants.update((e.id, e) for e in page)
+                fetch.push(page)
+        except BaseException as e:
+            fetch.finish(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            self.entrants = entrants
+            self.loaded_at = time.monotonic()
+            fetch.finish()
+        finally:
+            if self._fetch is fetch:
+                self._fetch = None
+
+    async def refresh(self, **kwargs):
+        async for _ in self._start(kwargs).follow():
+            pass
+
+    async def ensure(self, **kwargs):
+        if self.stale:
+            await self.refresh(**kwargs)
+
+    # 期限内なら手元の一覧をまとめて返し，期限切れなら取得したページから順に返す
+    async def stream(self, **kwargs) -> AsyncIterator[list[Entrant]]:
+        if not self.stale:
+            yield list(self.entrants.values())
+            return
+        async for page in self._start(kwargs).follow():
+            yield page
+
+    # 手元にあれば期限切れでもそのまま返し，取り直しは裏で始める
+    # 見つからない場合は新規登録の可能性があるので一度だけ取り直す (取得中なら見つかった時点で返す)
+    async def lookup(self, entrant_id, **kwargs) -> Optional[Entrant]:
+        if entrant_id in self.entrants:
+            if self.stale:
+                self._start(self.background)
+            return self.entrants[entrant_id]
+        async for page in self._start(kwargs).follow():
+            for entrant in page:
+                if entrant.id == entrant_id:
+                    return entrant
+        return self.entrants.get(entrant_id)
+
+    def discord_ids(self) -> list[tuple[int, str]]:
+        return discord_id_pairs(self.entrants.values())
+
+
+# エントラントの一覧から (Discord ID, ゲーマータグ) の組を取り出す
+def discord_id_pairs(entrants) -> list[tuple[int, str]]:
+    return [(p.discord_id, p.gamer_tag) for e in entrants for p in e.players if p.discord_id]
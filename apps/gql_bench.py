@@ -0,0 +1,141 @@
+"""start.ggへのリクエストの負荷試験 (手元の偽のstart.ggを使う)．旧実装と接続を使い回すクライアントを比べる
+
+    python apps/gql_bench.py                          # 600回・同時8本
+    python apps/gql_bench.py --requests 2000 --concurrency 16
+    python apps/gql_bench.py --rtt 0.02               # 往復20msの回線を想定する
+
+旧実装: リクエストごとに新しく接続し (requests.post と同じ)，スレッドプールで実行する
+新実装: GqlClient (aiohttp のセッションを共有し，接続を使い回す)
+偽のstart.ggは往復ごとに rtt，新しい接続ごとに TCP + TLS のハンドシェイク分 (rtt × 2) 待ってから応答する
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+from typing import Optional
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from startgg import GqlClient  # noqa: E402
+
+BENCH_QUERY = "query GetEventSets($eventId: ID!) { event(id: $eventId) { sets { nodes { id state } } } }"
+
+
+# 偽のstart.gg (受け取ったリクエストと，接続元の数を数える)
+class StandInStartgg:
+    def __init__(self, rtt: float = 0, sets: int = 64):
+        self.rtt = rtt
+        self.requests = 0
+        self.peers: set = set()  # 接続元 (接続した socket の数を数える)
+        self.body = json.dumps({"data": {"event": {"sets": {"nodes": [{"id": i, "state": 2} for i in range(sets)]}}}})
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/gql", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/gql"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        await request.json()
+        self.requests += 1
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        if self.rtt:
+            await asyncio.sleep(self.rtt * (3 if peer not in self.peers else 1))
+        self.peers.add(peer)
+        return web.Response(text=self.body, content_type="application/json")
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# 旧実装と同じく，1回ごとに接続してスレッドプールで待つ
+def post_once(url: str, payload: bytes, timeout_sec: float) -> dict:
+    request = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json", "Connection": "close"})
+    with urllib.request.urlopen(request, timeout=timeout_sec) as resp:
+        return json.loads(resp.read())
+
+
+async def run(mode: str, requests: int, concurrency: int, rtt: float) -> dict:
+    server = StandInStartgg(rtt)
+    await server.start()
+    variables = {"eventId": 1}
+    client = GqlClient(server.url, "bench", max_concurrency=concurrency) if mode == "pooled" else None
+    sem = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    payload = json.dumps({"query": BENCH_QUERY, "variables": variables}).encode()
+    latencies: list[float] = []
+
+    async def one():
+        async with sem:
+            started = time.perf_counter()
+            if client is not None:
+                await client.execute(BENCH_QUERY, variables)
+            else:
+                await loop.run_in_executor(None, post_once, server.url, payload, 15)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    if client is not None:
+        await client.close()
+    await server.stop()
+    return {
+        "mode": mode,
+        "requests": server.requests,
+        "sockets": len(server.peers),
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "wall_sec": elapsed,
+    }
+
+
+def print_table(results: list[dict]):
+    columns = [
+        ("mode", "{:>7}"), ("requests", "{:>8}"), ("sockets", "{:>7}"),
+        ("p50_ms", "{:>8.1f}"), ("p99_ms", "{:>8.1f}"), ("wall_sec", "{:>8.2f}"),
+    ]
+    print(" ".join(f"{name:>{len(fmt.format(0))}}" for name, fmt in columns))
+    for r in results:
+        print(" ".join(fmt.format(r[name]) for name, fmt in columns))
+
+
+async def main_async(args) -> list[dict]:
+    return [await run(mode, args.requests, args.concurrency, args.rtt) for mode in ("legacy", "pooled")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="start.ggへのリクエストの負荷試験 (旧実装と接続を使い回すクライアントの比較)")
+    parser.add_argument("--requests", type=int, default=600, help="リクエストの回数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に送るリクエストの数")
+    parser.add_argument("--rtt", type=float, default=0.01, help="偽のstart.ggまでの往復の遅延 (秒)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    # 接続を使い回して，旧実装より遅くならないこと
+    legacy, pooled = results
+    if pooled["sockets"] > args.concurrency or pooled["p50_ms"] > legacy["p50_ms"]:
+        sys.exit(1)
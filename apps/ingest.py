@@ -0,0 +1,149 @@
+import asyncio
+import hmac
+import ipaddress
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+from discord.ext import tasks
+
+logger = logging.getLogger("DiscordStartggManager")
+
+# 変更のあったセット (QUERY_EVENT_SETS のノードと同じ形) を受け取る処理
+SetChangeHandler = Callable[[list[dict]], Awaitable[None]]
+# セットIDからノードを取得する処理 (プッシュで届いたセットは，すべてstart.ggから取り直す)
+SetResolver = Callable[[object], Awaitable[Optional[dict]]]
+
+
+# 同じマシンからしか届かないアドレスか
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# 取り込み方式の共通インターフェース
+class IngestBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def start(self):
+        ...
+
+    @abstractmethod
+    async def stop(self):
+        ...
+
+
+# 従来のポーリング (poll_sets) を取り込み方式の1つとして扱う
+class PollingBackend(IngestBackend):
+    name = "poll"
+
+    def __init__(self, loop: tasks.Loop):
+        self.loop = loop
+
+    async def start(self):
+        if not self.loop.is_running():
+            self.loop.start()
+
+    async def stop(self):
+        self.loop.cancel()
+
+
+# start.ggのWebhook形式の通知を受け取るHTTPエンドポイント
+# 受け付けた時点で202を返し，処理はバックグラウンドで行う
+# 届いた内容はセットIDとしてだけ使い，ノードは resolver でstart.ggから取り直す (偽の呼び出し・終了を送られても反映しない)
+class PushBackend(IngestBackend):
+    name = "push"
+
+    def __init__(
+        self,
+        handler: SetChangeHandler,
+        resolver: SetResolver,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        path: str = "/startgg/sets",
+        secret: Optional[str] = None,
+    ):
+        self.handler = handler
+        self.resolver = resolver
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.received = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self._receive)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"✅ セット更新の受信を開始しました: http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    # {"sets": [...]} / {"set": {...}} / {"data": {"set": {...}}} / {"setId": 1} とそれらのリストを受け付ける
+    @staticmethod
+    def _parse(body) -> tuple[list[dict], list]:
+        nodes, ids = [], []
+        items = body if isinstance(body, list) else [body]
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            if "sets" in item:
+                n, i = PushBackend._parse(item["sets"])
+                nodes += n
+                ids += i
+            elif "data" in item or "set" in item:
+                n, i = PushBackend._parse((item.get("data") or item).get("set"))
+                nodes += n
+                ids += i
+            elif "slots" in item or "station" in item:
+                nodes.append(item)
+            elif item.get("setId") or item.get("id"):
+                ids.append(item.get("setId") or item.get("id"))
+        return nodes, ids
+
+    def _authorized(self, request: web.Request) -> bool:
+        if not self.secret:
+            return True
+        given = request.headers.get("X-Webhook-Secret", "")
+        return hmac.compare_digest(given.encode(), self.secret.encode())
+
+    async def _receive(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "invalid json"}, status=400)
+
+        nodes, ids = self._parse(body)
+        self.received += len(nodes) + len(ids)
+
+        task = asyncio.get_running_loop().create_task(self._process(nodes, ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({"accepted": len(nodes) + len(ids)}, status=202)
+
+    async def _process(self, nodes: list[dict], ids: list):
+        try:
+            ids = list(dict.fromkeys(ids + [n["id"] for n in nodes if n.get("id")]))
+            resolved = await asyncio.gather(*(self.resolver(i) for i in ids))
+            nodes = [n for n in resolved if n]
+            if nodes:
+                await self.handler(nodes)
+        except Exception as e:
+            logger.error(f"[ERROR] 受信したセット更新の処理に失敗しました: {e}")
@@ -0,0 +1,271 @@
+"""スコア入力のボタンが同時に押されたときの負荷試験 (偽のDiscord・start.ggを使う)
+
+    python apps/interaction_bench.py                          # 300セット・約4,000回の操作
+    python apps/interaction_bench.py --sets 500 --clicks 6
+    python apps/interaction_bench.py --unsafe                 # セットごとの排他なしでも計測して比べる
+
+各セットで2人のプレイヤーとスタッフが，スコアのボタンとOKをほぼ同時に押す
+終了後に，メッセージの最終的な表示・送信したスコア報告・保存した状態が食い違っていないかを確かめる
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+# main.py は読み込み時に環境変数を検証するので，計測用の値を先に入れておく
+os.environ.setdefault("DISCORD_BOT_TOKEN", "bench")
+os.environ.setdefault("STARTGG_API_TOKEN", "bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("STATION_BOARD", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import discord  # noqa: E402
+
+import main  # noqa: E402
+from entrants import Entrant, Player  # noqa: E402
+from outbox import REPORT_OPEN  # noqa: E402
+from replay import percentile  # noqa: E402
+from store import StateStore  # noqa: E402
+
+BENCH_SLUG = "bench"
+BENCH_CHANNEL_ID = 1
+SET_ID_BASE = 70_000_000
+ENTRANT_ID_BASE = 20_000_000
+
+
+# セットごとの排他をしない (比較用)
+class NoLock:
+    contended = 0
+
+    @asynccontextmanager
+    async def hold(self, key):
+        yield
+
+
+# 投稿済みの対戦カード (最後に反映された表示を持つ)
+class FakeMessage:
+    def __init__(self, message_id: int, latency: float):
+        self.id = message_id
+        self.latency = latency
+        self.description: Optional[str] = None
+        self.edits = 0
+        self.embeds = []
+
+    async def edit(self, embed=None, view=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.edits += 1
+        if embed is not None:
+            self.description = embed.description
+            self.embeds = [embed]
+        return self
+
+
+class FakeResponse:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.done = False
+
+    async def defer(self, **kwargs):
+        if self.done:
+            raise discord.InteractionResponded(None)
+        await asyncio.sleep(self.latency)
+        self.done = True
+
+
+class FakeFollowup:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent: list[str] = []
+
+    async def send(self, content=None, ephemeral: bool = False, **kwargs):
+        await asyncio.sleep(self.latency)
+        self.sent.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, message: FakeMessage, latency: float):
+        self.message = message
+        self.response = FakeResponse(latency)
+        self.followup = FakeFollowup(latency)
+
+
+class BenchSet:
+    def __init__(self, set_id: int, p1_id: int, p2_id: int, message: FakeMessage):
+        self.set_id = set_id
+        self.p1_id = p1_id
+        self.p2_id = p2_id
+        self.message = message
+        self.accepted = 0  # 「スコアを受け付けました」と返した回数
+
+
+async def run(sets: int, clicks: int, spread: float, discord_latency: float, startgg_latency: float, unsafe: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    main.set_locks = NoLock() if unsafe else main.KeyedLock()
+    main.state_store = StateStore(os.path.join(tempfile.mkdtemp(prefix="bench-"), "state.sqlite3"))
+    main.state_store.open()
+    main.report_outbox.store = main.state_store
+    main.edit_queue.min_interval = 0.05
+
+    # start.ggへの送信 (届いた報告を記録する)
+    delivered: dict = {}
+
+    async def deliver(payload: dict, slug: Optional[str]):
+        await asyncio.sleep(startgg_latency)
+        delivered[payload["setId"]] = payload
+
+    async def reconcile(payload: dict) -> str:
+        return REPORT_OPEN
+
+    main.report_outbox.deliver = deliver
+    main.report_outbox.reconcile = reconcile
+    main.bot.add_view = lambda *args, **kwargs: None
+
+    main.tournaments.clear()
+    tour = main.add_tournament(BENCH_SLUG, BENCH_CHANNEL_ID, 1)
+    tour.entrants.entrants = {
+        ENTRANT_ID_BASE + i: Entrant(ENTRANT_ID_BASE + i, f"Player{i}", [Player(f"Player{i}", None)])
+        for i in range(sets * 2)
+    }
+    tour.entrants.loaded_at = time.monotonic()
+
+    bench: list[BenchSet] = []
+    for i in range(sets):
+        set_id = SET_ID_BASE + i
+        p1_id, p2_id = ENTRANT_ID_BASE + 2 * i, ENTRANT_ID_BASE + 2 * i + 1
+        card = main.build_card(f"Round {i}", i + 1, tour.entrants.entrants[p1_id], tour.entrants.entrants[p2_id])
+        view = main.ReportButtons(tournament=tour, set_id=set_id, p1_id=p1_id, p2_id=p2_id, card=card)
+        message = FakeMessage(set_id, discord_latency)
+        tour.matches.put(set_id, message.id, BENCH_CHANNEL_ID, view)
+        main.state_store.put(
+            set_id, tournament=BENCH_SLUG, message_id=message.id, channel_id=BENCH_CHANNEL_ID,
+            entrant1_id=p1_id, entrant2_id=p2_id, score1=0, score2=0, view_state=main.VIEW_ACTIVE,
+        )
+        bench.append(BenchSet(set_id, p1_id, p2_id, message))
+
+    latencies: dict[str, list[float]] = {"score": [], "submit": []}
+    errors: list[str] = []
+
+    # 押されたボタンは，その時点でメッセージに付いているView (古いViewのこともある) に届く
+    async def press(item: BenchSet, view, delay: float, action: str, player: int = 0, score: int = 0):
+        await asyncio.sleep(delay)
+        inter = FakeInteraction(item.message, discord_latency)
+        started = time.perf_counter()
+        try:
+            if action == "score":
+                await view.update_score(inter, player, score, None)
+            else:
+                await view.send(inter)
+        except Exception as e:
+            errors.append(f"{item.set_id}: {type(e).__name__}: {e}")
+            return
+        latencies[action].append(time.perf_counter() - started)
+        item.accepted += inter.followup.sent.count("スコアを受け付けました。")
+
+    presses = []
+    for item in bench:
+        view = tour.matches.get(item.set_id).view
+        # プレイヤー2人とスタッフがスコアを入力し，それぞれが後半のどこかでOKを押す
+        for _ in range(3):
+            for _ in range(clicks):
+                presses.append(press(item, view, rng.random() * spread, "score", rng.choice((1, 2)), rng.randint(0, main.MAX_SCORE)))
+            presses.append(press(item, view, spread * (0.5 + rng.random()), "submit"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*presses)
+    await main.edit_queue.drain()
+    while main.report_outbox.depth:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    # 食い違いの確認
+    violations: list[str] = []
+    for item in bench:
+        row = main.state_store.get(item.set_id) or {}
+        payload = delivered.get(item.set_id)
+        text = item.message.description or ""
+        if payload is None:
+            # 送信されなかったセットは，入力中のスコアが表示と一致していること
+            if item.accepted:
+                violations.append(f"{item.set_id}: 受け付けたのに送信されていない")
+            expected = f"({row.get('score1') or 0})\nvs\n"
+            if text and expected not in text:
+                violations.append(f"{item.set_id}: 入力中の表示 {text!r} と保存したスコアが違う")
+            continue
+        s1 = sum(1 for g in payload["gameData"] if g["winnerId"] == item.p1_id)
+        s2 = sum(1 for g in payload["gameData"] if g["winnerId"] == item.p2_id)
+        if item.accepted != 1:
+            violations.append(f"{item.set_id}: スコアの受付が {item.accepted}回")
+        if not text.startswith("✅") or f"({s1})\nvs\n" not in text or not text.endswith(f"({s2})"):
+            violations.append(f"{item.set_id}: 表示 {text!r} と送信したスコア {s1}-{s2} が違う")
+        if (row.get("score1"), row.get("score2")) != (s1, s2) or row.get("view_state") != main.VIEW_FINISHED:
+            violations.append(f"{item.set_id}: 保存した状態 {row.get('score1')}-{row.get('score2')} と送信したスコア {s1}-{s2} が違う")
+
+    await main.state_store.close()
+    total = len(latencies["score"]) + len(latencies["submit"])
+    return {
+        "mode": "unsafe" if unsafe else "per-set",
+        "sets": sets,
+        "interactions": total + len(errors),
+        "score_p50_ms": percentile(latencies["score"], 0.5) * 1000,
+        "score_p99_ms": percentile(latencies["score"], 0.99) * 1000,
+        "submit_p50_ms": percentile(latencies["submit"], 0.5) * 1000,
+        "submit_p99_ms": percentile(latencies["submit"], 0.99) * 1000,
+        "submitted": len(delivered),
+        "contended": main.set_locks.contended,
+        "errors": len(errors),
+        "violations": len(violations),
+        "wall_sec": elapsed,
+        "examples": (errors + violations)[:5],
+    }
+
+
+def print_table(results: list[dict]):
+    columns = [
+        ("mode", "{:>8}"), ("sets", "{:>5}"), ("interactions", "{:>12}"),
+        ("score_p50_ms", "{:>12.1f}"), ("score_p99_ms", "{:>12.1f}"),
+        ("submit_p50_ms", "{:>13.1f}"), ("submit_p99_ms", "{:>13.1f}"),
+        ("submitted", "{:>9}"), ("contended", "{:>9}"), ("errors", "{:>6}"), ("violations", "{:>10}"),
+        ("wall_sec", "{:>8.2f}"),
+    ]
+    print(" ".join(f"{name:>{len(fmt.format(0))}}" for name, fmt in columns))
+    for r in results:
+        print(" ".join(fmt.format(r[name]) for name, fmt in columns))
+    for r in results:
+        for example in r["examples"]:
+            print(f"  [{r['mode']}] {example}")
+
+
+async def main_async(args) -> list[dict]:
+    results = [await run(args.sets, args.clicks, args.spread, args.discord_latency, args.startgg_latency, False, args.seed)]
+    if args.unsafe:
+        results.append(await run(args.sets, args.clicks, args.spread, args.discord_latency, args.startgg_latency, True, args.seed))
+    await main.report_outbox.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="スコア入力のボタンが同時に押されたときの負荷試験")
+    parser.add_argument("--sets", type=int, default=300, help="同時に進行するセットの数")
+    parser.add_argument("--clicks", type=int, default=4, help="1人あたりのスコアのボタンを押す回数 (プレイヤー2人とスタッフ)")
+    parser.add_argument("--spread", type=float, default=0.2, help="ボタンを押す時刻のばらつき (秒)")
+    parser.add_argument("--discord-latency", type=float, default=0.02, help="Discordへの応答・編集の遅延 (秒)")
+    parser.add_argument("--startgg-latency", type=float, default=0.05, help="start.ggへのスコア報告の遅延 (秒)")
+    parser.add_argument("--unsafe", action="store_true", help="セットごとの排他なしでも計測して比べる")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results)
+    # 排他ありで食い違い・例外が出たら失敗とする
+    if results[0]["violations"] or results[0]["errors"]:
+        sys.exit(1)
@@ -0,0 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+# キーごとの排他 (同じキーの処理だけを順番に実行し，別のキーの処理は並行して動かす)
+# 待っている処理がなくなったキーのロックは残さない
+class KeyedLock:
+    def __init__(self):
+        self._locks: dict = {}  # {key: [asyncio.Lock, 実行中・待機中の数]}
+        self.contended = 0  # 先に実行中の処理を待った回数
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                self.contended += 1
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
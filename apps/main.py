@@ -1,11 +1,12 @@
 import os
 import asyncio
-import json
-import re
-import requests
 import functools
+import itertools
+import json
+import socket
+import time
 import logging
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 import discord
 from discord import Embed, app_commands
@@ -14,6 +15,25 @@ from discord.ext import tasks, commands
 from dotenv import load_dotenv
 load_dotenv()
 
+from startgg import GqlClient, GraphQLError, Priority, RequestScheduler, count_objects
+from entrants import Entrant, EntrantDirectory, Player, discord_id_pairs, stream_pages
+from store import StateStore, VIEW_ACTIVE, VIEW_FINISHED
+from roles import RoleSyncResult, bulk_edit_roles, sync_member_cache
+from edit_queue import MessageEditQueue
+from locks import KeyedLock
+from ingest import IngestBackend, PollingBackend, PushBackend, is_loopback
+from tournaments import Tournament, load_bindings
+from routing import RouteRule, Router, load_routes
+from outbox import REPORT_CONFLICT, REPORT_DONE, REPORT_OPEN, OutboxEntry, ReportOutbox
+from registry import MatchRecord, MatchRegistry
+from cadence import PollCadence
+from diff import ACTIVE_STATES, CALLED, COMPLETED, CORRECTED, RESET, SCORE_CHANGED, STATE_CALLED, STATE_COMPLETED, STATION_MOVED, SetDiffer, SetEvent, decode_events, encode_events
+from bus import LeaderElector, MessageBus, build_bus
+import metrics
+from metrics import MetricsServer, span
+from board import StationBoard
+from card import MatchCard, STREAM_MAIN, STREAM_SUB, stream_of
+
 logging.basicConfig(
     level=os.getenv("LOG_LEVEL", "INFO"),
     format="%(asctime)s %(levelname)s %(name)s: %(message)s"
@@ -24,41 +44,123 @@ DISCORD_BOT_TOKEN  = os.getenv("DISCORD_BOT_TOKEN")
 STARTGG_API_TOKEN  = os.getenv("STARTGG_API_TOKEN")
 DISCORD_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID", "0"))
 TOURNAMENT_SLUG    = os.getenv("TOURNAMENT_SLUG")
+TOURNAMENTS_FILE   = os.getenv("TOURNAMENTS_FILE")  # 複数の大会を扱う場合の設定ファイル (JSON)
+ROUTES_FILE        = os.getenv("ROUTES_FILE")  # TOURNAMENT_SLUG の大会の送信先の振り分けルール (JSON)
 MAX_SCORE          = int(os.getenv("MAX_SCORE", "3"))
 STREAM_NUMBER      = int(os.getenv("STREAM_NUMBER", "1"))
+# ワーカーの役割: all (1つのプロセスですべて行う) / poller (start.ggの取得・変更の検出) / discord (Discordの処理)
+# poller,discord のように並べると，1つのプロセスの中でもメッセージバスを通して受け渡す
+WORKER_ROLE        = os.getenv("WORKER_ROLE", "all")
+ROLES = {"poller", "discord"} if WORKER_ROLE == "all" else {r.strip() for r in WORKER_ROLE.split(",") if r.strip()}
+if not ROLES or ROLES - {"poller", "discord"}:
+    raise RuntimeError(f"Unknown WORKER_ROLE: {WORKER_ROLE}")
 
 REQUIRED = {
-    "DISCORD_BOT_TOKEN": DISCORD_BOT_TOKEN,
     "STARTGG_API_TOKEN": STARTGG_API_TOKEN,
-    "DISCORD_CHANNEL_ID": os.getenv("DISCORD_CHANNEL_ID"),
-    "TOURNAMENT_SLUG": TOURNAMENT_SLUG,
 }
+if "discord" in ROLES:
+    REQUIRED["DISCORD_BOT_TOKEN"] = DISCORD_BOT_TOKEN
 missing = [k for k, v in REQUIRED.items() if not v or str(v).strip() == ""]
 if missing:
     raise RuntimeError(f"Missing required env vars: {', '.join(missing)}")
+if bool(TOURNAMENT_SLUG) != bool(DISCORD_CHANNEL_ID):
+    raise RuntimeError("TOURNAMENT_SLUG and DISCORD_CHANNEL_ID must be set together")
 
 GQL_ENDPOINT        = "https://api.start.gg/gql/alpha"
-POLL_INTERVAL       = 2
-
-initial_scan_done = False
-station_map: dict[str, str] = {}
-active_views: dict[str, dict] = {}  # {set_id: {view, slots}}
-
-# GraphQL: 参加者の取得
-GET_PARTICIPANTS_QUERY = """
-query GetEntrants($slug: String!) {
-  tournament(slug: $slug) {
-    events {
-      entrants {
-        nodes {
-          name
-          participants {
-            gamerTag
-            user {
-              authorizations {
-                type
-                externalId
-              }
+# ポーリングの間隔 (秒)．セットの変化・対戦中のセットの数・レート制限の残りに応じて POLL_MIN_INTERVAL〜POLL_MAX_INTERVAL の間で変える
+POLL_INTERVAL       = float(os.getenv("POLL_INTERVAL", "2"))
+POLL_MIN_INTERVAL   = float(os.getenv("POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL   = float(os.getenv("POLL_MAX_INTERVAL", "30"))
+# この秒数だけ変化がなければ間隔を伸ばし始める
+POLL_IDLE_AFTER     = float(os.getenv("POLL_IDLE_AFTER", "120"))
+# 直近1分間の変化がこの件数以上なら最短の間隔にする
+POLL_BURST_CHANGES  = int(os.getenv("POLL_BURST_CHANGES", "30"))
+# start.ggのレート制限のうち，ポーリングに使ってよい割合 (残りは通知・ロール・スコア報告に回す)
+POLL_BUDGET_SHARE   = float(os.getenv("POLL_BUDGET_SHARE", "0.7"))
+FULL_RESCAN_INTERVAL = int(os.getenv("FULL_RESCAN_INTERVAL", "60"))
+POLL_SKEW           = int(os.getenv("POLL_SKEW", "5"))
+# 差分取得で対象にするセットの状態 (2: 対戦中, 3: 終了, 6: 呼び出し済み)
+POLL_SET_STATES     = [int(x) for x in os.getenv("POLL_SET_STATES", "2,3,6").split(",") if x.strip()]
+GQL_MAX_CONCURRENCY = int(os.getenv("GQL_MAX_CONCURRENCY", "8"))
+# 同時接続のうち，スコア報告・通知のために空けておく数
+GQL_RESERVED_SLOTS  = int(os.getenv("GQL_RESERVED_SLOTS", "1"))
+GQL_TIMEOUT         = float(os.getenv("GQL_TIMEOUT", "15"))
+GQL_RATE_LIMIT      = int(os.getenv("GQL_RATE_LIMIT", "80"))
+GQL_RATE_WINDOW     = float(os.getenv("GQL_RATE_WINDOW", "60"))
+GQL_MAX_RETRIES     = int(os.getenv("GQL_MAX_RETRIES", "3"))
+GQL_COMPLEXITY_LIMIT = int(os.getenv("GQL_COMPLEXITY_LIMIT", "1000"))
+POLL_WORKERS        = int(os.getenv("POLL_WORKERS", "4"))
+POLL_PER_PAGE       = int(os.getenv("POLL_PER_PAGE", "50"))
+POLL_MIN_PER_PAGE   = int(os.getenv("POLL_MIN_PER_PAGE", "5"))
+POLL_MAX_PER_PAGE   = int(os.getenv("POLL_MAX_PER_PAGE", "100"))
+ENTRANT_PER_PAGE    = int(os.getenv("ENTRANT_PER_PAGE", "50"))
+ENTRANT_REFRESH_INTERVAL = int(os.getenv("ENTRANT_REFRESH_INTERVAL", "600"))
+STATE_DB_PATH       = os.getenv("STATE_DB_PATH", "data/state.sqlite3")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "0.5"))
+ROLE_CONCURRENCY    = int(os.getenv("ROLE_CONCURRENCY", "5"))
+EDIT_MIN_INTERVAL   = float(os.getenv("EDIT_MIN_INTERVAL", "0.3"))
+ANNOUNCE_CONCURRENCY = int(os.getenv("ANNOUNCE_CONCURRENCY", "5"))
+# スコア報告の再送 (秒・回数)
+REPORT_RETRY_BASE   = float(os.getenv("REPORT_RETRY_BASE", "2"))
+REPORT_RETRY_MAX    = float(os.getenv("REPORT_RETRY_MAX", "300"))
+REPORT_MAX_ATTEMPTS = int(os.getenv("REPORT_MAX_ATTEMPTS", "10"))
+# 大会ごとに保持する受付中の対戦カードの上限と，触られなかったカードを外すまでの秒数
+MATCH_REGISTRY_SIZE = int(os.getenv("MATCH_REGISTRY_SIZE", "500"))
+MATCH_TTL           = float(os.getenv("MATCH_TTL", "21600"))
+# セット更新の取り込み方式: poll (ポーリング) / push (Webhook受信) / both
+INGEST_MODE         = os.getenv("INGEST_MODE", "poll")
+PUSH_HOST           = os.getenv("PUSH_HOST", "127.0.0.1")
+PUSH_PORT           = int(os.getenv("PUSH_PORT", "8080"))
+PUSH_PATH           = os.getenv("PUSH_PATH", "/startgg/sets")
+PUSH_SECRET         = os.getenv("PUSH_SECRET")
+# 外から届くアドレスで受信するときは，共有の秘密 (X-Webhook-Secret) を必須にする
+if INGEST_MODE in ("push", "both") and not PUSH_SECRET and not is_loopback(PUSH_HOST):
+    raise RuntimeError(f"PUSH_SECRET is required when PUSH_HOST is not a loopback address: {PUSH_HOST}")
+# /metrics の公開 (METRICS_PORT が空なら公開しない)
+METRICS_HOST        = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT        = int(os.getenv("METRICS_PORT") or "0")
+SPAN_LOG            = os.getenv("SPAN_LOG", "").lower() in ("1", "true", "yes")
+# メンバーのキャッシュ: participants (大会の参加者だけをIDで取得して保持する) / full (起動時にサーバーの全メンバーを読み込む)
+MEMBER_CACHE        = os.getenv("MEMBER_CACHE", "participants")
+if MEMBER_CACHE not in ("participants", "full"):
+    raise RuntimeError(f"Unknown MEMBER_CACHE: {MEMBER_CACHE}")
+# 対戦台の一覧 (大会の通知先チャンネルにピン留めし，BOARD_INTERVAL 秒に1回までにまとめて編集する)
+STATION_BOARD       = os.getenv("STATION_BOARD", "false").lower() in ("1", "true", "yes")
+BOARD_INTERVAL      = float(os.getenv("BOARD_INTERVAL", "10"))
+# ワーカー間のメッセージバス (WORKER_ROLE が all 以外のとき): memory (同じプロセス内) / redis://host:port (Redis互換のブローカー)
+BUS_URL             = os.getenv("BUS_URL", "memory")
+WORKER_ID           = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEADER_TTL          = float(os.getenv("LEADER_TTL", "15"))  # ポーリングの担当を引き継ぐまでの秒数
+BUS_SETS            = "sets"         # ポーリング → Discord: 検出したセットの変更
+BUS_TOURNAMENTS     = "tournaments"  # Discord → ポーリング: 登録中の大会の一覧
+
+poll_sem = asyncio.Semaphore(POLL_WORKERS)
+tournaments: dict[str, Tournament] = {}  # {slug: Tournament}
+# 受付中のカードがない行は MATCH_TTL 秒でメモリから外す (ファイルには残す)
+state_store = StateStore(STATE_DB_PATH, flush_interval=STATE_FLUSH_INTERVAL, evict_after=MATCH_TTL)
+metrics.registry.log_spans = SPAN_LOG
+edit_queue = MessageEditQueue(min_interval=EDIT_MIN_INTERVAL)  # 対戦カードの編集はすべてここを通す
+# セットごとの排他 (ボタンの操作・start.gg側の更新・対戦カードの送り直しを，同じセットについては1つずつ処理する)
+set_locks = KeyedLock()
+event_bus: Optional[MessageBus] = build_bus(BUS_URL) if WORKER_ROLE != "all" else None
+
+# GraphQL: 参加者の取得 (イベントごと)
+QUERY_EVENT_ENTRANTS = """
+query GetEventEntrants($eventId: ID!, $page: Int!, $perPage: Int!) {
+  event(id: $eventId) {
+    entrants(query: { page: $page, perPage: $perPage }) {
+      pageInfo {
+        totalPages
+      }
+      nodes {
+        id
+        name
+        participants {
+          gamerTag
+          user {
+            authorizations(types: [DISCORD]) {
+              type
+              externalId
             }
           }
         }
@@ -68,43 +170,68 @@ query GetEntrants($slug: String!) {
 }
 """
 
-# GraphQ: 対戦情報などの取得
-QUERY_SETS = """
-query GetSets($slug: String!, $page: Int!) {
+# GraphQL: 大会内のイベント一覧
+QUERY_EVENTS = """
+query GetEvents($slug: String!) {
   tournament(slug: $slug) {
     events {
-      sets(page: $page, perPage: 50, sortType: STANDARD) {
-        nodes {
-          id
-          fullRoundText
-          state
-          winnerId
-          station { number }
-          games {
-            winnerId
-          }
-          slots {
-            entrant {
-              id
-              name
-              participants {
-                gamerTag
-                user {
-                  authorizations {
-                    type
-                    externalId
-                  }
-                }
-              }
-            }
-          }
-        }
-      }
+      id
     }
   }
 }
 """
 
+# GraphQL: ポーリングとプッシュで共通のセットの項目
+# 毎回変化しうる項目だけを取り，名前やDiscord IDは大会ごとの EntrantDirectory から引く
+SET_FIELDS = """
+fragment SetFields on Set {
+  id
+  fullRoundText
+  state
+  winnerId
+  station { number }
+  event { id }
+  phaseGroup {
+    displayIdentifier
+    phase { id name }
+  }
+  games {
+    winnerId
+  }
+  slots {
+    entrant { id }
+  }
+}
+"""
+
+# GraphQ: 対戦情報などの取得 (イベントごと)
+QUERY_EVENT_SETS = """
+query GetEventSets($eventId: ID!, $page: Int!, $perPage: Int!, $filters: SetFilters) {
+  event(id: $eventId) {
+    sets(page: $page, perPage: $perPage, sortType: STANDARD, filters: $filters) {
+      pageInfo {
+        totalPages
+      }
+      nodes {
+        ...SetFields
+      }
+    }
+  }
+}
+""" + SET_FIELDS
+
+# GraphQL: セット1件の取得 (プッシュでIDだけ届いた場合)
+QUERY_SET = """
+query GetSet($setId: ID!) {
+  set(id: $setId) {
+    ...SetFields
+    event {
+      tournament { slug }
+    }
+  }
+}
+""" + SET_FIELDS
+
 # GraphQ: 対戦結果の報告
 MUT_REPORT_SET = """
 mutation Report(
@@ -123,61 +250,165 @@ mutation Report(
 }
 """
 
-# Intents
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-bot = commands.Bot(command_prefix=";", intents=intents)
-
-# GraphQLとの通信 - sync
-def gql_sync(query: str, variables: dict):
-    headers = {
-        "Authorization": f"Bearer {STARTGG_API_TOKEN}",
-        "Content-Type": "application/json",
+# Intents とメンバーのキャッシュの設定
+# participants では全メンバーの読み込み (チャンク) をせず，参加者だけを sync_participant_members で取得して保持する
+# メンバーのIntentはキャッシュした参加者のロールの変化を受け取るために残し，使っていないメッセージ本文のIntentは外す
+def client_options(mode: str) -> dict:
+    intents = discord.Intents.default()
+    intents.members = True
+    if mode == "full":
+        intents.message_content = True
+        return {"intents": intents}
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
     }
-    resp = requests.post(GQL_ENDPOINT, json={"query": query, "variables": variables}, headers=headers, timeout=15)
-    data = resp.json()
-    if "errors" in data:
-        raise RuntimeError(json.dumps(data["errors"], indent=2, ensure_ascii=False))
-    return data
-
-# GraphQLとの通信 - async
-async def gql_async(query: str, variables: dict, timeout_sec: int = 10):
-    loop = asyncio.get_running_loop()
-    fn = functools.partial(gql_sync, query, variables)
-    return await asyncio.wait_for(loop.run_in_executor(None, fn), timeout=timeout_sec)
+
+bot = commands.Bot(command_prefix=";", **client_options(MEMBER_CACHE))
+
+# GraphQLとの通信 (セッションを共有して接続を使い回す)
+# すべてのリクエストはスケジューラを通し，スコア報告 > 通知 > ポーリング > ロール同期 の順に処理する
+# (レート制限のトークンと同時接続の枠の両方を，この順に払い出す)
+gql_scheduler = RequestScheduler(
+    rate_limit=GQL_RATE_LIMIT,
+    window_sec=GQL_RATE_WINDOW,
+    max_concurrency=GQL_MAX_CONCURRENCY,
+    reserved=GQL_RESERVED_SLOTS,
+)
+gql_client = GqlClient(
+    GQL_ENDPOINT,
+    STARTGG_API_TOKEN,
+    max_concurrency=GQL_MAX_CONCURRENCY,
+    timeout_sec=GQL_TIMEOUT,
+    scheduler=gql_scheduler,
+    max_retries=GQL_MAX_RETRIES,
+)
+
+async def gql_async(query: str, variables: dict, timeout_sec: Optional[float] = None, priority: Priority = Priority.POLL, fair_key=None):
+    return await gql_client.execute(query, variables, timeout_sec=timeout_sec, priority=priority, fair_key=fair_key)
+
+# 参加者一覧の取得 (イベントごとにページングして並列に取得し，届いたページから順に返す)
+async def load_entrants(tour: Tournament, priority: Priority = Priority.POLL) -> AsyncIterator[list[dict]]:
+    async def fetch_page(event_id: int, page: int) -> dict:
+        data = await gql_async(QUERY_EVENT_ENTRANTS, {
+            "eventId": event_id,
+            "page": page,
+            "perPage": ENTRANT_PER_PAGE,
+        }, priority=priority, fair_key=tour.slug)
+        return (data["data"].get("event") or {}).get("entrants") or {}
+
+    def load_event(event_id: int):
+        async def job(emit):
+            # 1ページ目でページ数がわかるので，残りのページはまとめて並列に取得する
+            first = await fetch_page(event_id, 1)
+            emit(list(first.get("nodes") or []))
+            total_pages = (first.get("pageInfo") or {}).get("totalPages") or 1
+
+            async def rest(page: int):
+                emit(list((await fetch_page(event_id, page)).get("nodes") or []))
+            await asyncio.gather(*(rest(p) for p in range(2, total_pages + 1)))
+        return job
+
+    ids = tour.event_ids or await fetch_event_ids(tour)
+    async for nodes in stream_pages([load_event(i) for i in ids]):
+        yield nodes
+
+# 大会の登録 (routes を渡すと振り分けルールを置き換える)
+def add_tournament(slug: str, channel_id: int, guild_id: Optional[int] = None, routes: Optional[list[dict]] = None) -> Tournament:
+    tour = tournaments.get(slug)
+    if tour is None:
+        tour = Tournament(slug, channel_id, guild_id)
+        tour.entrants = EntrantDirectory(
+            functools.partial(load_entrants, tour), ttl_sec=ENTRANT_REFRESH_INTERVAL, background={"priority": Priority.ROLES},
+        )
+        tour.matches = MatchRegistry(MATCH_REGISTRY_SIZE, MATCH_TTL, on_release=release_match)
+        tour.cadence = PollCadence(
+            POLL_INTERVAL,
+            POLL_MIN_INTERVAL,
+            POLL_MAX_INTERVAL,
+            idle_after=POLL_IDLE_AFTER,
+            burst_changes=POLL_BURST_CHANGES,
+        )
+        tournaments[slug] = tour
+        tour.board = build_board(tour)
+    else:
+        moved = channel_id != tour.channel_id
+        tour.channel_id = channel_id  # build_board は新しいチャンネルを見る
+        tour.guild_id = guild_id or tour.guild_id
+        if moved and tour.board is not None:
+            # 通知先が変わったら，前のチャンネルの一覧を消して新しいチャンネルに出し直す
+            old_board = tour.board
+            old_board.stop()
+            cleanup = asyncio.get_running_loop().create_task(old_board.remove())
+            board_cleanups.add(cleanup)
+            cleanup.add_done_callback(board_cleanups.discard)
+            state_store.set_meta(f"board:{slug}", "")
+            tour.board = build_board(tour)
+    if routes is not None:
+        tour.router = Router([RouteRule.from_dict(r) for r in routes])
+    return tour
+
+# 通知先が変わった大会の，前のチャンネルの一覧の片付け (終わるまで参照を持っておく)
+board_cleanups: set[asyncio.Task] = set()
+
+# 対戦台の一覧 (Discordを扱うワーカーだけが持つ)
+# メッセージIDは保存しておき，再起動後も同じメッセージを編集する
+# 一覧は作成時のチャンネルに出す (通知先が変わったら作り直す)
+def build_board(tour: Tournament) -> Optional[StationBoard]:
+    if not STATION_BOARD or "discord" not in ROLES:
+        return None
+    channel_id = tour.channel_id
+
+    async def get_channel():
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            try:
+                channel = await bot.fetch_channel(channel_id)
+            except discord.HTTPException as e:
+                logger.warning(f"[WARNING] チャンネルを取得できませんでした: channel_id = {channel_id} ({e})")
+        return channel
+
+    def entrant_name(entrant_id) -> Optional[str]:
+        entrant = tour.entrants.entrants.get(entrant_id)
+        return entrant.name if entrant else None
+
+    def save_messages(message_ids: list[int]):
+        state_store.set_meta(f"board:{tour.slug}", ",".join(str(i) for i in message_ids))
+
+    saved = state_store.get_meta(f"board:{tour.slug}") or ""
+    return StationBoard(
+        f"📋 対戦台の一覧 ({tour.slug})",
+        STREAM_NUMBER,
+        entrant_name,
+        get_channel,
+        message_ids=[int(i) for i in saved.split(",") if i],
+        on_messages=save_messages,
+        interval=BOARD_INTERVAL,
+    )
+
+# 一覧から外した対戦カードのViewを止める (ボタンの受付はBot側の登録から外れる)
+def release_match(record: MatchRecord):
+    record.view.stop()
+
+# 対戦カードの送信先 (振り分けルールに一致しなければ大会の既定のチャンネル)
+def route_channel(tour: Tournament, set_node: dict, station) -> int:
+    return tour.router.route(set_node, station, stream_of(station, STREAM_NUMBER)) or tour.channel_id
 
 # メンション
-def mention(part: dict) -> str:
-    user = part.get("user")
-    if not user:
-        return part.get("gamerTag", "Unknown")
-
-    for auth in user.get("authorizations", []):
-        if auth.get("type") == "DISCORD":
-            ext_id = auth.get("externalId")
-            if ext_id and ext_id.isdigit():
-                return f"<@!{ext_id}>"
-
-    return part.get("gamerTag", "Unknown")
-
-# スコアを更新
-def render_with_scores(text: str, s1: Optional[int], s2: Optional[int]) -> str:
-    lines = text.splitlines()
-    output = []
-    p1_done = p2_done = False
-
-    for line in lines:
-        if "(" in line:
-            if not p1_done:
-                line = re.sub(r"\(\d+\)", f"({s1 or 0})", line, count=1)
-                p1_done = True
-            elif not p2_done:
-                line = re.sub(r"\(\d+\)", f"({s2 or 0})", line, count=1)
-                p2_done = True
-        output.append(line)
-
-    return "\n".join(output)
+def mention(player: Player) -> str:
+    if player.discord_id:
+        return f"<@!{player.discord_id}>"
+    return player.gamer_tag
+
+# 対戦カードの内容を組み立てる (個人戦はメンション，チーム戦はチーム名を表示)
+def build_card(round_text: Optional[str], station, entrant1: Entrant, entrant2: Entrant) -> MatchCard:
+    if len(entrant1.players) == 1 and len(entrant2.players) == 1:
+        names = (mention(entrant1.players[0]), mention(entrant2.players[0]))
+    else:
+        names = (entrant1.name, entrant2.name)
+    tags = (entrant1.players[0].gamer_tag, entrant2.players[0].gamer_tag)
+    return MatchCard(round_text, station, stream_of(station, STREAM_NUMBER), names, tags)
 
 # ロール付与コマンドのフォーマット統一用
 def format_result_message(action: str, preposition: str, members: list[str], role: discord.Role) -> str:
@@ -187,109 +418,120 @@ def format_result_message(action: str, preposition: str, members: list[str], rol
     return f"✅ 以下の {len(members)}名 {preposition}ロール `{role.name}` を{action}しました:\n\n" + \
            "\n".join(f"- {m}" for m in members)
 
-# start.gg側から更新されたとき，Discord側も更新する
-async def update_finished_match_ui(set_node: dict):
-    set_id = set_node["id"]
-    view_info = active_views.get(set_id)
-    if not view_info:
-        return
+# メッセージはIDだけ持っておき，編集・削除には PartialMessage を使う (取得のリクエストは不要)
+async def resolve_message(record: MatchRecord) -> Optional[discord.PartialMessage]:
+    channel = bot.get_channel(record.channel_id)
+    if channel is None:
+        try:
+            channel = await bot.fetch_channel(record.channel_id)
+        except discord.HTTPException as e:
+            logger.warning(f"[WARNING] チャンネルを取得できませんでした: channel_id = {record.channel_id} ({e})")
+            return None
+    return channel.get_partial_message(record.message_id)
+
+# 一覧にない (追い出された・再起動前の) 対戦カードを保存済みの状態から作り直す
+def rehydrate_match(tour: Tournament, set_id) -> Optional[MatchRecord]:
+    row = state_store.get(set_id)
+    if not row or row["view_state"] != VIEW_ACTIVE or not row["message_id"]:
+        return None
+    view = ReportButtons(tournament=tour, set_id=set_id, p1_id=row["entrant1_id"], p2_id=row["entrant2_id"])
+    view.restore_scores(row["score1"], row["score2"])
+    bot.add_view(view, message_id=row["message_id"])
+    return tour.matches.put(set_id, row["message_id"], row["channel_id"], view)
+
+def lookup_match(tour: Tournament, set_id) -> Optional[MatchRecord]:
+    return tour.matches.get(set_id) or rehydrate_match(tour, set_id)
 
-    message = view_info.get("message")
-    view = view_info.get("view")
-    slots = view_info.get("slots")
+# start.gg側から更新されたとき，Discord側も更新する
+async def update_finished_match_ui(tour: Tournament, set_node: dict):
+    async with set_locks.hold(set_node["id"]):
+        await apply_finished_match(tour, set_node)
 
-    if not message or not view or not slots or len(slots) < 2:
+async def apply_finished_match(tour: Tournament, set_node: dict):
+    set_id = set_node["id"]
+    record = lookup_match(tour, set_id)
+    if not record:
         return
 
-    try:
-        entrant1 = slots[0]["entrant"]
-        entrant2 = slots[1]["entrant"]
-        entrant1_id = entrant1["id"]
-        entrant2_id = entrant2["id"]
-        name1 = entrant1["participants"][0]["gamerTag"]
-        name2 = entrant2["participants"][0]["gamerTag"]
-    except (KeyError, IndexError):
+    view = record.view
+    view.finished = True
+    card = await ensure_card(tour, view)
+    message = await resolve_message(record)
+    if not card or not message:
         return
 
     games = set_node.get("games")
     winner_id = set_node.get("winnerId")
-
-    embed = message.embeds[0].copy()
-    round_text = f"🏷️ {set_node.get('fullRoundText', '不明なラウンド')}"
-    station_val = set_node.get("station", {}).get("number", "?")
-    try:
-        station_i = int(station_val)
-    except (TypeError, ValueError):
-        station_i = 9999
-    if station_i == 1:
-        station_text = "🖥️ **Station 1** 🎥**配信台**"
-    elif station_i <= STREAM_NUMBER:
-        station_text = f"🖥️ **Station {station_i}** 🎥**サブ配信台**"
-    else:
-        station_text = f"🖥️ **Station {station_i}**"
+    station = (set_node.get("station") or {}).get("number")
+    if station is not None and station != card.station:
+        card.move(station, stream_of(station, STREAM_NUMBER))
 
     # スコアが取得できないので，勝敗だけ更新
     if not games:
-        if winner_id == entrant1_id:
-            winner, loser = name1, name2
-        elif winner_id == entrant2_id:
-            winner, loser = name2, name1
+        if winner_id == view.p1_id:
+            card.finish(winner=0)
+        elif winner_id == view.p2_id:
+            card.finish(winner=1)
         else:
             return
-
-        new_desc = (
-            "✅ **この試合は終了しました\n（スタッフにより処理されました）**\n\n"
-            f"{round_text}\n\n"
-            f"{station_text}\n\n"
-            f"{winner} (**WIN**)\nvs\n{loser} (**LOSE**)"
-        )
-        embed.description = new_desc
     else:
-        score1 = sum(1 for g in games if g.get("winnerId") == entrant1_id)
-        score2 = sum(1 for g in games if g.get("winnerId") == entrant2_id)
-
-        embed.description = render_with_scores(embed.description, score1, score2)
-        embed.description = "✅ **この試合は終了しました**\n\n" + embed.description
+        score1 = sum(1 for g in games if g.get("winnerId") == view.p1_id)
+        score2 = sum(1 for g in games if g.get("winnerId") == view.p2_id)
+        card.finish(score1, score2)
+    embed = card.embed()
 
     for item in view.children:
         item.disabled = True
-    await message.edit(embed=embed, view=view)
+    edit_queue.submit(message, embed=embed, view=view)
+    state_store.put(set_id, view_state=VIEW_FINISHED)
 
     # 不要なオブジェクトを開放
-    active_views.pop(set_id, None)
-
-# Discord IDの取得
-async def fetch_discord_ids_from_startgg() -> list[tuple[int, str]]:
-    data = await gql_async(GET_PARTICIPANTS_QUERY, { "slug": TOURNAMENT_SLUG })
-    all_data = []
-
-    for event in data["data"]["tournament"]["events"]:
-        for entrant in event.get("entrants", {}).get("nodes", []):
-            for participant in entrant.get("participants", []):
-                tag = participant.get("gamerTag", "Unknown")
-                user = participant.get("user")
-                if not user:
-                    continue
-                for auth in user.get("authorizations", []):
-                    if auth.get("type") == "DISCORD":
-                        ext_id = auth.get("externalId")
-                        if ext_id and ext_id.isdigit():
-                            all_data.append((int(ext_id), tag))
-
-    return all_data
+    tour.matches.pop(set_id)
+
+# Discord IDの取得 (大会・イベントのページが届くたびに，そのページの分を返す)
+# 取得中の一覧は同時に実行されたコマンドと共有し，ENTRANT_REFRESH_INTERVAL の間は取得済みの一覧を使う
+async def fetch_discord_ids_from_startgg(tours: list[Tournament]) -> AsyncIterator[list[tuple[int, str]]]:
+    def follow(tour: Tournament):
+        async def job(emit):
+            async for page in tour.entrants.stream(priority=Priority.ROLES):
+                emit(discord_id_pairs(page))
+        return job
+
+    async for pairs in stream_pages([follow(t) for t in tours]):
+        if pairs:
+            yield pairs
 
 # フォールバック
+# 一覧から外れた対戦カードのボタンが押されたときは，保存済みの状態からViewを作り直して処理する
+def rehydrate_from_message(message_id: int) -> Optional[MatchRecord]:
+    found = state_store.find_by_message(message_id)
+    if not found:
+        return None
+    set_id, row = found
+    tour = tournaments.get(row["tournament"])
+    return lookup_match(tour, set_id) if tour else None
+
 class FallbackScoreBtn(discord.ui.Button):
     def __init__(self, player: int, score: int, row: int):
         super().__init__(label=str(score), style=discord.ButtonStyle.secondary, custom_id=f"s{player}_{score}", row=row)
+        self.player = player
+        self.score = score
     async def callback(self, inter: discord.Interaction):
-        await inter.response.send_message("このボタンは再起動により無効になりました。最新の投稿をご利用ください。", ephemeral=True)
+        record = rehydrate_from_message(inter.message.id)
+        if record is None:
+            await inter.response.send_message("このボタンは再起動により無効になりました。最新の投稿をご利用ください。", ephemeral=True)
+            return
+        await record.view.update_score(inter, self.player, self.score, self)
 
 class FallbackOkBtn(discord.ui.Button):
     def __init__(self, row: int):
         super().__init__(label="OK", style=discord.ButtonStyle.success, custom_id="ok", row=row)
     async def callback(self, inter: discord.Interaction):
-        await inter.response.send_message("このボタンは再起動により無効になりました。最新の投稿をご利用ください。", ephemeral=True)
+        record = rehydrate_from_message(inter.message.id)
+        if record is None:
+            await inter.response.send_message("このボタンは再起動により無効になりました。最新の投稿をご利用ください。", ephemeral=True)
+            return
+        await record.view.send(inter)
 
 class FallbackReportView(discord.ui.View):
     def __init__(self):
@@ -300,15 +542,100 @@ class FallbackReportView(discord.ui.View):
             self.add_item(FallbackScoreBtn(2, s, row=1))
         self.add_item(FallbackOkBtn(row=2))
 
+# スコア報告の送信 (送信待ちから呼ばれる)
+async def deliver_report(payload: dict, slug: Optional[str]):
+    await gql_async(MUT_REPORT_SET, payload, priority=Priority.REPORT, fair_key=slug)
+
+# 再送の前に，start.gg上でセットがすでに終了していないか確認する
+async def reconcile_report(payload: dict) -> str:
+    node = await fetch_set(payload["setId"], priority=Priority.REPORT)
+    if not node or node.get("state") != STATE_COMPLETED:
+        return REPORT_OPEN
+    return REPORT_DONE if str(node.get("winnerId")) == str(payload["winnerId"]) else REPORT_CONFLICT
+
+# 送らずに取り下げたスコア報告 (スタッフが別の結果で処理した / 送信をあきらめた)
+# 対戦カードは受付終了のまま送信したスコアを表示しているので，start.gg上の結果で表示し直すか，受付を再開する
+# スタッフが気付けるように，大会の通知先にも知らせる
+async def report_dropped(entry: OutboxEntry, reason: str):
+    tour = tournaments.get(entry.tournament)
+    if tour is None:
+        return
+    try:
+        node = await fetch_set(entry.set_id, priority=Priority.REPORT)
+    except Exception as e:
+        logger.warning(f"[WARNING] 取り下げたスコア報告のセットを取得できませんでした: set_id = {entry.set_id} ({e})")
+        node = None
+    completed = bool(node) and node.get("state") == STATE_COMPLETED
+
+    async with set_locks.hold(entry.set_id):
+        row = state_store.get(entry.set_id)
+        if not row or not row["message_id"]:
+            return
+        state_store.put(entry.set_id, view_state=VIEW_ACTIVE)
+        record = lookup_match(tour, entry.set_id)
+        if record is None:
+            return
+        message = await resolve_message(record)
+        if completed:
+            await apply_finished_match(tour, node)
+        else:
+            view = record.view
+            view.reopen()
+            card = await ensure_card(tour, view)
+            if card is not None and message is not None:
+                card.reopen()
+                card.set_scores(view.s1, view.s2)
+                edit_queue.submit(message, embed=card.embed(), view=view)
+
+    link = message.jump_url if message is not None else f"set_id = {entry.set_id}"
+    if reason == REPORT_CONFLICT:
+        text = f"⚠️ {link} のスコア報告は，start.gg上で別の結果が登録されていたため反映されませんでした。対戦カードをstart.ggの結果で更新しました。"
+    elif completed:
+        text = f"⚠️ {link} のスコア報告をstart.ggに送信できませんでした。対戦カードをstart.gg上の結果で更新しました。結果が正しいか確認してください。"
+    else:
+        text = f"⚠️ {link} のスコア報告をstart.ggに送信できませんでした。スコアの受付を再開したので，もう一度送信するか，スタッフがstart.gg上で結果を入力してください。"
+    try:
+        channel = bot.get_channel(tour.channel_id) or await bot.fetch_channel(tour.channel_id)
+        await channel.send(text)
+    except discord.HTTPException as e:
+        logger.warning(f"[WARNING] スコア報告の取り下げを通知できませんでした: set_id = {entry.set_id} ({e})")
+
+report_outbox = ReportOutbox(
+    state_store,
+    deliver_report,
+    reconcile_report,
+    base_delay=REPORT_RETRY_BASE,
+    max_delay=REPORT_RETRY_MAX,
+    max_attempts=REPORT_MAX_ATTEMPTS,
+    on_dropped=report_dropped,
+)
+
+# 対戦カードの内容 (再起動後は参加者情報と保存済みの状態から作り直す)
+async def ensure_card(tour: Tournament, view: "ReportButtons") -> Optional[MatchCard]:
+    if view.card is None:
+        row = state_store.get(view.set_id) or {}
+        try:
+            entrant1 = await tour.entrants.lookup(view.p1_id, priority=Priority.ANNOUNCE)
+            entrant2 = await tour.entrants.lookup(view.p2_id, priority=Priority.ANNOUNCE)
+            view.card = build_card(row.get("round_text"), row.get("station"), entrant1, entrant2)
+        except Exception as e:
+            logger.warning(f"[WARNING] 対戦カードを復元できませんでした: set_id = {view.set_id} ({e})")
+            return None
+        view.card.set_scores(view.s1, view.s2)
+    return view.card
+
 # Discord UI
 class ReportButtons(discord.ui.View):
-    def __init__(self, set_id: str, p1_id: int, p2_id: int):
+    def __init__(self, tournament: Tournament, set_id: str, p1_id: int, p2_id: int, card: Optional[MatchCard] = None):
         super().__init__(timeout=None)
+        self.tournament = tournament
         self.set_id = set_id
         self.p1_id = p1_id
         self.p2_id = p2_id
         self.s1: Optional[int] = 0
         self.s2: Optional[int] = 0
+        self.card = card
+        self.finished = False  # スコアを送信した / start.gg側で終了した
 
         # プレイヤー1(上段)
         for s in range(MAX_SCORE + 1):
@@ -321,13 +648,14 @@ class ReportButtons(discord.ui.View):
         # OK
         self.add_item(OkBtn(row=2))
 
-    # スコア反映
-    async def update_score(self, inter: discord.Interaction, player: int, score: int, pressed_button: discord.ui.Button):
-        if player == 1:
-            self.s1 = score
-        else:
-            self.s2 = score
+    # 受付終了にしたカードの受付を再開する (送信したスコア報告が取り下げられたとき)
+    def reopen(self):
+        self.finished = False
+        for item in self.children:
+            item.disabled = False
 
+    # 選択中のスコアを強調
+    def highlight(self, player: int, score: int):
         for item in self.children:
             if isinstance(item, ScoreBtn) and item.player == player:
                 item.style = (
@@ -335,20 +663,72 @@ class ReportButtons(discord.ui.View):
                     else discord.ButtonStyle.secondary
                 )
 
+    # 再起動前に入力されていたスコアを復元
+    def restore_scores(self, s1: int, s2: int):
+        self.s1 = s1
+        self.s2 = s2
+        self.highlight(1, s1)
+        self.highlight(2, s2)
+
+    # 操作されたのが古いView (対戦台の移動・再起動で作り直す前のもの) なら，現在のViewで処理する
+    def current(self) -> "ReportButtons":
+        record = self.tournament.matches.get(self.set_id)  # 最近使われたカードとして残す
+        return record.view if record is not None else self
+
+    # 同時に押されたボタンは，セットごとに押された順に1つずつ処理する
+    # (別のセットの操作は待たない．応答の期限に間に合うよう，先に受け付けてから順番を待つ)
+    async def update_score(self, inter: discord.Interaction, player: int, score: int, pressed_button: discord.ui.Button):
         await inter.response.defer()
-        embed = inter.message.embeds[0].copy()
-        embed.description = render_with_scores(embed.description, self.s1 or 0, self.s2 or 0)
-        await inter.message.edit(embed=embed, view=self)
+        with span("interaction", action="score", set_id=self.set_id) as s:
+            async with set_locks.hold(self.set_id):
+                await self.current().apply_score(inter, player, score)
+        metrics.interaction_latency.observe(s.elapsed, action="score")
+
+    # スコア反映
+    async def apply_score(self, inter: discord.Interaction, player: int, score: int):
+        if self.finished:
+            await self.reply(inter, "この試合はすでに終了しています。")
+            return
+        if player == 1:
+            self.s1 = score
+        else:
+            self.s2 = score
+
+        self.highlight(player, score)
+        state_store.put(self.set_id, score1=self.s1 or 0, score2=self.s2 or 0)
+
+        card = await ensure_card(self.tournament, self)
+        if card is None:
+            edit_queue.submit(inter.message, view=self)
+            return
+        card.set_scores(self.s1, self.s2)
+        edit_queue.submit(inter.message, embed=card.embed(), view=self)
 
-    # スコア送信
     async def send(self, inter: discord.Interaction):
+        await inter.response.defer()
+        with span("interaction", action="submit", set_id=self.set_id) as s:
+            async with set_locks.hold(self.set_id):
+                await self.current().submit(inter)
+        metrics.interaction_latency.observe(s.elapsed, action="submit")
+
+    @staticmethod
+    async def reply(inter: discord.Interaction, text: str):
+        try:
+            await inter.followup.send(text, ephemeral=True)
+        except discord.HTTPException:
+            pass
+
+    # スコア送信
+    async def submit(self, inter: discord.Interaction):
+        if self.finished:
+            await self.reply(inter, "この試合はすでに終了しています。")
+            return
         if self.s1 == self.s2:
-            await inter.response.send_message("スコアが同点です。", ephemeral=True)
+            await self.reply(inter, "スコアが同点です。")
             return
 
-        slots = active_views[self.set_id]["slots"]
-        entrant1_id = slots[0]["entrant"]["id"]
-        entrant2_id = slots[1]["entrant"]["id"]
+        entrant1_id = self.p1_id
+        entrant2_id = self.p2_id
 
         score_map = {
             self.p1_id: self.s1,
@@ -363,7 +743,7 @@ class ReportButtons(discord.ui.View):
         elif score2 > score1:
             winner_id = entrant2_id
         else:
-            await inter.response.send_message("スコアが未入力、または引き分けです。", ephemeral=True)
+            await self.reply(inter, "スコアが未入力、または引き分けです。")
             return
 
         # gameDataを構築
@@ -392,26 +772,32 @@ class ReportButtons(discord.ui.View):
             "gameData": gameData
         }
 
+        # 送信待ちに書き込んだ時点で受け付ける (start.ggへの送信は後で行う)
         try:
-            await gql_async(MUT_REPORT_SET, payload)
+            await report_outbox.submit(self.set_id, self.tournament.slug, payload)
         except Exception as e:
-            await inter.response.send_message(f"すでにスタッフによって処理されています。", ephemeral=True)  # "start.ggへの送信に失敗しました: {e}""
+            logger.error(f"[ERROR] スコア報告を保存できませんでした: set_id = {self.set_id} ({e})")
+            await self.reply(inter, "スコアを受け付けられませんでした。もう一度お試しください。")
             return
 
         # 受付終了
+        self.finished = True
         for item in self.children:
             item.disabled = True
-        embed = inter.message.embeds[0].copy()
-        embed.description = "✅ **この試合は終了しました**\n\n" + embed.description
-        await inter.message.edit(embed=embed, view=self)
+        card = await ensure_card(self.tournament, self)
+        if card is not None:
+            card.finish(self.s1, self.s2)
+            embed = card.embed()
+        else:
+            embed = inter.message.embeds[0].copy()
+            embed.description = "✅ **この試合は終了しました**\n\n" + embed.description
+        edit_queue.submit(inter.message, embed=embed, view=self)
+        state_store.put(self.set_id, view_state=VIEW_FINISHED)
 
-        try:
-            await inter.response.send_message("スコアを送信しました。", ephemeral=True)
-        except discord.NotFound:
-            pass
+        await self.reply(inter, "スコアを受け付けました。")
 
         # 不要なオブジェクトを開放
-        active_views.pop(self.set_id, None)
+        self.tournament.matches.pop(self.set_id)
 
 # スコア入力ボタン
 class ScoreBtn(discord.ui.Button):
@@ -438,8 +824,12 @@ class OkBtn(discord.ui.Button):
         view: ReportButtons = self.view
         await view.send(inter)
 
-# 通知処理
-async def post_announce(set_node: dict, station: str):
+# 通知処理 (入力中のスコアの引き継ぎとボタンの操作が重ならないように，セットごとに1つずつ行う)
+async def post_announce(tour: Tournament, set_node: dict, station: str):
+    async with set_locks.hold(set_node.get("id")):
+        return await announce_match(tour, set_node, station)
+
+async def announce_match(tour: Tournament, set_node: dict, station: str):
     set_id = set_node.get("id")
     slots = set_node.get("slots", [])
 
@@ -447,198 +837,926 @@ async def post_announce(set_node: dict, station: str):
         logger.warning(f"[WARNING] 対戦者が揃っていないためスキップしました: set_id = {set_id}")
         return
 
-    channel = bot.get_channel(DISCORD_CHANNEL_ID)
+    channel_id = route_channel(tour, set_node, station)
+    channel = bot.get_channel(channel_id)
     if not channel:
-        logger.error("[ERROR] チャンネルが取得できません。")
+        logger.error(f"[ERROR] チャンネルが取得できません: {tour.slug} (channel_id = {channel_id})")
         return
 
     try:
-        p1_part = slots[0]["entrant"]["participants"][0]
-        p2_part = slots[1]["entrant"]["participants"][0]
-    except (KeyError, IndexError, TypeError) as e:
+        entrant1 = await tour.entrants.lookup(slots[0]["entrant"]["id"], priority=Priority.ANNOUNCE)
+        entrant2 = await tour.entrants.lookup(slots[1]["entrant"]["id"], priority=Priority.ANNOUNCE)
+        card = build_card(set_node.get("fullRoundText"), station, entrant1, entrant2)
+    except (KeyError, IndexError, AttributeError) as e:
         logger.warning(f"[WARNING] スロット情報が不完全です: {e}")
         return
+    except Exception as e:
+        logger.error(f"[ERROR] 参加者情報の取得に失敗しました: {e}")
+        return
 
-    mention1 = mention(p1_part)
-    mention2 = mention(p2_part)
-    mention_line = f"📢 {mention1} {mention2}"
-
-    round_text = f"🏷️ {set_node.get('fullRoundText', '不明なラウンド')}"
-    try:
-        station_i = int(station)
-    except (TypeError, ValueError):
-        station_i = 9999
-    if station_i == 1:
-        station_text = "🖥️ **Station 1** 🎥**配信台**"
-    elif station_i <= STREAM_NUMBER:
-        station_text = f"🖥️ **Station {station_i}** 🎥**サブ配信台**"
-    else:
-        station_text = f"🖥️ **Station {station_i}**"
-    station_text = "🖥️ **Station 1** 🎥**配信台**" if str(station) == "1" else f"🖥️ **Station {station}** 🎥**サブ配信台**" if int(station) <= STREAM_NUMBER else f"🖥️ **Station {station}**"
-    team1 = slots[0]["entrant"]["name"]
-    team2 = slots[1]["entrant"]["name"]
-    content = f"{round_text}\n\n{station_text}\n\n{mention1} (0)\nvs\n{mention2} (0)" if len(slots[0]["entrant"]["participants"]) == 1 and len(slots[1]["entrant"]["participants"]) == 1 else f"{round_text}\n\n{station_text}\n\n{team1} (0)\nvs\n{team2} (0)"
+    mention_line = f"📢 {mention(entrant1.players[0])} {mention(entrant2.players[0])}"
 
     # Viewの構築
     view = ReportButtons(
+        tournament=tour,
         set_id=set_id,
         p1_id=slots[0]["entrant"]["id"],
-        p2_id=slots[1]["entrant"]["id"]
+        p2_id=slots[1]["entrant"]["id"],
+        card=card,
     )
 
-    # 既存のメッセージがあれば編集，なければ新規投稿
-    old_view = active_views.get(set_id)
-    if old_view and old_view.get("message"):
-        message = old_view["message"]
-
-        # Embedを編集
-        embed = message.embeds[0].copy()
-        lines = embed.description.splitlines()
-        lines[2] = station_text
-        embed.description = "\n".join(lines)
+    # 既存のメッセージがあれば編集 (入力済みのスコアは引き継ぐ)，なければ新規投稿
+    old = lookup_match(tour, set_id)
+    message = None
+    if old:
+        previous = old.view
+        view.restore_scores(previous.s1 or 0, previous.s2 or 0)
+        card.set_scores(previous.s1, previous.s2)
+        message = await resolve_message(old)
+
+    # 対戦台の移動で送信先のチャンネルが変わった場合は，元のメッセージを消して投稿し直す
+    if message and message.channel.id != channel.id:
+        try:
+            await message.delete()
+        except discord.HTTPException as e:
+            logger.warning(f"[WARNING] 移動前のメッセージを削除できませんでした: message_id = {message.id} ({e})")
+        message = None
 
-        await message.edit(embed=embed, view=view)
-        bot.add_view(view)
-        active_views[set_id]["view"] = view
+    if message:
+        edit_queue.submit(message, embed=card.embed(), view=view)
     else:
         message = await channel.send(
             content=mention_line,
-            embed=discord.Embed(description=content, color=discord.Color.blue()),
+            embed=card.embed(),
             view=view,
             allowed_mentions=discord.AllowedMentions(everyone=True, users=True, roles=True)
         )
-        bot.add_view(view)
-        active_views[set_id] = {
-            "view": view,
-            "slots": slots,
-            "message": message
-        }
+    bot.add_view(view, message_id=message.id)
+    tour.matches.put(set_id, message.id, message.channel.id, view)
+
+    state_store.put(
+        set_id,
+        tournament=tour.slug,
+        message_id=message.id,
+        channel_id=message.channel.id,
+        round_text=card.round_text,
+        entrant1_id=view.p1_id,
+        entrant2_id=view.p2_id,
+        score1=card.scores[0],
+        score2=card.scores[1],
+        view_state=VIEW_ACTIVE,
+    )
+    return True
 
-# ポーリング処理
-@tasks.loop(seconds=POLL_INTERVAL)
-async def poll_sets():
-    global initial_scan_done
-    await bot.wait_until_ready()
-    page = 1
+# イベントIDの一覧を取得
+async def fetch_event_ids(tour: Tournament) -> list[int]:
+    data = await gql_async(QUERY_EVENTS, {"slug": tour.slug}, priority=Priority.POLL, fair_key=tour.slug)
+    return [ev["id"] for ev in data["data"]["tournament"]["events"] if ev]
+
+# 1ページあたりの件数を，前回のレスポンスのオブジェクト数から複雑さの上限に収まるよう調整する
+def tune_per_page(tour: Tournament, event_id: int, nodes: list[dict]):
+    if not nodes:
+        return
+    per_set = max(1, count_objects(nodes) / len(nodes))
+    per_page = int(GQL_COMPLEXITY_LIMIT * 0.8 / per_set)
+    tour.event_per_page[event_id] = max(POLL_MIN_PER_PAGE, min(POLL_MAX_PER_PAGE, per_page))
+
+async def fetch_event_page(tour: Tournament, event_id: int, page: int, per_page: int, filters: Optional[dict]) -> dict:
+    async with poll_sem:
+        data = await gql_async(QUERY_EVENT_SETS, {
+            "eventId": event_id,
+            "page": page,
+            "perPage": per_page,
+            "filters": filters,
+        }, priority=Priority.POLL, fair_key=tour.slug)
+    tour.pages_fetched += 1
+    return (data["data"].get("event") or {}).get("sets") or {}
+
+# イベント単位でページングする (2ページ目以降は並列に取得)
+async def scan_event(tour: Tournament, event_id: int, filters: Optional[dict], handle_sets):
+    per_page = tour.event_per_page.get(event_id, POLL_PER_PAGE)
     while True:
         try:
-            data = await gql_async(QUERY_SETS, {"slug": TOURNAMENT_SLUG, "page": page})
-        except Exception as e:
-            logger.error("GraphQL error:", e)
-            await asyncio.sleep(2)
-            break
-
-        if "data" not in data:
-            logger.error("GraphQL: data missing", data.get("errors"))
-            await asyncio.sleep(2)
+            first = await fetch_event_page(tour, event_id, 1, per_page, filters)
             break
+        except GraphQLError as e:
+            if not e.is_complexity or per_page <= POLL_MIN_PER_PAGE:
+                raise
+            per_page = max(POLL_MIN_PER_PAGE, per_page // 2)
+            tour.event_per_page[event_id] = per_page
+            logger.warning(f"[WARNING] クエリが複雑すぎるため perPage を {per_page} に下げました: event_id = {event_id}")
+
+    nodes = [s for s in first.get("nodes") or [] if s]
+    tune_per_page(tour, event_id, nodes)
+    await handle_sets(nodes)
+
+    total_pages = (first.get("pageInfo") or {}).get("totalPages") or 1
+    if total_pages <= 1 or len(nodes) < per_page:
+        return
 
-        sets = [
-            s for ev in data["data"]["tournament"]["events"]
-            for s in ev["sets"]["nodes"] if s and s.get("station")
-        ]
+    async def scan_page(page: int):
+        rest = await fetch_event_page(tour, event_id, page, per_page, filters)
+        await handle_sets([s for s in rest.get("nodes") or [] if s])
+
+    await asyncio.gather(*(scan_page(page) for page in range(2, total_pages + 1)))
+
+# 変更イベントごとの処理
+# received_at: セットを受け取った時刻 (metrics.now())．対戦台の割り当てから通知までの遅れの計測に使う
+async def dispatch_set_event(tour: Tournament, event: SetEvent, received_at: Optional[float] = None):
+    set_id = event.current.id
+    station = event.current.station
+
+    if event.kind in (CALLED, STATION_MOVED):
+        state_store.put(set_id, tournament=tour.slug, station=station)
+        with span("announce", tournament=tour.slug, set_id=set_id, station=station):
+            sent = await post_announce(tour, event.node, station)
+        if sent:
+            metrics.announcements.inc(tournament=tour.slug, kind=event.kind)
+            if received_at is not None:
+                metrics.announce_lag.observe(metrics.now() - received_at, tournament=tour.slug)
+
+    # start.gg側から更新されたとき，Discord側のUIも更新する
+    elif event.kind == COMPLETED:
+        await update_finished_match_ui(tour, event.node)
+
+    # 終了後に修正された結果で表示し直す
+    elif event.kind == CORRECTED:
+        logger.info(f"終了した試合の結果が修正されました: {tour.slug} set_id = {set_id} (勝者 {event.current.winner_id})")
+        await update_finished_match_ui(tour, event.node)
+
+    # 差し戻された試合は，対戦台があれば改めて呼び出す
+    elif event.kind == RESET:
+        logger.info(f"試合が差し戻されました: {tour.slug} set_id = {set_id}")
+        if station is not None and set_id not in tour.matches:
+            await post_announce(tour, event.node, station)
+
+    elif event.kind == SCORE_CHANGED:
+        logger.debug(f"スコアが更新されました: {tour.slug} set_id = {set_id} {event.current.game_winners}")
+
+# 呼び出しの優先順 (配信台 → サブ配信台 → 対戦台の番号順)
+def announce_order(station) -> tuple[int, int]:
+    rank = {STREAM_MAIN: 0, STREAM_SUB: 1}.get(stream_of(station, STREAM_NUMBER), 2)
+    try:
+        number = int(station)
+    except (TypeError, ValueError):
+        number = 9999
+    return rank, number
+
+# 1サイクル分の呼び出しの通知
+# ページが届くたびに add() し，サイクルの終わりを待たずにその場で送信を始める
+# 送信先のチャンネルごとに待ち行列を持ち，まだ送っていないものを配信台から順に ANNOUNCE_CONCURRENCY 件ずつ並行して送信する
+# (チャンネルごとのレート制限の待ち合わせは discord.py 側が行う)
+class AnnounceBatch:
+    _ids = itertools.count(1)
+
+    def __init__(self, tour: Tournament, key: Optional[str] = None):
+        self.tour = tour
+        self.key = key or f"{WORKER_ID}:{next(AnnounceBatch._ids)}"  # ワーカー間で同じサイクルを見分ける
+        self.count = 0
+        self.started_at: Optional[float] = None
+        self._queues: dict[int, asyncio.PriorityQueue] = {}
+        self._workers: list[asyncio.Task] = []
+
+    # events: セット1件分のイベント / received_at: 受け取った時刻
+    def add(self, events: list[SetEvent], received_at: float):
+        first = events[0]
+        channel_id = route_channel(self.tour, first.node, first.current.station)
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = asyncio.PriorityQueue()
+            self._workers += [asyncio.create_task(self._work(queue)) for _ in range(ANNOUNCE_CONCURRENCY)]
+        if self.started_at is None:
+            self.started_at = metrics.now()
+        self.count += 1
+        queue.put_nowait((announce_order(first.current.station), self.count, events, received_at))
+
+    async def _work(self, queue: asyncio.PriorityQueue):
+        while True:
+            _, _, events, received_at = await queue.get()
+            try:
+                for event in events:
+                    await dispatch_set_event(self.tour, event, received_at)
+            except Exception as e:
+                logger.error(f"[ERROR] 対戦カードの通知に失敗しました: {self.tour.slug} ({e})")
+            finally:
+                queue.task_done()
+
+    # 追加済みのものをすべて送り終えるまで待つ
+    async def close(self):
+        try:
+            for queue in list(self._queues.values()):
+                await queue.join()
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        if self.count:
+            metrics.announce_batch.observe(metrics.now() - self.started_at, tournament=self.tour.slug)
+
+# セット更新の処理 (ポーリング・プッシュ共通)
+# 前回と比べて変化があったセットだけを処理する
+# initial=True のときは通知せず，現在の状態を記録するだけ (すでに通知の処理をしたセットは上書きしない)
+# 初回の読み込みが終わるまでは，記録のないセットは新たに呼び出されたもの (状態6・対戦台あり) だけを通知し，それ以外は記録だけする
+# (読み込み前から対戦中・終了済みのセットを呼び出しとして通知し直さないため)
+# ワーカーを分けているときは，検出した変更をメッセージバスでDiscordワーカーに送る
+async def handle_set_changes(tour: Tournament, nodes: list[dict], initial: bool = False, batch: Optional[AnnounceBatch] = None):
+    received_at = metrics.now()
+    changes: list[list[SetEvent]] = []
+    occupied: list[dict] = []  # 通知せずに記録したセット・通知はないが内容が変わったセット (対戦台の一覧用)
+    for s in nodes:
+        silent = initial or (
+            not tour.initial_scan_done
+            and s["id"] not in tour.sets
+            and not (s.get("state") == STATE_CALLED and s.get("station"))
+        )
+        if silent:
+            if s["id"] not in tour.sets and tour.sets.seed(s) and tour.sets.station_of(s["id"]) is not None:
+                state_store.put(s["id"], tournament=tour.slug, station=tour.sets.station_of(s["id"]))
+            if s.get("station") and s.get("state") != STATE_COMPLETED:
+                occupied.append(s)
+            continue
+
+        digest = tour.sets.digest_of(s["id"])
+        events = tour.sets.diff(s)
+        if events:
+            changes.append(events)
+        elif tour.sets.digest_of(s["id"]) != digest:
+            # 再起動時に戻したセットなど，通知するほどの変化はなくても対戦台の一覧には反映する
+            occupied.append(s)
+
+    if occupied:
+        if event_bus is not None:
+            await event_bus.publish(BUS_SETS, {
+                "tournament": tour.slug,
+                "detected_at": time.time(),
+                "batch": None,
+                "changes": [],
+                "board": occupied,
+            })
+        else:
+            update_board(tour, occupied)
 
-        if not sets:
-            initial_scan_done = True
-            break
+    if not changes:
+        return
+    tour.changes_detected += len(changes)
+    if event_bus is not None:
+        await event_bus.publish(BUS_SETS, {
+            "tournament": tour.slug,
+            "detected_at": time.time(),
+            "batch": batch.key if batch else None,
+            "changes": [encode_events(events) for events in changes],
+        })
+    else:
+        await dispatch_changes(tour, changes, received_at, batch)
 
-        for s in sets:
-            station = s["station"]["number"]
-            set_id = s["id"]
+# 対戦台の一覧に反映する (Discordへの反映は StationBoard がまとめて行う)
+def update_board(tour: Tournament, nodes: list[dict]):
+    if tour.board is None:
+        return
+    for node in nodes:
+        tour.board.apply(node)
+
+# 変更を通知する
+# 呼び出し (対戦台の割り当て・移動) は batch に渡して送信する．batch を渡さなければこの場で送り終えるまで待つ
+async def dispatch_changes(tour: Tournament, changes: list[list[SetEvent]], received_at: float, batch: Optional[AnnounceBatch] = None):
+    update_board(tour, [events[0].node for events in changes])
+    pending = AnnounceBatch(tour) if batch is None else batch
+    for events in changes:
+        if any(e.kind in (CALLED, STATION_MOVED) for e in events):
+            pending.add(events, received_at)
+            continue
+        for event in events:
+            await dispatch_set_event(tour, event, received_at)
+
+    if batch is None:
+        await pending.close()
+
+# ポーリングのワーカーから届いた変更を通知する (バスの購読ごとに届いた順に処理する)
+# 同じポーリングのサイクルの変更は1つの AnnounceBatch にまとめ，次のサイクルの変更が届いたら前のサイクルの分を送り終えるまで待つ
+inbound_batches: dict[str, AnnounceBatch] = {}  # {slug: 受信中のサイクルの通知}
+
+async def receive_set_events(message: dict):
+    tour = tournaments.get(message["tournament"])
+    if tour is None:
+        return
+    # 検出からの経過時間を差し引いて，通知までの遅れにバスでの受け渡しの時間も含める
+    received_at = metrics.now() - max(0.0, time.time() - message["detected_at"])
+    update_board(tour, message.get("board") or [])
+    changes = [decode_events(item) for item in message["changes"]]
+    if not changes:
+        return
+    key = message.get("batch")
+    if key is None:
+        await dispatch_changes(tour, changes, received_at)
+        return
 
-            if not initial_scan_done:
-                station_map[set_id] = station
+    batch = inbound_batches.get(tour.slug)
+    if batch is None or batch.key != key:
+        if batch is not None:
+            await batch.close()
+        batch = inbound_batches[tour.slug] = AnnounceBatch(tour, key)
+    await dispatch_changes(tour, changes, received_at, batch)
+
+# 受信中のサイクルの通知を送り終える
+async def close_inbound_batches():
+    while inbound_batches:
+        _, batch = inbound_batches.popitem()
+        await batch.close()
+
+# プッシュで届いたセットをstart.ggから取得
+async def fetch_set(set_id, priority: Priority = Priority.ANNOUNCE) -> Optional[dict]:
+    data = await gql_async(QUERY_SET, {"setId": set_id}, priority=priority)
+    return data["data"].get("set")
+
+# プッシュで届いたセット (start.ggから取り直したもの) を大会ごとに振り分ける
+async def handle_pushed_sets(nodes: list[dict]):
+    grouped: dict[str, list[dict]] = {}
+    for node in nodes:
+        slug = ((node.get("event") or {}).get("tournament") or {}).get("slug")
+        if slug is None and len(tournaments) == 1:
+            slug = next(iter(tournaments))
+        if slug is None:
+            node = await fetch_set(node["id"])
+            if not node:
                 continue
-            
-            if station_map.get(set_id) != station:
-                station_map[set_id] = station
-                await post_announce(s, station)
-
-            # start.gg側から更新されたとき，Discord側のUIも更新する
-            if s.get("state") == 3:
-                await update_finished_match_ui(s)
+            slug = ((node.get("event") or {}).get("tournament") or {}).get("slug")
+
+        if slug in tournaments:
+            grouped.setdefault(slug, []).append(node)
+
+    await asyncio.gather(*(handle_set_changes(tournaments[slug], group) for slug, group in grouped.items()))
+
+# 大会1つ分のポーリング (所要時間・取得ページ数を記録する)
+async def poll_tournament(tour: Tournament, polling: int = 1):
+    pages_before = tour.pages_fetched
+    changes_before = tour.changes_detected
+    with span("poll_cycle", tournament=tour.slug) as s:
+        ok = await sync_tournament(tour)
+    pages = tour.pages_fetched - pages_before
+    metrics.poll_cycle.observe(s.elapsed, tournament=tour.slug)
+    metrics.poll_pages.observe(pages, tournament=tour.slug)
+    if not ok:
+        metrics.poll_errors.inc(tournament=tour.slug)
+    schedule_next_poll(tour, tour.changes_detected - changes_before, pages, polling)
+
+# 次のポーリングの時刻を決める
+# polling: このワーカーがポーリングしている大会の数 (レート制限をこの数で分け合う)
+def schedule_next_poll(tour: Tournament, changes: int, requests: int, polling: int = 1):
+    now = time.time()
+    cadence = tour.cadence
+    previous = cadence.reason
+    cadence.record(now, changes, requests)
+    # 1回のポーリングのリクエスト数から，レート制限のうちポーリングの分に収まる最短の間隔を求める
+    budget = cadence.cost * max(1, polling) / (gql_scheduler.rate * POLL_BUDGET_SHARE)
+    interval, reason = cadence.next_interval(now, tour.sets.in_progress, gql_scheduler.headroom(), budget)
+    tour.next_poll_at = now + interval
+    metrics.poll_interval.set(interval, tournament=tour.slug)
+    metrics.poll_cadence.inc(tournament=tour.slug, reason=reason)
+    if reason != previous:
+        logger.info(
+            f"ポーリング間隔を {interval:.1f}秒 にしました: {tour.slug} ({reason}, 直近の変化 {cadence.recent_changes}件, 対戦中 {tour.sets.in_progress}件)"
+        )
 
-        page += 1
+# 初回の読み込み (通知せずに全セットの現在の状態を記録する) をバックグラウンドで始める
+# 開始時刻をポーリングの基準時刻にするので，読み込みの途中でも，それ以降に呼び出されたセットは通常のポーリングですぐに通知できる
+def start_baseline(tour: Tournament):
+    if tour.baseline is not None and not tour.baseline.done():
+        return
+    started = time.time()
+    if tour.last_synced_at is None:
+        tour.last_synced_at = int(started)
+    tour.baseline = asyncio.create_task(run_baseline(tour, started))
 
-# ロール付与
-@bot.tree.command(name="assign_roles", description="大会参加者にロールを付与")
-@app_commands.describe(role="付与するロール")
-async def assign_roles(interaction: discord.Interaction, role: discord.Role):
-    await interaction.response.defer(thinking=True)
-    user_pairs = await fetch_discord_ids_from_startgg()
-    guild = interaction.guild
+async def run_baseline(tour: Tournament, started: float):
+    async def handle_sets(nodes: list[dict]):
+        await handle_set_changes(tour, nodes, initial=True)
 
-    assigned = []
-    failed = []
+    with span("baseline_scan", tournament=tour.slug) as s:
+        try:
+            tour.event_ids = await fetch_event_ids(tour)
+            results = await asyncio.gather(
+                *(scan_event(tour, event_id, None, handle_sets) for event_id in tour.event_ids),
+                return_exceptions=True,
+            )
+        except Exception as e:
+            results = [e]
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        # 次のポーリングでやり直す
+        logger.error(f"GraphQL error ({tour.slug}): {errors[0]}")
+        return
 
-    for uid, gamerTag in user_pairs:
-        member = guild.get_member(uid)
+    tour.initial_scan_done = True
+    tour.last_full_scan_at = started
+    logger.info(f"✅ 初回の読み込みが完了しました: {tour.slug} セット {len(tour.sets)}件 ({s.elapsed:.1f}秒)")
+
+# 通常は前回以降に更新されたセットだけを取得し，一定間隔で全件を取り直す
+# 初回の読み込みが終わるまでは，読み込みと並行して開始時刻以降に更新されたセットだけを取得する
+# すべて取得できたかを返す
+async def sync_tournament(tour: Tournament) -> bool:
+    if not tour.initial_scan_done:
+        start_baseline(tour)
+
+    cycle_started = time.time()
+    full_scan = tour.initial_scan_done and cycle_started - tour.last_full_scan_at >= FULL_RESCAN_INTERVAL
+    filters = None if full_scan else {
+        "updatedAfter": tour.last_synced_at - POLL_SKEW,
+        "state": POLL_SET_STATES,
+    }
 
-        # キャッシュにいない場合はfetchで取得
-        if member is None:
-            try:
-                member = await guild.fetch_member(uid)
-            except discord.NotFound:
-                failed.append((gamerTag, "NotFound"))
-                continue
-            except discord.HTTPException as e:
-                failed.append((gamerTag, f"HTTPError: {e}"))
-                continue
+    if full_scan or not tour.event_ids:
+        try:
+            tour.event_ids = await fetch_event_ids(tour)
+        except Exception as e:
+            logger.error(f"GraphQL error ({tour.slug}): {e}")
+            return False
+
+    # 呼び出されたセットはページが届くたびに通知を始める
+    calls = AnnounceBatch(tour)
+
+    async def handle_sets(nodes: list[dict]):
+        await handle_set_changes(tour, nodes, batch=calls)
+
+    scans = [scan_event(tour, event_id, filters, handle_sets) for event_id in tour.event_ids]
+    # 初回の読み込みを省いた再起動の直後は，前回の同期以降に更新のない対戦中のセットも一度だけ取得して対戦台の一覧に載せる
+    board_scan = tour.board_scan_pending and not full_scan
+    if board_scan:
+        scans += [scan_event(tour, event_id, {"state": list(ACTIVE_STATES)}, handle_sets) for event_id in tour.event_ids]
+    results = await asyncio.gather(*scans, return_exceptions=True)
+    # 取得に失敗したイベントがあっても，検出済みの分は送り終える
+    await calls.close()
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.error(f"GraphQL error ({tour.slug}): {errors[0]}")
+        return False
+
+    # 全イベントの全ページを取得できたときだけ基準時刻を進める (再起動後は保存した時刻から差分だけを取得する)
+    tour.last_synced_at = int(cycle_started)
+    state_store.set_meta(f"last_synced_at:{tour.slug}", tour.last_synced_at)
+    if event_bus is not None:
+        # 担当を引き継いだワーカーはここから差分の取得を再開する
+        try:
+            await event_bus.set(f"sync:{tour.slug}", str(tour.last_synced_at))
+        except Exception as e:
+            logger.warning(f"[WARNING] 同期時刻を共有できませんでした: {tour.slug} ({e})")
+    if full_scan:
+        tour.last_full_scan_at = cycle_started
+    tour.board_scan_pending = False
+    return True
 
+# ポーリング処理
+# 大会ごとのリクエストはスケジューラ上で交互に払い出される
+# POLL_MIN_INTERVAL ごとに起き，次のポーリングの時刻 (schedule_next_poll) を過ぎた大会だけを取得する
+@tasks.loop(seconds=POLL_MIN_INTERVAL)
+async def poll_sets():
+    if "discord" in ROLES:
+        await bot.wait_until_ready()
+    tours = list(tournaments.values())
+    if leader_elector is not None:
+        tours = [t for t in tours if leader_elector.is_leader(t.slug)]
+    now = time.time()
+    await asyncio.gather(*(poll_tournament(tour, len(tours)) for tour in tours if tour.next_poll_at <= now))
+
+# ポーリングの担当を引き継いだ大会は，前の担当が最後に同期した時刻から差分の取得を始める
+async def take_over(slug: str):
+    tour = tournaments.get(slug)
+    if tour is None or tour.last_synced_at is not None:
+        return
+    synced_at = await event_bus.get(f"sync:{slug}")
+    if synced_at:
+        tour.last_synced_at = int(synced_at)
+
+leader_elector: Optional[LeaderElector] = None
+if event_bus is not None and "poller" in ROLES:
+    leader_elector = LeaderElector(event_bus, WORKER_ID, LEADER_TTL, on_elected=take_over)
+
+# 大会ごとのポーリングの担当の確認・延長
+@tasks.loop(seconds=max(1.0, LEADER_TTL / 3))
+async def elect_leaders():
+    was_leading = set(leader_elector.leading)
+    leading = await leader_elector.campaign(list(tournaments))
+    for tour in tournaments.values():
+        if tour.slug in leading:
+            continue
+        # 担当を外れた大会の初回の読み込みは止める
+        if tour.baseline is not None:
+            tour.baseline.cancel()
+            tour.baseline = None
+        # 手元の状態は古くなるので捨て，再び担当になったら初回の読み込みからやり直す (その間に変わったセットを通知し直さない)
+        if tour.slug in was_leading:
+            tour.sets = SetDiffer()
+            tour.initial_scan_done = False
+            tour.last_synced_at = None
+
+# 取り込み方式の構築
+def build_ingest_backends() -> list[IngestBackend]:
+    backends: list[IngestBackend] = []
+    if INGEST_MODE in ("poll", "both"):
+        backends.append(PollingBackend(poll_sets))
+    if INGEST_MODE in ("push", "both"):
+        backends.append(PushBackend(
+            handle_pushed_sets,
+            fetch_set,
+            host=PUSH_HOST,
+            port=PUSH_PORT,
+            path=PUSH_PATH,
+            secret=PUSH_SECRET,
+        ))
+    if not backends:
+        raise RuntimeError(f"Unknown INGEST_MODE: {INGEST_MODE}")
+    return backends
+
+ingest_backends = build_ingest_backends()
+ingest_started = False
+
+# メトリクス: 出力時に読み取る現在値 (gauge) と累計 (counter)
+metrics.registry.gauge("discord_edit_queue_depth", "Messages with a pending edit", fn=lambda: edit_queue.depth)
+metrics.registry.counter("discord_edits_sent_total", "Message edits sent", fn=lambda: edit_queue.sent)
+metrics.registry.counter("discord_edits_coalesced_total", "Message edits merged into a pending edit", fn=lambda: edit_queue.coalesced)
+metrics.registry.counter("discord_edits_failed_total", "Message edits that failed", fn=lambda: edit_queue.failed)
+metrics.registry.gauge("startgg_scheduler_tokens", "Tokens left in the start.gg rate limiter", fn=lambda: gql_scheduler.tokens)
+metrics.registry.gauge(
+    "startgg_scheduler_queued",
+    "Requests waiting for the start.gg rate limiter",
+    fn=lambda: sum(lane.queued for lane in gql_scheduler.lanes.values()),
+)
+metrics.registry.gauge("report_outbox_depth", "Score reports waiting to be sent", fn=lambda: report_outbox.depth)
+metrics.registry.counter("report_outbox_delivered_total", "Score reports sent or found already applied", fn=lambda: report_outbox.delivered)
+metrics.registry.counter("report_outbox_skipped_total", "Score reports dropped because staff reported another result", fn=lambda: report_outbox.skipped)
+metrics.registry.counter("report_outbox_gave_up_total", "Score reports dropped after too many failures", fn=lambda: report_outbox.gave_up)
+metrics.registry.gauge("matches_active", "Match cards held in memory", fn=lambda: sum(len(t.matches) for t in tournaments.values()))
+metrics.registry.counter("board_edits_total", "Station board message edits", fn=lambda: sum(t.board.edits for t in tournaments.values() if t.board))
+metrics.registry.counter("board_updates_total", "Set changes applied to station boards", fn=lambda: sum(t.board.updates for t in tournaments.values() if t.board))
+metrics.registry.counter("matches_evicted_total", "Match cards evicted from memory", fn=lambda: sum(t.matches.evicted for t in tournaments.values()))
+metrics_server = MetricsServer(metrics.registry, host=METRICS_HOST, port=METRICS_PORT) if METRICS_PORT else None
+
+# GraphQLスケジューラの待ち行列の状況を定期的に出力
+@tasks.loop(seconds=60)
+async def log_gql_stats():
+    logger.info(f"GraphQL scheduler: {gql_scheduler.snapshot()}")
+
+# 一定時間触られなかった対戦カードをメモリから外す
+@tasks.loop(minutes=5)
+async def prune_matches():
+    for tour in list(tournaments.values()):
+        pruned = tour.matches.prune()
+        if pruned:
+            logger.info(f"対戦カード {pruned}件 をメモリから外しました: {tour.slug}")
+
+# 大会の参加者のメンバー情報をサーバーごとにキャッシュへ読み込み，参加者以外はキャッシュから外す (MEMBER_CACHE=participants)
+@tasks.loop(seconds=ENTRANT_REFRESH_INTERVAL)
+async def sync_participant_members():
+    by_guild: dict[int, set[int]] = {}
+    for tour in list(tournaments.values()):
+        if tour.guild_id is None:
+            continue
         try:
-            await member.add_roles(role, reason="start.gg上の参加者にロール付与")
-            assigned.append(gamerTag)
+            await tour.entrants.ensure(priority=Priority.ROLES)
         except Exception as e:
-            failed.append((gamerTag, f"RoleError: {e}"))
+            logger.warning(f"[WARNING] 参加者を取得できませんでした: {tour.slug} ({e})")
+            continue
+        by_guild.setdefault(tour.guild_id, set()).update(uid for uid, _ in tour.entrants.discord_ids())
+
+    for guild_id, user_ids in by_guild.items():
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue
+        with span("member_cache_sync", guild=guild_id) as s:
+            cached, dropped = await sync_member_cache(guild, user_ids)
+        logger.info(
+            f"✅ 参加者のメンバー情報を読み込みました: {guild.name} {cached}/{len(user_ids)}名 "
+            f"(キャッシュから外した {dropped}名, {s.elapsed:.1f}秒)"
+        )
+
+# ロール付与・削除の結果をまとめる
+def format_role_sync_message(action: str, preposition: str, result: RoleSyncResult, role: discord.Role) -> str:
+    msg = format_result_message(action, preposition, result.done, role)
+    if result.skipped:
+        msg += f"\n\nℹ️ 変更が不要だった参加者 {len(result.skipped)}名"
+    if result.failed:
+        msg += f"\n\n⚠️ ロール{action}に失敗した参加者 {len(result.failed)}名:\n" + "\n".join(f"- {g} ({reason})" for g, reason in result.failed)
+    return msg
+
+# ロール付与・削除の件数と所要時間を記録する
+def record_role_sync(action: str, result: RoleSyncResult, elapsed: float):
+    metrics.role_command.observe(elapsed, action=action)
+    metrics.role_changes.inc(len(result.done), action=action, result="done")
+    metrics.role_changes.inc(len(result.skipped), action=action, result="skipped")
+    metrics.role_changes.inc(len(result.failed), action=action, result="failed")
+
+# 進捗を「考え中」のメッセージに表示する
+def role_progress_reporter(interaction: discord.Interaction, action: str):
+    async def report(done: int, total: int):
+        await interaction.edit_original_response(content=f"⏳ ロールを{action}しています… {done}/{total}")
+    return report
+
+# コマンドの対象となる大会 (指定がなければ，そのサーバーに紐づく大会すべて)
+def tournaments_for(interaction: discord.Interaction, slug: Optional[str]) -> list[Tournament]:
+    if slug:
+        tour = tournaments.get(slug)
+        return [tour] if tour is not None and not owned_by_other_guild(tour, interaction.guild_id) else []
+    return [t for t in tournaments.values() if t.guild_id == interaction.guild_id]
+
+# 別のサーバーで登録された大会か (環境変数・設定ファイルでサーバーを指定せずに登録した大会はどのサーバーからも扱える)
+def owned_by_other_guild(tour: Tournament, guild_id: Optional[int]) -> bool:
+    return tour.guild_id is not None and tour.guild_id != guild_id
 
-    msg = format_result_message("付与", "に", assigned, role)
-    if failed:
-        msg += f"\n\n⚠️ ロール付与に失敗した参加者 {len(failed)}名:\n" + "\n".join(f"- {g} ({reason})" for g, reason in failed)
+# ロール付与
+@bot.tree.command(name="assign_roles", description="大会参加者にロールを付与")
+@app_commands.describe(role="付与するロール", tournament="対象の大会 (省略時はこのサーバーの全大会)")
+async def assign_roles(interaction: discord.Interaction, role: discord.Role, tournament: Optional[str] = None):
+    await interaction.response.defer(thinking=True)
+    tours = tournaments_for(interaction, tournament)
+    if not tours:
+        await interaction.followup.send("⚠️ 対象の大会が登録されていません。")
+        return
+    with span("role_command", action="assign", role=role.id) as s:
+        user_pairs = fetch_discord_ids_from_startgg(tours)
+        result = await bulk_edit_roles(
+            interaction.guild,
+            role,
+            user_pairs,
+            add=True,
+            reason="start.gg上の参加者にロール付与",
+            concurrency=ROLE_CONCURRENCY,
+            progress=role_progress_reporter(interaction, "付与"),
+        )
+    record_role_sync("assign", result, s.elapsed)
 
-    await interaction.followup.send(msg)
+    await interaction.followup.send(format_role_sync_message("付与", "に", result, role))
 
 # ロール削除
 @bot.tree.command(name="remove_roles", description="大会参加者からロールを削除")
-@app_commands.describe(role="削除するロール")
-async def remove_roles(interaction: discord.Interaction, role: discord.Role):
+@app_commands.describe(role="削除するロール", tournament="対象の大会 (省略時はこのサーバーの全大会)")
+async def remove_roles(interaction: discord.Interaction, role: discord.Role, tournament: Optional[str] = None):
     await interaction.response.defer(thinking=True)
-    user_pairs = await fetch_discord_ids_from_startgg()
-    guild = interaction.guild
-
-    removed = []
-    for uid, gamerTag in user_pairs:
-        member = guild.get_member(uid)
-        if member:
-            try:
-                await member.remove_roles(role, reason="start.gg参加者からロール削除")
-                removed.append(gamerTag)
-            except Exception:
-                pass
-
-    msg = format_result_message("削除", "から", removed, role)
-    await interaction.followup.send(msg)
+    tours = tournaments_for(interaction, tournament)
+    if not tours:
+        await interaction.followup.send("⚠️ 対象の大会が登録されていません。")
+        return
+    with span("role_command", action="remove", role=role.id) as s:
+        user_pairs = fetch_discord_ids_from_startgg(tours)
+        result = await bulk_edit_roles(
+            interaction.guild,
+            role,
+            user_pairs,
+            add=False,
+            reason="start.gg参加者からロール削除",
+            concurrency=ROLE_CONCURRENCY,
+            progress=role_progress_reporter(interaction, "削除"),
+        )
+    record_role_sync("remove", result, s.elapsed)
+
+    await interaction.followup.send(format_role_sync_message("削除", "から", result, role))
+
+# 大会の追加
+@bot.tree.command(name="tournament_add", description="大会を登録し，通知先のチャンネルを設定")
+@app_commands.describe(slug="start.ggの大会のslug (URLの tournament/ 以降)", channel="通知先のチャンネル")
+@app_commands.default_permissions(manage_guild=True)
+async def tournament_add(interaction: discord.Interaction, slug: str, channel: discord.TextChannel):
+    tour = tournaments.get(slug)
+    if tour is not None and owned_by_other_guild(tour, interaction.guild_id):
+        await interaction.response.send_message(f"⚠️ 大会 `{slug}` は別のサーバーで登録されています。", ephemeral=True)
+        return
+    add_tournament(slug, channel.id, channel.guild.id)
+    await state_store.save_tournament(slug, channel.id, channel.guild.id)
+    await interaction.response.send_message(f"✅ 大会 `{slug}` の通知先を {channel.mention} に設定しました。")
+    await share_tournaments()
+
+# 大会の削除
+@bot.tree.command(name="tournament_remove", description="大会の登録を解除")
+@app_commands.describe(slug="start.ggの大会のslug")
+@app_commands.default_permissions(manage_guild=True)
+async def tournament_remove(interaction: discord.Interaction, slug: str):
+    tour = tournaments.get(slug)
+    if tour is None or owned_by_other_guild(tour, interaction.guild_id):
+        await interaction.response.send_message(f"⚠️ 大会 `{slug}` は登録されていません。", ephemeral=True)
+        return
+    del tournaments[slug]
+    if tour.baseline is not None:
+        tour.baseline.cancel()
+    if tour.board is not None:
+        tour.board.stop()
+        state_store.set_meta(f"board:{slug}", "")
+    await state_store.delete_tournament(slug)
+    await interaction.response.send_message(f"✅ 大会 `{slug}` の登録を解除しました。")
+    await share_tournaments()
+
+# 登録中の大会をポーリングのワーカーに伝える (ワーカーを分けているとき)
+async def share_tournaments():
+    if event_bus is None:
+        return
+    bindings = [{"slug": t.slug, "channel_id": t.channel_id, "guild_id": t.guild_id} for t in tournaments.values()]
+    try:
+        await event_bus.set(BUS_TOURNAMENTS, json.dumps(bindings))
+        await event_bus.publish(BUS_TOURNAMENTS, {"tournaments": bindings})
+    except Exception as e:
+        logger.warning(f"[WARNING] 大会の一覧を共有できませんでした: {e}")
+
+# Discordのワーカーから届いた大会の一覧に合わせる
+def apply_tournaments(bindings: list[dict]):
+    slugs = {b["slug"] for b in bindings}
+    for b in bindings:
+        add_tournament(b["slug"], b["channel_id"], b.get("guild_id"))
+    for slug in [slug for slug in tournaments if slug not in slugs]:
+        tour = tournaments.pop(slug)
+        if tour.baseline is not None:
+            tour.baseline.cancel()
+
+async def receive_tournaments(message: dict):
+    apply_tournaments(message["tournaments"])
+
+# 登録中の大会一覧
+@bot.tree.command(name="tournament_list", description="登録中の大会の一覧")
+async def tournament_list(interaction: discord.Interaction):
+    tours = [t for t in tournaments.values() if t.guild_id in (None, interaction.guild_id)]
+    if not tours:
+        await interaction.response.send_message("⚠️ 登録中の大会はありません。", ephemeral=True)
+        return
+    lines = [f"- `{t.slug}` → <#{t.channel_id}>" for t in tours]
+    await interaction.response.send_message("📋 登録中の大会:\n" + "\n".join(lines), ephemeral=True)
+
+# 保存済みの状態を読み込み，受付中だった対戦カードにボタンを付け直す
+# 大会の紐づけは 環境変数 → 設定ファイル → コマンドで登録したもの の順に読み込み，後のものが優先される
+def restore_state():
+    state_store.open()
+
+    bindings: list[dict] = []
+    if TOURNAMENT_SLUG:
+        bindings.append({
+            "slug": TOURNAMENT_SLUG,
+            "channel_id": DISCORD_CHANNEL_ID,
+            "guild_id": None,
+            "routes": load_routes(ROUTES_FILE) if ROUTES_FILE else None,
+        })
+    if TOURNAMENTS_FILE:
+        bindings += load_bindings(TOURNAMENTS_FILE)
+    bindings += state_store.load_tournaments()
+    for b in bindings:
+        add_tournament(b["slug"], b["channel_id"], b["guild_id"], b.get("routes"))
+
+    for set_id, slug, station in state_store.stations():
+        tour = tournaments.get(slug)
+        if tour is not None:
+            tour.sets.restore(set_id, station)
+
+    active: dict[str, list] = {}
+    for set_id, row in state_store.rows.items():
+        tour = tournaments.get(row["tournament"])
+        if tour is None:
+            continue
+        if "discord" in ROLES and row["view_state"] == VIEW_ACTIVE and row["message_id"]:
+            active.setdefault(tour.slug, []).append((row["updated_at"] or 0, set_id))
+
+    # 受付中の対戦カードは新しいものから上限まで登録する (残りはボタンが押されたときに作り直す)
+    restored = 0
+    for slug, rows in active.items():
+        tour = tournaments[slug]
+        newest = sorted(rows, key=lambda r: r[0])[-tour.matches.max_size:]
+        for _, set_id in newest:
+            rehydrate_match(tour, set_id)
+        restored += len(newest)
+
+    # 前回の対戦台が分かっている大会は初回の読み込みを省き，前回の最終同期時刻以降の差分から取得を再開する
+    # (全件の取り直しは FULL_RESCAN_INTERVAL 後に行う)
+    for tour in tournaments.values():
+        if len(tour.sets):
+            tour.initial_scan_done = True
+            tour.board_scan_pending = True
+            synced_at = state_store.get_meta(f"last_synced_at:{tour.slug}")
+            if synced_at is not None:
+                tour.last_synced_at = int(synced_at)
+                tour.last_full_scan_at = time.time()
+    logger.info(
+        f"✅ 保存済みの状態を復元しました: 大会 {len(tournaments)}件 / "
+        f"対戦台 {sum(len(t.sets) for t in tournaments.values())}件 / 受付中の対戦カード {restored}件"
+    )
 
 # 再起動後，旧メッセージ上のカスタムID (s1_*, s2_*, ok) が押されたときの安全弁
 async def setup_hook():
     bot.add_view(FallbackReportView())
+    restore_state()
+    state_store.start()
+    report_outbox.resume()
+    if event_bus is not None:
+        await event_bus.start()
+        event_bus.subscribe(BUS_SETS, receive_set_events)
+        await share_tournaments()
+    # 前回の状態がない大会は，Discordへの接続・コマンドの同期と並行して初回の読み込みを始める
+    # (ワーカーを分けているときは，担当になってから始める)
+    elif INGEST_MODE in ("poll", "both"):
+        for tour in tournaments.values():
+            if not tour.initial_scan_done:
+                start_baseline(tour)
 
 bot.setup_hook = setup_hook
 
-# 起動処理
-@bot.event
-async def on_ready():
-    await bot.wait_until_ready()
+# セット更新の取り込みを始める (ワーカーを分けているときは，担当の確認も始める)
+async def start_ingest():
+    if leader_elector is not None:
+        elect_leaders.start()
+    for backend in ingest_backends:
+        await backend.start()
+    logger.info(f"✅ セット更新の取り込み方式 = {', '.join(b.name for b in ingest_backends)}")
+
+async def shutdown():
+    for backend in ingest_backends:
+        await backend.stop()
+    if leader_elector is not None:
+        elect_leaders.cancel()
+        await leader_elector.resign_all()
+    sync_participant_members.cancel()
+    for tour in tournaments.values():
+        if tour.baseline is not None:
+            tour.baseline.cancel()
+        if tour.board is not None:
+            tour.board.stop()
+    if metrics_server:
+        await metrics_server.stop()
+    if event_bus is not None:
+        await event_bus.close()
+        await close_inbound_batches()
+    await edit_queue.drain()
+    await report_outbox.close()
+    await gql_client.close()
+    await state_store.close()
+
+# 終了時にGraphQLのセッションを閉じる
+_bot_close = bot.close
+
+async def close():
+    await shutdown()
+    await _bot_close()
+
+bot.close = close
+
+async def sync_commands():
     try:
         synced = await bot.tree.sync()
         logger.info(f"✅ スラッシュコマンド {len(synced)}個 を同期しました。")
     except Exception as e:
         logger.error(f"[ERROR] スラッシュコマンドの同期に失敗: {e}")
 
-    logger.info(f"✅ 通知するチャンネル = {DISCORD_CHANNEL_ID}")
-
-    poll_sets.start()
+# 起動処理
+@bot.event
+async def on_ready():
+    global ingest_started
+    await bot.wait_until_ready()
+    # コマンドの同期は待たずに，取り込みの開始と並行して行う
+    command_sync = asyncio.create_task(sync_commands())
+
+    for tour in tournaments.values():
+        # 環境変数や設定ファイルで登録した大会は，チャンネルからサーバーを引く
+        channel = bot.get_channel(tour.channel_id)
+        if tour.guild_id is None and channel is not None:
+            tour.guild_id = channel.guild.id
+        logger.info(f"✅ 大会 {tour.slug} の通知先チャンネル = {tour.channel_id}")
+        if tour.router.rules:
+            logger.info(f"✅ 大会 {tour.slug} の振り分け先チャンネル = {', '.join(str(c) for c in sorted(tour.router.channel_ids))}")
+
+    if not ingest_started:
+        ingest_started = True
+        if event_bus is not None:
+            logger.info(f"✅ ワーカーの役割 = {', '.join(sorted(ROLES))} (worker = {WORKER_ID}, bus = {event_bus.name})")
+        if "poller" in ROLES:
+            await start_ingest()
+        if metrics_server:
+            await metrics_server.start()
+
+    if not log_gql_stats.is_running():
+        log_gql_stats.start()
+    if not prune_matches.is_running():
+        prune_matches.start()
+    if MEMBER_CACHE == "participants" and not sync_participant_members.is_running():
+        sync_participant_members.start()
+    await command_sync
 
     logger.info(f"Logged in as {bot.user} (ID: {bot.user.id})")
 
+# ポーリング専用のワーカー (Discordには接続せず，検出した変更をメッセージバスに送る)
+async def run_poller():
+    restore_state()
+    state_store.start()
+    await event_bus.start()
+    shared = await event_bus.get(BUS_TOURNAMENTS)
+    if shared:
+        apply_tournaments(json.loads(shared))
+    event_bus.subscribe(BUS_TOURNAMENTS, receive_tournaments)
+    logger.info(f"✅ ワーカーの役割 = poller (worker = {WORKER_ID}, bus = {event_bus.name})")
+    await start_ingest()
+    if metrics_server:
+        await metrics_server.start()
+    log_gql_stats.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await shutdown()
+
 if __name__ == "__main__":
-    bot.run(DISCORD_BOT_TOKEN)
+    if "discord" in ROLES:
+        bot.run(DISCORD_BOT_TOKEN)
+    else:
+        try:
+            asyncio.run(run_poller())
+        except KeyboardInterrupt:
+            pass
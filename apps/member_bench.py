@@ -0,0 +1,188 @@
+"""大きなサーバーを模したゲートウェイで，メンバーのキャッシュの方式ごとに起動時間とメモリを比べる
+
+    python apps/member_bench.py                                # 50,000人のサーバー・参加者 512人
+    python apps/member_bench.py --members 200000 --participants 2048
+
+full:         起動時にサーバーの全メンバーを読み込む (チャンク) まで on_ready にならない
+participants: チャンクせずに on_ready になり，その後で参加者だけをIDで取得する
+メモリは方式ごとに別のプロセスで計測する
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+# main.py は読み込み時に環境変数を検証するので，計測用の値を先に入れておく
+os.environ.setdefault("DISCORD_BOT_TOKEN", "bench")
+os.environ.setdefault("STARTGG_API_TOKEN", "bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import discord  # noqa: E402
+
+import main  # noqa: E402
+from replay import rss_mb  # noqa: E402
+from roles import sync_member_cache  # noqa: E402
+
+GUILD_ID = 1_000_000
+BOT_ID = 1
+MEMBER_ID_BASE = 10_000_000
+CHUNK_SIZE = 1000  # Discordが1回のチャンクで返す人数
+
+
+def user_payload(user_id: int) -> dict:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None, "global_name": None}
+
+
+def member_payload(user_id: int) -> dict:
+    return {
+        "user": user_payload(user_id),
+        "roles": [],
+        "joined_at": "2025-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def guild_payload(member_count: int) -> dict:
+    return {
+        "id": str(GUILD_ID),
+        "name": "bench",
+        "owner_id": str(BOT_ID),
+        "member_count": member_count,
+        "large": True,
+        "unavailable": False,
+        "features": [],
+        "roles": [{
+            "id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0,
+            "color": 0, "hoist": False, "managed": False, "mentionable": False,
+        }],
+        "emojis": [],
+        "stickers": [],
+        "channels": [],
+        "threads": [],
+        "voice_states": [],
+        "presences": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "members": [member_payload(BOT_ID)],
+    }
+
+
+# ゲートウェイのメンバー要求 (REQUEST_GUILD_MEMBERS) にチャンクで応答する
+class FakeGateway:
+    def __init__(self, state, member_count: int, chunk_latency: float):
+        self.state = state
+        self.member_count = member_count
+        self.chunk_latency = chunk_latency
+        self.requests = 0
+        self.members_sent = 0
+        self._tasks: list[asyncio.Task] = []
+
+    async def request_chunks(self, guild_id, query=None, *, limit, user_ids=None, presences=False, nonce=None):
+        self.requests += 1
+        if user_ids:
+            ids = [uid for uid in user_ids if MEMBER_ID_BASE <= uid < MEMBER_ID_BASE + self.member_count]
+        else:
+            ids = range(MEMBER_ID_BASE, MEMBER_ID_BASE + self.member_count)
+        self._tasks.append(asyncio.get_running_loop().create_task(self._send(guild_id, list(ids), nonce)))
+
+    async def _send(self, guild_id, ids: list[int], nonce):
+        chunks = [ids[i:i + CHUNK_SIZE] for i in range(0, len(ids), CHUNK_SIZE)] or [[]]
+        for index, chunk in enumerate(chunks):
+            await asyncio.sleep(self.chunk_latency)
+            self.members_sent += len(chunk)
+            self.state.parse_guild_members_chunk({
+                "guild_id": str(guild_id),
+                "members": [member_payload(uid) for uid in chunk],
+                "chunk_index": index,
+                "chunk_count": len(chunks),
+                "nonce": nonce,
+            })
+
+
+async def measure(mode: str, member_count: int, participants: int, chunk_latency: float) -> dict:
+    client = discord.Client(**main.client_options(mode))
+    state = client._connection
+    state.loop = asyncio.get_running_loop()
+    state.guild_ready_timeout = 0.05
+    gateway = FakeGateway(state, member_count, chunk_latency)
+    state._get_websocket = lambda *args, **kwargs: gateway
+    ready = asyncio.Event()
+    state.handlers["ready"] = ready.set
+
+    gc.collect()
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    state.parse_ready({
+        "user": {**user_payload(BOT_ID), "bot": True},
+        "guilds": [{"id": str(GUILD_ID), "unavailable": True}],
+        "session_id": "bench",
+        "application": {"id": str(BOT_ID), "flags": 0},
+    })
+    state.parse_guild_create(guild_payload(member_count))
+    await ready.wait()
+    # 最後のGUILD_CREATEからの待ち時間 (guild_ready_timeout) は方式によらないので差し引く
+    ready_sec = time.perf_counter() - started - state.guild_ready_timeout
+
+    guild = client.get_guild(GUILD_ID)
+    participant_ids = {MEMBER_ID_BASE + i * max(1, member_count // participants) for i in range(participants)}
+    warm_started = time.perf_counter()
+    if mode == "participants":
+        await sync_member_cache(guild, participant_ids)
+    warm_sec = time.perf_counter() - warm_started
+
+    gc.collect()
+    return {
+        "mode": mode,
+        "members": member_count,
+        "participants": participants,
+        "ready_ms": ready_sec * 1000,
+        "participants_ms": warm_sec * 1000,
+        "cached": len(guild.members),
+        "gateway_members": gateway.members_sent,
+        "rss_delta_mb": rss_mb() - rss_before,
+    }
+
+
+def print_table(results: list[dict]):
+    columns = [
+        ("mode", "{:>12}"), ("members", "{:>8}"), ("participants", "{:>12}"),
+        ("ready_ms", "{:>10.1f}"), ("participants_ms", "{:>15.1f}"),
+        ("cached", "{:>8}"), ("gateway_members", "{:>15}"), ("rss_delta_mb", "{:>12.1f}"),
+    ]
+    print(" ".join(f"{name:>{len(fmt.format(0))}}" for name, fmt in columns))
+    for r in results:
+        print(" ".join(fmt.format(r[name]) for name, fmt in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="メンバーのキャッシュの方式ごとに起動時間とメモリを比べる")
+    parser.add_argument("--members", type=int, default=50_000, help="サーバーのメンバー数")
+    parser.add_argument("--participants", type=int, default=512, help="大会の参加者のうちDiscordを連携している人数")
+    parser.add_argument("--chunk-latency", type=float, default=0.02, help="チャンク1回あたりの待ち時間 (秒)")
+    parser.add_argument("--mode", choices=("full", "participants"), help="1つの方式だけを計測する (内部用)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(measure(args.mode, args.members, args.participants, args.chunk_latency))))
+        sys.exit(0)
+
+    results = []
+    for mode in ("full", "participants"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--members", str(args.members),
+             "--participants", str(args.participants), "--chunk-latency", str(args.chunk_latency)],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
@@ -0,0 +1,225 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger("DiscordStartggManager")
+
+# 秒単位のヒストグラムの区切り
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# バイト数・件数のヒストグラムの区切り
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{k}="{v}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(k, "") for k in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+# 増えていくだけの値 (fn を渡すと，各処理が数えている累計を出力時に読み取る)
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+        self.fn = fn
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        if self.fn is not None:
+            try:
+                lines.append(f"{self.name} {self.fn()}")
+            except Exception as e:
+                logger.debug(f"メトリクスの取得に失敗しました: {self.name} ({e})")
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+# 現在値 (fn を渡すと出力時に読み取る)
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.values: dict[tuple, float] = {}
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        if self.fn is not None:
+            try:
+                lines.append(f"{self.name} {self.fn()}")
+            except Exception as e:
+                logger.debug(f"メトリクスの取得に失敗しました: {self.name} ({e})")
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values: dict[tuple, list] = {}  # {labels: [各区切りの件数..., 合計, 件数]}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        row = self.values.get(key)
+        if row is None:
+            row = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, row in self.values.items():
+            for bound, count in zip(self.buckets, row):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {row[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {row[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+        self.log_spans = False
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = (), fn: Optional[Callable[[], float]] = None) -> Counter:
+        return self._register(Counter(name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, labels: tuple = (), fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help, labels, fn))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    # Prometheusのテキスト形式で出力
+    def render(self) -> str:
+        return "\n".join(line for m in self.metrics.values() for line in m.render()) + "\n"
+
+
+registry = Registry()
+
+# GraphQL
+gql_requests = registry.counter("startgg_requests_total", "start.gg GraphQL requests", ("operation", "status"))
+gql_retries = registry.counter("startgg_retries_total", "start.gg GraphQL retries after rate limiting", ("operation",))
+gql_latency = registry.histogram("startgg_request_seconds", "start.gg GraphQL request latency", ("operation",))
+gql_payload = registry.histogram("startgg_response_bytes", "start.gg GraphQL response size", ("operation",), SIZE_BUCKETS)
+
+# ポーリング
+poll_cycle = registry.histogram("poll_cycle_seconds", "Duration of one poll cycle", ("tournament",))
+poll_pages = registry.histogram("poll_pages", "Set pages fetched per poll cycle", ("tournament",), COUNT_BUCKETS)
+poll_errors = registry.counter("poll_errors_total", "Poll cycles that failed", ("tournament",))
+poll_interval = registry.gauge("poll_interval_seconds", "Current interval until the next poll", ("tournament",))
+poll_cadence = registry.counter("poll_cadence_total", "Poll cycles by the reason for the chosen interval", ("tournament", "reason"))
+
+# 通知・Discord
+announce_lag = registry.histogram("announce_lag_seconds", "Time from detecting a station assignment to the Discord message", ("tournament",))
+announce_batch = registry.histogram("announce_batch_seconds", "Time from the first to the last call-out of one batch", ("tournament",))
+interaction_latency = registry.histogram("interaction_seconds", "Time to handle a score button press, including waiting for the same set", ("action",))
+announcements = registry.counter("announcements_total", "Match cards posted or moved", ("tournament", "kind"))
+
+# ロール
+role_changes = registry.counter("role_changes_total", "Members processed by role commands", ("action", "result"))
+role_command = registry.histogram("role_command_seconds", "Duration of role commands", ("action",))
+
+# 区間の処理時間 (log_spans が有効ならログにも出す)
+span_latency = registry.histogram("span_seconds", "Duration of traced spans", ("span",))
+
+
+class Span:
+    __slots__ = ("name", "started", "elapsed")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+
+# with span("poll_cycle", tournament=slug) as s: ... で区間を計測する (s.elapsed に秒数が入る)
+@contextmanager
+def span(name: str, **fields):
+    s = Span(name)
+    try:
+        yield s
+    finally:
+        s.elapsed = time.perf_counter() - s.started
+        span_latency.observe(s.elapsed, span=name)
+        if registry.log_spans:
+            detail = " ".join(f"{k}={v}" for k, v in fields.items())
+            logger.info(f"[SPAN] {name} {s.elapsed * 1000:.1f}ms {detail}".rstrip())
+
+
+def now() -> float:
+    return time.perf_counter()
+
+
+# /metrics を返すHTTPエンドポイント
+class MetricsServer:
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9100, path: str = "/metrics"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"✅ メトリクスの公開を開始しました: http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
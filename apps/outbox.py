@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+from store import StateStore
+
+logger = logging.getLogger("DiscordStartggManager")
+
+# 照合の結果
+REPORT_OPEN = "open"            # まだ終了していない (送信する)
+REPORT_DONE = "done"            # 同じ勝者で終了済み (送信済みとみなす)
+REPORT_CONFLICT = "conflict"    # 別の勝者で終了済み (スタッフが処理した)
+REPORT_GAVE_UP = "gave_up"      # 失敗が続いたので送信をあきらめた
+
+# スコア報告を送信する処理 (payload は reportBracketSet の変数)
+Deliver = Callable[[dict, Optional[str]], Awaitable[None]]
+# start.gg上のセットの状態と照合する処理
+Reconcile = Callable[[dict], Awaitable[str]]
+# 送らずに取り下げた報告を知らせる処理 (理由は REPORT_CONFLICT / REPORT_GAVE_UP)
+Dropped = Callable[["OutboxEntry", str], Awaitable[None]]
+
+
+class OutboxEntry:
+    __slots__ = ("set_id", "tournament", "payload", "attempts", "created_at")
+
+    def __init__(self, set_id, tournament: Optional[str], payload: dict, attempts: int = 0, created_at: Optional[float] = None):
+        self.set_id = set_id
+        self.tournament = tournament
+        self.payload = payload
+        self.attempts = attempts
+        self.created_at = created_at or time.time()
+
+
+# スコア報告の送信待ち
+# 先にSQLiteへ書き込んでからプレイヤーに応答し，送信はバックグラウンドで行う
+# 同じセットへの報告は最新のものだけを送る．失敗したら待ち時間を伸ばしながら再送し，
+# 再送の前にstart.gg上のセットの状態を確認して，終了済みなら送らない
+# 別の結果で終了済みだった・送信をあきらめたときは on_dropped で知らせる (プレイヤーには受け付けたと返しているため)
+class ReportOutbox:
+    def __init__(
+        self,
+        store: StateStore,
+        deliver: Deliver,
+        reconcile: Reconcile,
+        base_delay: float = 2,
+        max_delay: float = 300,
+        max_attempts: int = 10,
+        on_dropped: Optional[Dropped] = None,
+    ):
+        self.store = store
+        self.deliver = deliver
+        self.reconcile = reconcile
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.on_dropped = on_dropped
+        self.delivered = 0
+        self.skipped = 0
+        self.gave_up = 0
+        self._entries: dict = {}  # {set_id: OutboxEntry}
+        self._workers: dict = {}  # {set_id: asyncio.Task}
+
+    @property
+    def depth(self) -> int:
+        return len(self._entries)
+
+    async def submit(self, set_id, tournament: Optional[str], payload: dict):
+        entry = OutboxEntry(set_id, tournament, payload)
+        await self.store.save_outbox(set_id, tournament, payload, 0, entry.created_at)
+        self._entries[set_id] = entry
+        self._wake(set_id)
+
+    # 再起動前に送れなかった報告を読み込んで送信を再開する
+    def resume(self):
+        for row in self.store.load_outbox():
+            self._entries[row["set_id"]] = OutboxEntry(
+                row["set_id"], row["tournament"], row["payload"], row["attempts"], row["created_at"]
+            )
+            self._wake(row["set_id"])
+        if self._entries:
+            logger.info(f"✅ 送信待ちのスコア報告 {len(self._entries)}件 の送信を再開します")
+
+    def _wake(self, set_id):
+        worker = self._workers.get(set_id)
+        if worker is None or worker.done():
+            self._workers[set_id] = asyncio.get_running_loop().create_task(self._run(set_id))
+
+    def _delay(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _run(self, set_id):
+        try:
+            while set_id in self._entries:
+                entry = self._entries[set_id]
+                if await self._attempt(entry):
+                    # 送信中に新しい報告が来ていれば，それを送り直す
+                    if self._entries.get(set_id) is entry:
+                        del self._entries[set_id]
+                        await self.store.delete_outbox(set_id)
+                    continue
+
+                # 失敗したが新しい報告が来ていれば，待たずにそちらを送る
+                if self._entries.get(set_id) is not entry:
+                    continue
+
+                entry.attempts += 1
+                if entry.attempts >= self.max_attempts:
+                    self.gave_up += 1
+                    logger.error(f"[ERROR] スコア報告の送信をあきらめました: set_id = {set_id} ({entry.attempts}回失敗)")
+                    if self._entries.get(set_id) is entry:
+                        del self._entries[set_id]
+                        await self.store.delete_outbox(set_id)
+                    await self._dropped(entry, REPORT_GAVE_UP)
+                    continue
+
+                await self.store.save_outbox(set_id, entry.tournament, entry.payload, entry.attempts, entry.created_at)
+                await asyncio.sleep(self._delay(entry.attempts))
+        finally:
+            self._workers.pop(set_id, None)
+
+    # 送信できた (または送る必要がなくなった) ら True
+    async def _attempt(self, entry: OutboxEntry) -> bool:
+        try:
+            # 再送の前に，すでに終了していないか確認する
+            if entry.attempts:
+                status = await self.reconcile(entry.payload)
+                if status == REPORT_DONE:
+                    self.delivered += 1
+                    logger.info(f"スコア報告はすでに反映されていました: set_id = {entry.set_id}")
+                    return True
+                if status == REPORT_CONFLICT:
+                    self.skipped += 1
+                    logger.warning(f"[WARNING] スタッフが別の結果で処理したため，スコア報告を取り消しました: set_id = {entry.set_id}")
+                    await self._dropped(entry, REPORT_CONFLICT)
+                    return True
+
+            await self.deliver(entry.payload, entry.tournament)
+            self.delivered += 1
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[WARNING] スコア報告の送信に失敗しました: set_id = {entry.set_id} ({entry.attempts + 1}回目: {e})")
+            return False
+
+    async def _dropped(self, entry: OutboxEntry, reason: str):
+        if self.on_dropped is None:
+            return
+        try:
+            await self.on_dropped(entry, reason)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[ERROR] 取り下げたスコア報告の後処理に失敗しました: set_id = {entry.set_id} ({e})")
+
+    # 終了時は送信中のものだけ待つ (残りは次回の起動時に再開する)
+    async def close(self, timeout: float = 5):
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,89 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+
+
+# 受付中の対戦カード1枚分 (IDとViewだけを持ち，メッセージやAPIのノードは持たない)
+class MatchRecord:
+    __slots__ = ("set_id", "message_id", "channel_id", "view", "touched")
+
+    def __init__(self, set_id, message_id: int, channel_id: int, view, touched: float):
+        self.set_id = set_id
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.view = view  # ReportButtons (スコア・対戦カードの内容を持つ)
+        self.touched = touched
+
+
+# 受付中の対戦カードの一覧 (件数の上限と，一定時間触られなかったものの追い出し)
+# 追い出したカードは保存済みの状態から必要になったときに作り直す
+class MatchRegistry:
+    def __init__(
+        self,
+        max_size: int = 2000,
+        ttl_sec: float = 6 * 3600,
+        on_release: Optional[Callable[[MatchRecord], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.on_release = on_release
+        self.clock = clock
+        self.evicted = 0
+        self._records: "OrderedDict[object, MatchRecord]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, set_id) -> bool:
+        return set_id in self._records
+
+    def __iter__(self) -> Iterator[MatchRecord]:
+        return iter(list(self._records.values()))
+
+    def get(self, set_id) -> Optional[MatchRecord]:
+        record = self._records.get(set_id)
+        if record is not None:
+            record.touched = self.clock()
+            self._records.move_to_end(set_id)
+        return record
+
+    def put(self, set_id, message_id: int, channel_id: int, view) -> MatchRecord:
+        record = self._records.pop(set_id, None)
+        if record is not None and record.view is not view:
+            self._release(record)
+        record = MatchRecord(set_id, message_id, channel_id, view, self.clock())
+        self._records[set_id] = record
+        while len(self._records) > self.max_size:
+            _, oldest = self._records.popitem(last=False)
+            self._evict(oldest)
+        return record
+
+    # 終了したカードを外す (追い出しとは数えない)
+    def pop(self, set_id) -> Optional[MatchRecord]:
+        record = self._records.pop(set_id, None)
+        if record is not None:
+            self._release(record)
+        return record
+
+    # 一定時間触られなかったカードを追い出す．追い出した件数を返す
+    def prune(self) -> int:
+        deadline = self.clock() - self.ttl_sec
+        count = 0
+        while self._records:
+            set_id, oldest = next(iter(self._records.items()))
+            if oldest.touched > deadline:
+                break
+            del self._records[set_id]
+            self._evict(oldest)
+            count += 1
+        return count
+
+    def _evict(self, record: MatchRecord):
+        self.evicted += 1
+        self._release(record)
+
+    # 外したカードのViewを止める処理などを呼ぶ
+    def _release(self, record: MatchRecord):
+        if self.on_release is not None:
+            self.on_release(record)
@@ -0,0 +1,668 @@
+"""記録した大会の進行 (start.ggのレスポンスの時系列) を再生して，Botの処理コストを計測する
+
+    python apps/replay.py                         # 64 / 512 / 4096 人規模の合成データで計測
+    python apps/replay.py --entrants 512 --save-timeline t.json
+    python apps/replay.py --timeline t.json       # 記録済みのタイムラインを再生
+    python apps/replay.py --cold-restart          # 途中の再起動を，保存済みの状態なしで行う
+    python apps/replay.py --cadence adaptive --pause-frames 60   # ポーリング間隔の調整を，途中の休憩ありで計測
+    WORKER_ROLE=poller,discord python apps/replay.py   # 検出と通知をメッセージバス (同じプロセス内) で分けて計測
+    python apps/replay.py --entrants 4096 --compare-queries   # ポーリングの応答の大きさ・パース時間を旧クエリと比べる
+
+タイムラインの形式:
+    {"events": [event_id, ...],
+     "entrants": {"<event_id>": [entrant node, ...]},
+     "frames": [{"sets": {"<event_id>": [set node, ...]}}, ...]}
+set node / entrant node は QUERY_EVENT_SETS / QUERY_EVENT_ENTRANTS のノードと同じ形
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Optional
+
+from aiohttp import web
+
+# main.py は読み込み時に環境変数を検証するので，計測用の値を先に入れておく
+os.environ.setdefault("DISCORD_BOT_TOKEN", "replay")
+os.environ.setdefault("STARTGG_API_TOKEN", "replay")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="replay-"), "state.sqlite3"))
+os.environ.setdefault("GQL_RATE_LIMIT", "1000000")
+os.environ.setdefault("STATION_BOARD", "true")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import main  # noqa: E402
+from bus import MemoryBus  # noqa: E402
+from store import StateStore  # noqa: E402
+
+REPLAY_SLUG = "replay"
+REPLAY_CHANNEL_ID = 1
+
+
+# 再生用の時計 (1フレーム = tick 秒として進める)
+class SimClock:
+    def __init__(self, start: float = 1_700_000_000):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, sec: float):
+        self.now += sec
+
+
+class Timeline:
+    def __init__(self, events: list, entrants: dict, frames: list):
+        self.events = events
+        self.entrants = entrants
+        self.frames = frames
+
+    @classmethod
+    def load(cls, path: str) -> "Timeline":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["events"], data["entrants"], data["frames"])
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"events": self.events, "entrants": self.entrants, "frames": self.frames}, f)
+
+    @property
+    def entrant_count(self) -> int:
+        return sum(len(v) for v in self.entrants.values())
+
+    @property
+    def set_count(self) -> int:
+        return sum(len(v) for v in self.frames[-1]["sets"].values()) if self.frames else 0
+
+
+# 合成データ: N人の大会で約2N試合を，対戦台の数だけ並行して消化していく
+# stations: 対戦台の数 (最初のフレームでこの数だけ一斉に呼び出される)
+# silent_ratio: 終了を通知されずに一覧から消えるセットの割合 (DQや別イベントへの移動など)
+# pause_frames: 途中 (半分の位置) と最後に入れる，何も変化しないフレームの数 (休憩・トップ8待ちなど)
+def generate_timeline(
+    entrant_count: int,
+    seed: int = 0,
+    set_duration: int = 3,
+    stations: Optional[int] = None,
+    silent_ratio: float = 0,
+    pause_frames: int = 0,
+) -> Timeline:
+    rng = random.Random(seed)
+    event_id = 1000 + entrant_count
+    entrants = [
+        {
+            "id": 10_000_000 + i,
+            "name": f"Player{i}",
+            "participants": [{
+                "gamerTag": f"Player{i}",
+                "user": {"authorizations": [{"type": "DISCORD", "externalId": str(100_000_000_000 + i)}]},
+            }],
+        }
+        for i in range(entrant_count)
+    ]
+
+    sets = []
+    for i in range(max(1, entrant_count * 2 - 2)):
+        a, b = rng.sample(entrants, 2)
+        sets.append({
+            "id": 50_000_000 + entrant_count * 10 + i,
+            "fullRoundText": f"Round {i // max(1, entrant_count // 2) + 1}",
+            "state": 1,
+            "winnerId": None,
+            "station": None,
+            "games": [],
+            "slots": [{"entrant": {"id": a["id"]}}, {"entrant": {"id": b["id"]}}],
+        })
+
+    stations = stations or max(4, entrant_count // 16)
+    # 変化のないセットは前のフレームとノードを共有する
+    current = [json.loads(json.dumps(s)) for s in sets]
+    frames = [{"sets": {str(event_id): list(current)}}]
+    queue = list(range(len(sets)))
+    running: dict[int, int] = {}  # {set index: 経過フレーム}
+    free = list(range(stations, 0, -1))
+    hidden: set[int] = set()
+
+    while queue or running:
+        changed = []
+        for idx in list(running):
+            running[idx] += 1
+            s = sets[idx]
+            age = running[idx]
+            changed.append(idx)
+            if age == 1:
+                s["state"] = 2
+            elif age < set_duration:
+                s["games"].append({"winnerId": s["slots"][rng.randint(0, 1)]["entrant"]["id"]})
+            else:
+                free.append(s["station"]["number"])
+                del running[idx]
+                if rng.random() < silent_ratio:
+                    hidden.add(idx)
+                    continue
+                winner = s["slots"][rng.randint(0, 1)]["entrant"]["id"]
+                s["games"].append({"winnerId": winner})
+                s["state"] = 3
+                s["winnerId"] = winner
+
+        while queue and free:
+            idx = queue.pop(0)
+            sets[idx]["station"] = {"number": free.pop()}
+            sets[idx]["state"] = 6
+            running[idx] = 0
+            changed.append(idx)
+
+        for idx in changed:
+            current[idx] = json.loads(json.dumps(sets[idx]))
+        frames.append({"sets": {str(event_id): [n for i, n in enumerate(current) if i not in hidden]}})
+
+    if pause_frames:
+        middle = len(frames) // 2
+        frames[middle + 1:middle + 1] = [frames[middle]] * pause_frames
+        frames.extend([frames[-1]] * pause_frames)
+
+    return Timeline([event_id], {str(event_id): entrants}, frames)
+
+
+# 旧クエリ (GetSets) のセットのノード: 毎回，参加者の名前・gamerTag・連携アカウントまで含めていた
+def legacy_set_node(node: dict, entrants: dict) -> dict:
+    slots = []
+    for slot in node.get("slots") or []:
+        entrant = entrants.get(((slot or {}).get("entrant") or {}).get("id"))
+        slots.append({"entrant": entrant})
+    return dict(node, slots=slots)
+
+
+# start.gg GraphQL の代わりに，現在のフレームを返すサーバー
+# compare_queries=True なら，セットの応答ごとに旧クエリの形の応答も作り，大きさとパース時間を比べる
+class FakeStartgg:
+    def __init__(self, timeline: Timeline, clock: SimClock, compare_queries: bool = False):
+        self.timeline = timeline
+        self.clock = clock
+        self.requests = 0
+        self.bytes_sent = 0
+        self.compare_queries = compare_queries
+        self.query_stats = {"slim": [0, 0.0], "legacy": [0, 0.0]}  # {クエリ: [バイト数, パース時間]}
+        self._entrants = {e["id"]: e for nodes in timeline.entrants.values() for e in nodes} if compare_queries else {}
+        self.frame: dict = {}
+        self.updated_at: dict = {}
+        self._digests: dict = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/gql", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/gql"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # フレームを公開し，新しく対戦台が付いたセットのIDを返す
+    def publish(self, frame: dict) -> list:
+        called = []
+        for nodes in frame["sets"].values():
+            for node in nodes:
+                digest = json.dumps(node, sort_keys=True)
+                if self._digests.get(node["id"]) != digest:
+                    prev = self._digests.get(node["id"])
+                    if node.get("station") and (prev is None or '"station": null' in prev):
+                        called.append(node["id"])
+                    self._digests[node["id"]] = digest
+                    self.updated_at[node["id"]] = self.clock.time()
+        self.frame = frame
+        return called
+
+    def _event_sets(self, event_id, filters: Optional[dict]) -> list:
+        nodes = self.frame.get("sets", {}).get(str(event_id), [])
+        if filters:
+            after = filters.get("updatedAfter")
+            states = filters.get("state")
+            nodes = [
+                n for n in nodes
+                if (after is None or self.updated_at.get(n["id"], 0) > after)
+                and (not states or n["state"] in states)
+            ]
+        return nodes
+
+    @staticmethod
+    def _page(nodes: list, page: int, per_page: int) -> dict:
+        total_pages = max(1, -(-len(nodes) // per_page))
+        return {"pageInfo": {"totalPages": total_pages}, "nodes": nodes[(page - 1) * per_page:page * per_page]}
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        query = body["query"]
+        v = body.get("variables") or {}
+        op = re.search(r"(?:query|mutation)\s+(\w+)", query).group(1)
+
+        if op == "GetEvents":
+            data = {"tournament": {"events": [{"id": e} for e in self.timeline.events]}}
+        elif op == "GetEventSets":
+            nodes = self._event_sets(v["eventId"], v.get("filters"))
+            data = {"event": {"sets": self._page(nodes, v["page"], v["perPage"])}}
+            if self.compare_queries:
+                page = data["event"]["sets"]
+                legacy = dict(page, nodes=[legacy_set_node(n, self._entrants) for n in page["nodes"]])
+                self._measure("slim", json.dumps({"data": data}))
+                self._measure("legacy", json.dumps({"data": {"event": {"sets": legacy}}}))
+        elif op == "GetEventEntrants":
+            nodes = self.timeline.entrants.get(str(v["eventId"]), [])
+            data = {"event": {"entrants": self._page(nodes, v["page"], v["perPage"])}}
+        elif op == "GetSet":
+            node = next(
+                (n for nodes in self.frame.get("sets", {}).values() for n in nodes if n["id"] == v["setId"]),
+                None,
+            )
+            data = {"set": dict(node, event={"tournament": {"slug": REPLAY_SLUG}}) if node else None}
+        elif op == "Report":
+            data = {"reportBracketSet": [{"id": v["setId"], "state": 3}]}
+        else:
+            data = {}
+
+        text = json.dumps({"data": data})
+        self.bytes_sent += len(text)
+        return web.Response(text=text, content_type="application/json")
+
+    def _measure(self, query: str, text: str):
+        body = text.encode()
+        started = time.perf_counter()
+        json.loads(body)
+        stats = self.query_stats[query]
+        stats[0] += len(body)
+        stats[1] += time.perf_counter() - started
+
+
+# Discordのチャンネルの代わり (送信・編集に一定の遅延を入れる)
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel: "FakeChannel", content: Optional[str], embed, message_id: Optional[int] = None):
+        self.id = message_id or next(self._ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = [embed] if embed else []
+
+    async def edit(self, embed=None, view=None, **kwargs):
+        await self.channel.wait_turn()
+        self.channel.discord.edits += 1
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def delete(self):
+        await self.channel.wait_turn()
+
+    async def pin(self, reason=None):
+        await self.channel.wait_turn()
+
+
+# rate: チャンネルごとの1秒あたりの上限 (0なら無制限)．Discordのチャンネル単位のレート制限を模す
+class FakeChannel:
+    def __init__(self, discord: "FakeDiscord", channel_id: int, latency: float, rate: float = 0):
+        self.discord = discord
+        self.id = channel_id
+        self.guild = SimpleNamespace(id=1)
+        self.latency = latency
+        self.rate = rate
+        self._next_slot = 0.0
+
+    async def wait_turn(self):
+        if self.rate:
+            now = time.perf_counter()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+            await asyncio.sleep(slot - now)
+        await asyncio.sleep(self.latency)
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self, None, None, message_id)
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        await self.wait_turn()
+        self.discord.record_send(getattr(view, "set_id", None))
+        return FakeMessage(self, content, embed)
+
+
+class FakeDiscord:
+    def __init__(self, channel_count: int, latency: float, rate: float = 0, clock: Optional[SimClock] = None):
+        self.channels = {
+            REPLAY_CHANNEL_ID + i: FakeChannel(self, REPLAY_CHANNEL_ID + i, latency, rate)
+            for i in range(channel_count)
+        }
+        self.edits = 0
+        self.frame = 0
+        self.clock = clock or SimClock()
+        self.called_at: dict = {}
+        self.called_sim: dict = {}  # {set_id: 呼び出された時刻 (start.ggの時刻)}
+        self.announce_latencies: list[float] = []
+        self.detect_delays: list[float] = []  # 呼び出しから通知までの start.gg の時刻での遅れ (ポーリング間隔の分を含む)
+        self.sent_at: dict[int, list[float]] = {}  # {frame: [送信時刻, ...]}
+        self.restarted_at: Optional[float] = None
+        self.restart_first: Optional[float] = None  # 再起動から最初の通知までの時間
+
+    def record_send(self, set_id):
+        if set_id in self.called_at:
+            now = time.perf_counter()
+            if self.restarted_at is not None and self.restart_first is None:
+                self.restart_first = now - self.restarted_at
+            self.announce_latencies.append(now - self.called_at.pop(set_id))
+            if set_id in self.called_sim:
+                self.detect_delays.append(self.clock.time() - self.called_sim.pop(set_id))
+            self.sent_at.setdefault(self.frame, []).append(now)
+
+    # 対戦台の番号を均等に区切って各チャンネルに振り分けるルール
+    def routes(self, stations: int) -> list[dict]:
+        ids = sorted(self.channels)
+        if len(ids) <= 1:
+            return []
+        size = -(-stations // len(ids))
+        return [
+            {"channel_id": channel_id, "stations": [i * size + 1, (i + 1) * size]}
+            for i, channel_id in enumerate(ids)
+        ]
+
+
+# 現在の常駐メモリ (MB)．/proc がなければ最大値で代用する
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def station_count(timeline: Timeline) -> int:
+    return max(
+        (n["station"]["number"] for frame in timeline.frames for nodes in frame["sets"].values() for n in nodes if n.get("station")),
+        default=1,
+    )
+
+
+# タイムラインを1本再生して計測結果を返す
+# 検出と通知を分けているとき (WORKER_ROLE=poller,discord) は，バスに残った変更を通知し終えるまで待つ
+async def drain_bus():
+    if isinstance(main.event_bus, MemoryBus):
+        await main.event_bus.drain()
+        await main.close_inbound_batches()
+
+
+# Botの再起動 (保存済みの状態を読み直す)．cold=True なら保存済みの状態を消してから起動する
+async def restart(routes: list[dict], cold: bool) -> "main.Tournament":
+    for tour in main.tournaments.values():
+        if tour.baseline is not None:
+            tour.baseline.cancel()
+    await drain_bus()
+    await main.edit_queue.drain()
+    path = main.state_store.path
+    await main.state_store.close()
+    if cold:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    main.state_store = StateStore(path, evict_after=main.MATCH_TTL, clock=main.time.time)
+    main.report_outbox.store = main.state_store
+    main.tournaments.clear()
+    main.restore_state()
+    main.state_store.start()
+    return main.add_tournament(REPLAY_SLUG, REPLAY_CHANNEL_ID, 1, routes)
+
+
+async def replay(
+    timeline: Timeline,
+    tick: float,
+    discord_latency: float,
+    trace_memory: bool,
+    channels: int = 1,
+    channel_rate: float = 0,
+    restart_at: float = 0,
+    cold_restart: bool = False,
+    cadence: str = "frame",
+    compare_queries: bool = False,
+) -> dict:
+    clock = SimClock()
+    server = FakeStartgg(timeline, clock, compare_queries)
+    await server.start()
+    discord = FakeDiscord(channels, discord_latency, channel_rate, clock)
+    routes = discord.routes(station_count(timeline))
+
+    # Botを偽のstart.gg・Discordにつなぎ替える
+    main.gql_client.endpoint = server.url
+    main.time = clock
+    main.bot.get_channel = discord.channels.get
+    main.bot.add_view = lambda *args, **kwargs: None
+    main.state_store = StateStore(os.path.join(tempfile.mkdtemp(prefix="replay-"), "state.sqlite3"), evict_after=main.MATCH_TTL, clock=clock.time)
+    main.report_outbox.store = main.state_store
+    main.state_store.open()
+    main.state_store.start()
+    await main.state_store.save_tournament(REPLAY_SLUG, REPLAY_CHANNEL_ID, 1)
+    main.tournaments.clear()
+    tour = main.add_tournament(REPLAY_SLUG, REPLAY_CHANNEL_ID, 1, routes)
+    restart_frame = int(len(timeline.frames) * restart_at) if restart_at > 0 else None
+    restart_cycle_ms = 0.0
+    restart_pending = False
+
+    if trace_memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+
+    cycle_times: list[float] = []
+    rss_samples: list[float] = []
+    quarters = {len(timeline.frames) * q // 4 for q in range(4)}
+    started = time.perf_counter()
+    sim_started = clock.time()
+    # fixed / adaptive では，フレームの変化をフレームの途中 (ランダムな時刻) に反映する
+    offsets = random.Random(len(timeline.frames))
+    for index, frame in enumerate(timeline.frames):
+        if index in quarters:
+            rss_samples.append(rss_mb())
+        discord.frame = index
+        frame_end = clock.time() + tick
+        publish_at = clock.time() + (offsets.random() * tick if cadence != "frame" else 0)
+        published = False
+
+        # frame: フレームごとに1回ポーリングする
+        # fixed / adaptive: フレームの間 (tick 秒) に，POLL_INTERVAL ごと / 次のポーリングの時刻ごとにポーリングする
+        while True:
+            if not published and clock.time() >= publish_at:
+                published = True
+                published_at = time.perf_counter()
+                for set_id in server.publish(frame):
+                    discord.called_at[set_id] = published_at
+                    discord.called_sim[set_id] = clock.time()
+                if index == restart_frame:
+                    discord.restarted_at = time.perf_counter()
+                    tour = await restart(routes, cold_restart)
+                    restart_pending = True
+
+            if cadence == "frame" or tour.next_poll_at <= clock.time():
+                t0 = time.perf_counter()
+                await main.poll_tournament(tour)
+                cycle_times.append(time.perf_counter() - t0)
+                if cadence == "fixed":
+                    tour.next_poll_at = clock.time() + main.POLL_INTERVAL
+                # フレームの間隔は実時間では進まないので，次のポーリングの前に通知を送り終えておく
+                await drain_bus()
+                if restart_pending:
+                    restart_cycle_ms = (time.perf_counter() - discord.restarted_at) * 1000
+                    restart_pending = False
+
+            if cadence == "frame":
+                break
+            upcoming = min(tour.next_poll_at, frame_end if published else publish_at)
+            if upcoming >= frame_end:
+                break
+            clock.now = max(clock.time(), upcoming)
+        clock.now = frame_end
+
+    if tour.baseline is not None:
+        await tour.baseline
+    await drain_bus()
+    await main.edit_queue.drain()
+    rss_samples.append(rss_mb())
+    elapsed = time.perf_counter() - started
+    sim_minutes = max(clock.time() - sim_started, tick) / 60
+
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    if trace_memory:
+        tracemalloc.stop()
+    await server.stop()
+    await main.state_store.close()
+
+    # 1フレームで最も多く呼び出されたときの，最初から最後の通知までの時間
+    burst = max(discord.sent_at.values(), key=len, default=[])
+    polls = max(1, len(cycle_times))
+    queries = {
+        f"{name}_{key}": value
+        for name, (size, parse) in server.query_stats.items()
+        for key, value in (("kb_per_poll", size / polls / 1024), ("parse_ms_per_poll", parse / polls * 1000))
+    } if compare_queries else {}
+
+    return {
+        "entrants": timeline.entrant_count,
+        "sets": timeline.set_count,
+        "channels": channels,
+        "cycles": len(cycle_times),
+        "cycle_p50_ms": percentile(cycle_times, 0.5) * 1000,
+        "cycle_p99_ms": percentile(cycle_times, 0.99) * 1000,
+        "cycle_max_ms": max(cycle_times, default=0) * 1000,
+        "announced": len(discord.announce_latencies),
+        "announce_p50_ms": percentile(discord.announce_latencies, 0.5) * 1000,
+        "announce_p99_ms": percentile(discord.announce_latencies, 0.99) * 1000,
+        "detect_p50_s": percentile(discord.detect_delays, 0.5),
+        "detect_p99_s": percentile(discord.detect_delays, 0.99),
+        "burst_sets": len(burst),
+        "burst_ms": (max(burst) - min(burst)) * 1000 if burst else 0.0,
+        "edits": discord.edits,
+        "requests": server.requests,
+        "requests_per_min": server.requests / sim_minutes,
+        "bytes_parsed": server.bytes_sent,
+        "peak_mem_mb": peak / 1024 / 1024,
+        "rss_mb": "/".join(f"{v:.0f}" for v in rss_samples),
+        "matches_live": len(tour.matches),
+        "board_updates": tour.board.updates if tour.board else 0,
+        "board_edits": tour.board.edits if tour.board else 0,
+        "restart_first_ms": discord.restart_first * 1000 if discord.restart_first is not None else None,
+        "restart_cycle_ms": restart_cycle_ms,
+        "wall_sec": elapsed,
+        **queries,
+    }
+
+
+def print_table(results: list[dict]):
+    columns = [
+        ("entrants", "{:>8}"), ("sets", "{:>6}"), ("channels", "{:>8}"), ("cycles", "{:>6}"),
+        ("cycle_p50_ms", "{:>12.1f}"), ("cycle_p99_ms", "{:>12.1f}"),
+        ("announce_p50_ms", "{:>15.1f}"), ("announce_p99_ms", "{:>15.1f}"),
+        ("detect_p50_s", "{:>12.1f}"), ("detect_p99_s", "{:>12.1f}"),
+        ("burst_sets", "{:>10}"), ("burst_ms", "{:>8.1f}"),
+        ("requests_per_min", "{:>16.1f}"), ("bytes_parsed", "{:>12}"), ("peak_mem_mb", "{:>11.1f}"),
+        ("rss_mb", "{:>20}"), ("matches_live", "{:>12}"), ("board_updates", "{:>13}"), ("board_edits", "{:>11}"),
+        ("restart_first_ms", "{:>16.1f}"), ("restart_cycle_ms", "{:>16.1f}"),
+    ]
+    print(" ".join(f"{name:>{len(fmt.format(0))}}" for name, fmt in columns))
+    for r in results:
+        print(" ".join(fmt.format(r[name]) if r[name] is not None else f"{'-':>{len(fmt.format(0))}}" for name, fmt in columns))
+
+
+# 旧クエリ (参加者の情報を毎回含める) と現在のクエリの，1回のポーリングあたりの応答の大きさ・パース時間
+def print_query_table(results: list[dict]):
+    columns = [
+        ("entrants", "{:>8}"), ("cycles", "{:>6}"),
+        ("legacy_kb_per_poll", "{:>18.1f}"), ("slim_kb_per_poll", "{:>16.1f}"),
+        ("legacy_parse_ms_per_poll", "{:>24.2f}"), ("slim_parse_ms_per_poll", "{:>22.2f}"),
+    ]
+    print(" ".join(f"{name:>{len(fmt.format(0))}}" for name, fmt in columns))
+    for r in results:
+        print(" ".join(fmt.format(r[name]) for name, fmt in columns))
+
+
+async def run(args):
+    results = []
+    if main.event_bus is not None:
+        main.event_bus.subscribe(main.BUS_SETS, main.receive_set_events)
+    if args.timeline:
+        timeline = Timeline.load(args.timeline)
+        results.append(await replay(
+            timeline, args.tick, args.discord_latency, not args.no_memory, args.channels, args.channel_rate,
+            args.restart_at, args.cold_restart, args.cadence, args.compare_queries,
+        ))
+    else:
+        for n in args.entrants:
+            timeline = generate_timeline(
+                n, seed=args.seed, stations=args.stations, silent_ratio=args.silent_ratio, pause_frames=args.pause_frames,
+            )
+            if args.save_timeline:
+                timeline.save(args.save_timeline if len(args.entrants) == 1 else f"{args.save_timeline}.{n}")
+            results.append(await replay(
+                timeline, args.tick, args.discord_latency, not args.no_memory, args.channels, args.channel_rate,
+                args.restart_at, args.cold_restart, args.cadence, args.compare_queries,
+            ))
+
+    await main.gql_client.close()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+        if args.compare_queries:
+            print()
+            print_query_table(results)
+
+    # 再起動から最初の通知までの時間の目標
+    if args.ttfa_target:
+        slow = [r for r in results if r["restart_first_ms"] is not None and r["restart_first_ms"] > args.ttfa_target]
+        for r in slow:
+            print(f"再起動から最初の通知まで {r['restart_first_ms']:.0f}ms (目標 {args.ttfa_target:.0f}ms): 参加者 {r['entrants']}人", file=sys.stderr)
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="start.ggの記録を再生してBotの処理コストを計測する")
+    parser.add_argument("--entrants", type=int, nargs="+", default=[64, 512, 4096])
+    parser.add_argument("--timeline", help="記録済みのタイムライン (JSON)")
+    parser.add_argument("--save-timeline", help="合成したタイムラインを保存する")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stations", type=int, help="対戦台の数 (一斉呼び出しの件数．省略時は参加者数/16)")
+    parser.add_argument("--tick", type=float, default=10.0, help="1フレームあたりの経過秒数 (start.ggの時刻)")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="Discordへの送信・編集の遅延 (秒)")
+    parser.add_argument("--silent-ratio", type=float, default=0, help="終了を通知されずに消えるセットの割合")
+    parser.add_argument("--channels", type=int, default=1, help="対戦台の番号で振り分ける通知先チャンネルの数")
+    parser.add_argument("--channel-rate", type=float, default=0, help="チャンネルごとの送信・編集の上限 (回/秒，0なら無制限)")
+    parser.add_argument("--restart-at", type=float, default=0.5, help="途中で再起動する位置 (全体に対する割合，0なら再起動しない)")
+    parser.add_argument("--cold-restart", action="store_true", help="保存済みの状態を消してから再起動する")
+    parser.add_argument("--ttfa-target", type=float, default=1000, help="再起動から最初の通知までの目標 (ミリ秒，0なら判定しない)")
+    parser.add_argument(
+        "--cadence", choices=("frame", "fixed", "adaptive"), default="frame",
+        help="ポーリングの間隔: frame (フレームごとに1回) / fixed (POLL_INTERVAL ごと) / adaptive (変化に応じて調整)",
+    )
+    parser.add_argument("--pause-frames", type=int, default=0, help="途中と最後に入れる，何も変化しないフレームの数")
+    parser.add_argument("--no-memory", action="store_true", help="tracemallocによるメモリ計測をしない")
+    parser.add_argument("--compare-queries", action="store_true", help="ポーリングの応答の大きさ・パース時間を旧クエリ (参加者の情報を毎回含める) と比べる")
+    parser.add_argument("--json", action="store_true")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Optional, Union
+
+import discord
+
+logger = logging.getLogger("DiscordStartggManager")
+
+# query_members に一度に渡せるユーザーIDの上限
+QUERY_CHUNK_SIZE = 100
+
+
+class RoleSyncResult:
+    def __init__(self):
+        self.done: list[str] = []
+        self.skipped: list[str] = []
+        self.failed: list[tuple[str, str]] = []
+
+
+# キャッシュにいないメンバーは，ユーザーIDを100件ずつまとめてゲートウェイから取得する
+async def resolve_members(guild: discord.Guild, user_ids: list[int]) -> dict[int, discord.Member]:
+    found: dict[int, discord.Member] = {}
+    missing: list[int] = []
+    for uid in user_ids:
+        member = guild.get_member(uid)
+        if member is None:
+            missing.append(uid)
+        else:
+            found[uid] = member
+
+    for i in range(0, len(missing), QUERY_CHUNK_SIZE):
+        chunk = missing[i:i + QUERY_CHUNK_SIZE]
+        try:
+            members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=True)
+        except asyncio.TimeoutError:
+            continue
+        for member in members:
+            found[member.id] = member
+
+    return found
+
+
+# 参加者だけをメンバーのキャッシュに持つ (MEMBER_CACHE=participants)
+# キャッシュにいない参加者をIDでまとめて取得し，参加者でなくなったメンバーはキャッシュから外す
+# 取得できた人数と外した人数を返す
+# discord.py にはキャッシュから外す公開の手段がないので Guild._remove_member を使う (requirements.txt でバージョンを固定している)
+# 使えないバージョンでは外さずに続ける (キャッシュはこれまでの参加者の分だけ増える)
+async def sync_member_cache(guild: discord.Guild, user_ids: set[int]) -> tuple[int, int]:
+    found = await resolve_members(guild, list(user_ids))
+    remove_member = getattr(guild, "_remove_member", None)
+    if remove_member is None:
+        logger.warning("[WARNING] このバージョンの discord.py ではメンバーをキャッシュから外せません")
+        return len(found), 0
+    keep = set(user_ids)
+    if guild.me is not None:
+        keep.add(guild.me.id)
+    dropped = 0
+    for member in list(guild.members):
+        if member.id not in keep:
+            remove_member(member)
+            dropped += 1
+    return len(found), dropped
+
+
+# 参加者全員のロールをまとめて付与/削除する
+# すでに目的の状態になっているメンバーは呼び出さず，残りは並列に処理する
+# (レート制限のバケットごとの待ち合わせは discord.py 側が行う)
+# user_pairs に (Discord ID, タグ) の組のリストを少しずつ返す非同期イテレータを渡すと，届いた分から処理を始める
+async def bulk_edit_roles(
+    guild: discord.Guild,
+    role: discord.Role,
+    user_pairs: Union[Iterable[tuple[int, str]], AsyncIterable[list[tuple[int, str]]]],
+    add: bool,
+    reason: Optional[str] = None,
+    concurrency: int = 5,
+    progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    progress_interval: float = 3.0,
+) -> RoleSyncResult:
+    result = RoleSyncResult()
+
+    # 同じDiscordアカウントが複数回出てくる場合があるので重複を除く
+    seen: set[int] = set()
+
+    total = 0
+    processed = 0
+    last_report = 0.0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def edit(member: discord.Member, tag: str):
+        nonlocal processed, last_report
+        async with sem:
+            try:
+                if add:
+                    await member.add_roles(role, reason=reason)
+                else:
+                    await member.remove_roles(role, reason=reason)
+                result.done.append(tag)
+            except discord.HTTPException as e:
+                result.failed.append((tag, f"RoleError: {e}"))
+
+        processed += 1
+        now = time.monotonic()
+        if progress and processed < total and now - last_report >= progress_interval:
+            last_report = now
+            try:
+                await progress(processed, total)
+            except discord.HTTPException:
+                pass
+
+    edits: list[asyncio.Task] = []
+    try:
+        async for batch in _batches(user_pairs):
+            tags: dict[int, str] = {}
+            for uid, tag in batch:
+                if uid not in seen:
+                    seen.add(uid)
+                    tags[uid] = tag
+
+            members = await resolve_members(guild, list(tags))
+
+            for uid, tag in tags.items():
+                member = members.get(uid)
+                if member is None:
+                    # サーバーにいないメンバーはロールを持ちようがないので，削除の場合は対象外
+                    if add:
+                        result.failed.append((tag, "NotFound"))
+                    else:
+                        result.skipped.append(tag)
+                elif (role in member.roles) == add:
+                    result.skipped.append(tag)
+                else:
+                    total += 1
+                    edits.append(asyncio.ensure_future(edit(member, tag)))
+
+        await asyncio.gather(*edits)
+    finally:
+        for task in edits:
+            task.cancel()
+
+    if progress:
+        try:
+            await progress(total, total)
+        except discord.HTTPException:
+            pass
+
+    return result
+
+
+async def _batches(user_pairs) -> AsyncIterator[list[tuple[int, str]]]:
+    if hasattr(user_pairs, "__aiter__"):
+        async for batch in user_pairs:
+            yield batch
+    else:
+        yield list(user_pairs)
@@ -0,0 +1,109 @@
+import json
+from typing import Optional
+
+from card import STREAM_MAIN, STREAM_SUB
+
+
+# "1-8" / [1, 8] / 3 を (最小, 最大) にする
+def parse_stations(value) -> Optional[tuple[int, int]]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value, value
+    if isinstance(value, (list, tuple)):
+        return int(value[0]), int(value[-1])
+    low, _, high = str(value).partition("-")
+    return int(low), int(high or low)
+
+
+# セットから振り分けに使う情報を取り出す
+def route_info(node: dict, station, stream: Optional[str]) -> dict:
+    group = node.get("phaseGroup") or {}
+    phase = group.get("phase") or {}
+    try:
+        number = int(station)
+    except (TypeError, ValueError):
+        number = None
+    return {
+        "event_id": (node.get("event") or {}).get("id"),
+        "phase_id": phase.get("id"),
+        "phase_name": (phase.get("name") or "").lower(),
+        "pool": (group.get("displayIdentifier") or "").lower(),
+        "station": number,
+        "stream": stream,
+    }
+
+
+# 振り分けルール1件
+# {"channel_id": 123, "event_id": 1, "phase": "Top 8", "pool": "A1", "stations": "1-8", "stream": "main"}
+# 指定した条件がすべて一致したときに channel_id に送る
+class RouteRule:
+    __slots__ = ("channel_id", "event_id", "phase", "pool", "stations", "stream")
+
+    def __init__(self, channel_id: int, event_id=None, phase=None, pool=None, stations=None, stream=None):
+        self.channel_id = channel_id
+        self.event_id = event_id
+        self.phase = phase
+        self.pool = pool
+        self.stations = stations
+        self.stream = stream  # main / sub / stream (どちらか) / none
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "RouteRule":
+        phase = item.get("phase")
+        return cls(
+            channel_id=int(item["channel_id"]),
+            event_id=int(item["event_id"]) if item.get("event_id") else None,
+            phase=phase if isinstance(phase, int) or phase is None else str(phase).lower(),
+            pool=str(item["pool"]).lower() if item.get("pool") else None,
+            stations=parse_stations(item.get("stations")),
+            stream=item.get("stream"),
+        )
+
+    def matches(self, info: dict) -> bool:
+        if self.event_id is not None and info["event_id"] != self.event_id:
+            return False
+        if self.phase is not None and self.phase not in (info["phase_id"], info["phase_name"]):
+            return False
+        if self.pool is not None and info["pool"] != self.pool:
+            return False
+        if self.stations is not None:
+            if info["station"] is None or not self.stations[0] <= info["station"] <= self.stations[1]:
+                return False
+        if self.stream is not None:
+            stream = info["stream"]
+            if self.stream == "stream":
+                return stream in (STREAM_MAIN, STREAM_SUB)
+            if self.stream == "none":
+                return stream is None
+            return stream == self.stream
+        return True
+
+
+# 対戦カードの送信先の振り分け
+# ルールは上から順に評価し，最初に一致したもののチャンネルを返す (一致しなければ None = 大会の既定のチャンネル)
+class Router:
+    def __init__(self, rules: Optional[list[RouteRule]] = None):
+        self.rules = rules or []
+
+    def route(self, node: dict, station, stream: Optional[str]) -> Optional[int]:
+        if not self.rules:
+            return None
+        info = route_info(node, station, stream)
+        for rule in self.rules:
+            if rule.matches(info):
+                return rule.channel_id
+        return None
+
+    @property
+    def channel_ids(self) -> set[int]:
+        return {rule.channel_id for rule in self.rules}
+
+
+# 振り分けルールをファイルから読み込む ([{...}, ...] または {"routes": [...]})
+def load_routes(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("routes", [])
+    return data
@@ -0,0 +1,315 @@
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Optional
+
+import aiohttp
+
+import metrics
+
+
+# GraphQLのエラー応答
+class GraphQLError(RuntimeError):
+    def __init__(self, errors: list):
+        super().__init__(json.dumps(errors, indent=2, ensure_ascii=False))
+        self.errors = errors
+
+    # クエリの複雑さ (1リクエストあたりのオブジェクト数) の上限に引っかかったか
+    @property
+    def is_complexity(self) -> bool:
+        return any("complexity" in str(e.get("message", "")).lower() for e in self.errors)
+
+    @property
+    def is_rate_limit(self) -> bool:
+        return any("rate limit" in str(e.get("message", "")).lower() for e in self.errors)
+
+
+# レート制限を超えて再試行をあきらめたとき
+class RateLimitError(GraphQLError):
+    pass
+
+
+# リクエストの優先度 (値が小さいほど優先)
+class Priority(IntEnum):
+    REPORT = 0    # スコア報告
+    ANNOUNCE = 1  # 対戦台の通知
+    POLL = 2      # ポーリング
+    ROLES = 3     # ロール同期
+
+
+class LaneStats:
+    __slots__ = ("queued", "served", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.queued = 0
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+# start.ggのリクエスト上限に合わせたトークンバケット (優先度の高いものから払い出す)
+# 同じ優先度の中では fair_key (大会など) ごとに順番に払い出し，1つの大会が独占しないようにする
+# max_concurrency を指定すると同時に実行中のリクエスト数 (接続の枠) も一緒に払い出す
+# 枠のうち reserved 個はスコア報告・通知用に空けておき，ポーリングやロール同期のページが枠を埋めても待たせない
+class RequestScheduler:
+    def __init__(self, rate_limit: int = 80, window_sec: float = 60, max_concurrency: Optional[int] = None, reserved: int = 1):
+        self.capacity = float(rate_limit)
+        self.rate = rate_limit / window_sec
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.backoffs = 0
+        self.max_concurrency = max_concurrency
+        self.reserved = min(reserved, max_concurrency - 1) if max_concurrency else 0
+        self.in_flight = 0
+        self._wakeup = asyncio.Event()  # 枠が空いた・新しい要求が来た
+        self.lanes = {p: LaneStats() for p in Priority}
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self._vtime = {p: 0 for p in Priority}
+        self._last_tag: dict = {}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority: Priority = Priority.POLL, fair_key=None):
+        lane = self.lanes[priority]
+        enqueued = time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+
+        # キーごとに「何番目の払い出しか」を振り，小さいものから払い出す
+        tag = max(self._vtime[priority], self._last_tag.get((priority, fair_key), 0)) + 1
+        self._last_tag[(priority, fair_key)] = tag
+        heapq.heappush(self._heap, (priority, tag, next(self._seq), fut))
+        lane.queued += 1
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # 払い出し済みのトークン・枠は戻す
+            if fut.done() and not fut.cancelled():
+                self.tokens = min(self.capacity, self.tokens + 1)
+                self.release()
+            raise
+        finally:
+            lane.queued -= 1
+
+        wait = time.monotonic() - enqueued
+        lane.served += 1
+        lane.total_wait += wait
+        lane.max_wait = max(lane.max_wait, wait)
+
+    async def _dispatch(self):
+        while self._heap:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            priority, tag, _, fut = self._heap[0]
+            if fut.done():
+                heapq.heappop(self._heap)
+                continue
+            if self.max_concurrency and self.in_flight >= self._slots_for(priority):
+                # 枠が空くまで待つ (空いた枠は優先度の高いものから使う)
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            heapq.heappop(self._heap)
+            self._vtime[priority] = tag
+            self.tokens -= 1
+            if self.max_concurrency:
+                self.in_flight += 1
+            fut.set_result(None)
+
+    def _slots_for(self, priority: Priority) -> int:
+        return self.max_concurrency if priority <= Priority.ANNOUNCE else self.max_concurrency - self.reserved
+
+    # リクエストが終わったら枠を返す
+    def release(self):
+        if not self.max_concurrency:
+            return
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wakeup.set()
+
+    # 残りのトークンの割合 (0〜1)．止めている間は0
+    def headroom(self) -> float:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return 0.0
+        self._refill(now)
+        return self.tokens / self.capacity
+
+    # 429などを受けたとき，一定時間すべての払い出しを止める
+    def backoff(self, delay: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+        self.backoffs += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "tokens": round(self.tokens, 2),
+            "in_flight": self.in_flight,
+            "backoffs": self.backoffs,
+            "lanes": {
+                p.name: {
+                    "queued": lane.queued,
+                    "served": lane.served,
+                    "avg_wait": round(lane.total_wait / lane.served, 3) if lane.served else 0.0,
+                    "max_wait": round(lane.max_wait, 3),
+                }
+                for p, lane in self.lanes.items()
+            },
+        }
+
+
+# クエリの操作名 (メトリクスのラベルに使う)
+def operation_name(query: str) -> str:
+    m = re.search(r"\b(?:query|mutation)\s+(\w+)", query)
+    return m.group(1) if m else "anonymous"
+
+
+# レスポンスに含まれるオブジェクト数を数える (perPageの見積もり用)
+def count_objects(node) -> int:
+    if isinstance(node, dict):
+        return 1 + sum(count_objects(v) for v in node.values())
+    if isinstance(node, list):
+        return sum(count_objects(v) for v in node)
+    return 0
+
+
+# start.gg GraphQLクライアント (コネクションを使い回す)
+class GqlClient:
+    def __init__(
+        self,
+        endpoint: str,
+        token: str,
+        max_concurrency: int = 8,
+        timeout_sec: float = 15,
+        connect_timeout_sec: float = 5,
+        scheduler: Optional[RequestScheduler] = None,
+        max_retries: int = 3,
+    ):
+        self.endpoint = endpoint
+        self.token = token
+        self.max_concurrency = max_concurrency
+        self.timeout_sec = timeout_sec
+        self.connect_timeout_sec = connect_timeout_sec
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    # セッションは最初のリクエスト時にイベントループ上で生成する
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout_sec, connect=self.connect_timeout_sec),
+                headers={
+                    "Authorization": f"Bearer {self.token}",
+                    "Content-Type": "application/json",
+                },
+            )
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    # 接続の枠を1つ取る．スケジューラがあれば優先度の順に，トークンと一緒に払い出してもらう
+    @asynccontextmanager
+    async def _slot(self, priority: Priority, fair_key):
+        if self.scheduler is None:
+            self._get_session()
+            async with self._sem:
+                yield
+            return
+        await self.scheduler.acquire(priority, fair_key)
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+
+    async def execute(
+        self,
+        query: str,
+        variables: dict,
+        timeout_sec: Optional[float] = None,
+        priority: Priority = Priority.POLL,
+        fair_key=None,
+    ) -> dict:
+        kwargs = {}
+        if timeout_sec:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout_sec, connect=self.connect_timeout_sec)
+        operation = operation_name(query)
+
+        for attempt in range(self.max_retries + 1):
+            started = None
+            try:
+                async with self._slot(priority, fair_key):
+                    started = time.perf_counter()
+                    async with self._get_session().post(
+                        self.endpoint,
+                        json={"query": query, "variables": variables},
+                        **kwargs,
+                    ) as resp:
+                        retry_after = resp.headers.get("Retry-After")
+                        if resp.status == 429:
+                            data = {"errors": [{"message": "Rate limit exceeded (HTTP 429)"}]}
+                        else:
+                            body = await resp.read()
+                            metrics.gql_payload.observe(len(body), operation=operation)
+                            data = json.loads(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                metrics.gql_requests.inc(operation=operation, status="exception")
+                raise
+            finally:
+                if started is not None:
+                    metrics.gql_latency.observe(time.perf_counter() - started, operation=operation)
+
+            if "errors" not in data:
+                metrics.gql_requests.inc(operation=operation, status="ok")
+                return data
+
+            error = GraphQLError(data["errors"])
+            if not error.is_rate_limit and resp.status != 429:
+                metrics.gql_requests.inc(operation=operation, status="error")
+                raise error
+            metrics.gql_requests.inc(operation=operation, status="rate_limited")
+            if attempt == self.max_retries:
+                raise RateLimitError(data["errors"])
+            metrics.gql_retries.inc(operation=operation)
+
+            # レート制限: 指定があればそれに従い，なければ指数的に待つ
+            try:
+                delay = float(retry_after) if retry_after else 2 ** attempt
+            except ValueError:
+                delay = 2 ** attempt
+            if self.scheduler:
+                self.scheduler.backoff(delay)
+            else:
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
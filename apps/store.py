@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger("DiscordStartggManager")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    set_id      TEXT PRIMARY KEY,
+    tournament  TEXT,
+    station     INTEGER,
+    round_text  TEXT,
+    message_id  INTEGER,
+    channel_id  INTEGER,
+    entrant1_id INTEGER,
+    entrant2_id INTEGER,
+    score1      INTEGER NOT NULL DEFAULT 0,
+    score2      INTEGER NOT NULL DEFAULT 0,
+    view_state  TEXT NOT NULL DEFAULT 'none',
+    updated_at  REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tournaments (
+    slug       TEXT PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    guild_id   INTEGER
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    set_id     TEXT PRIMARY KEY,
+    tournament TEXT,
+    payload    TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    created_at REAL
+);
+"""
+
+# 古いファイルでは列を足した後に作る
+INDEXES = """
+CREATE INDEX IF NOT EXISTS matches_message_id ON matches (message_id);
+"""
+
+COLUMNS = (
+    "set_id", "tournament", "station", "round_text", "message_id", "channel_id", "entrant1_id", "entrant2_id",
+    "score1", "score2", "view_state", "updated_at",
+)
+
+# view_state
+VIEW_NONE = "none"          # 通知前 (対戦台だけ記録)
+VIEW_ACTIVE = "active"      # スコア入力受付中
+VIEW_FINISHED = "finished"  # 受付終了
+
+
+# start.ggのセットIDは数値だが，プレビュー用のIDは文字列になる
+def _decode_set_id(raw: str):
+    return int(raw) if raw.isdigit() else raw
+
+
+# 再起動をまたいで保持する状態 (SQLite / WALモード)
+# 書き込みはメモリ上にまとめておき，一定間隔でまとめてコミットする
+# evict_after を指定すると，受付中のカードがなく evict_after 秒更新のない行はメモリから外す (ファイルには残し，必要になったら読み直す)
+class StateStore:
+    def __init__(self, path: str, flush_interval: float = 0.5, evict_after: Optional[float] = None, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.evict_after = evict_after
+        self.clock = clock
+        self.evicted = 0
+        self.rows: dict = {}
+        self._dirty: set = set()
+        self.meta: dict[str, str] = {}
+        self._meta_dirty: dict[str, str] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None  # メモリから外した行の読み直し用 (書き込み中でも読める)
+        self._last_evict = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def open(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(INDEXES)
+        self._reader = sqlite3.connect(self.path, check_same_thread=False)
+
+        query = f"SELECT {', '.join(COLUMNS)} FROM matches"
+        params: tuple = ()
+        if self.evict_after:
+            # メモリから外す対象の古い行は読み込まない
+            query += " WHERE view_state = ? OR updated_at IS NULL OR updated_at >= ?"
+            params = (VIEW_ACTIVE, self.clock() - self.evict_after)
+        for values in self._conn.execute(query, params):
+            row = self._row(values)
+            self.rows[row["set_id"]] = row
+        self.meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+
+    @staticmethod
+    def _row(values: tuple) -> dict:
+        row = dict(zip(COLUMNS, values))
+        row["set_id"] = _decode_set_id(row["set_id"])
+        return row
+
+    # メモリから外した行をファイルから読み直す (削除してまだ書き込んでいない行は読まない)
+    # 主キー・索引で1行だけ引く読み込み専用の接続なので，イベントループ上で呼んでも書き込み (WAL) を待たない
+    def _load(self, where: str, value) -> Optional[dict]:
+        if not self.evict_after or self._reader is None:
+            return None
+        values = self._reader.execute(f"SELECT {', '.join(COLUMNS)} FROM matches WHERE {where} = ?", (value,)).fetchone()
+        if values is None:
+            return None
+        row = self._row(values)
+        if row["set_id"] in self._dirty:
+            return None
+        self.rows[row["set_id"]] = row
+        return row
+
+    # 古いファイルに足りない列を追加する
+    def _migrate(self):
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(matches)")}
+
+        # 大会が1つだった頃のファイルには tournament 列がない
+        if "tournament" not in columns:
+            self._conn.execute("ALTER TABLE matches ADD COLUMN tournament TEXT")
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'tournament_slug'").fetchone()
+            if row:
+                self._conn.execute("UPDATE matches SET tournament = ?", (row[0],))
+
+        # 対戦カードの再描画に使うラウンド名
+        if "round_text" not in columns:
+            self._conn.execute("ALTER TABLE matches ADD COLUMN round_text TEXT")
+        self._conn.commit()
+
+    # 大会とチャンネルの紐づけ (コマンドで登録されたもの)．起動時に読み込み専用の接続で読む
+    def load_tournaments(self) -> list[dict]:
+        return [
+            {"slug": slug, "channel_id": channel_id, "guild_id": guild_id}
+            for slug, channel_id, guild_id in self._reader.execute("SELECT slug, channel_id, guild_id FROM tournaments")
+        ]
+
+    def _write_tournament(self, slug: str, channel_id: int, guild_id: Optional[int]):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tournaments (slug, channel_id, guild_id) VALUES (?, ?, ?)",
+                (slug, channel_id, guild_id),
+            )
+
+    def _delete_tournament(self, slug: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM tournaments WHERE slug = ?", (slug,))
+            self._conn.execute("DELETE FROM matches WHERE tournament = ?", (slug,))
+
+    # 書き込み用の接続はフラッシュと共有しているので，同じロックの中でワーカースレッドから書き込む
+    async def save_tournament(self, slug: str, channel_id: int, guild_id: Optional[int]):
+        async with self._lock:
+            await asyncio.to_thread(self._write_tournament, slug, channel_id, guild_id)
+
+    async def delete_tournament(self, slug: str):
+        for set_id in [k for k, row in self.rows.items() if row["tournament"] == slug]:
+            self.delete(set_id)
+        async with self._lock:
+            await asyncio.to_thread(self._delete_tournament, slug)
+
+    # スコア報告の送信待ち (プレイヤーに応答する前に書き込むので，まとめずにすぐコミットする)
+    # 読み込みは起動時だけなので，読み込み専用の接続で読む
+    def load_outbox(self) -> list[dict]:
+        return [
+            {
+                "set_id": _decode_set_id(set_id),
+                "tournament": tournament,
+                "payload": json.loads(payload),
+                "attempts": attempts,
+                "created_at": created_at,
+            }
+            for set_id, tournament, payload, attempts, created_at in self._reader.execute(
+                "SELECT set_id, tournament, payload, attempts, created_at FROM outbox ORDER BY created_at"
+            )
+        ]
+
+    def _write_outbox(self, set_id, tournament: Optional[str], payload: dict, attempts: int, created_at: float):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outbox (set_id, tournament, payload, attempts, created_at) VALUES (?, ?, ?, ?, ?)",
+                (str(set_id), tournament, json.dumps(payload), attempts, created_at),
+            )
+
+    def _delete_outbox(self, set_id):
+        with self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE set_id = ?", (str(set_id),))
+
+    async def save_outbox(self, set_id, tournament: Optional[str], payload: dict, attempts: int = 0, created_at: Optional[float] = None):
+        async with self._lock:
+            await asyncio.to_thread(self._write_outbox, set_id, tournament, payload, attempts, created_at or time.time())
+
+    async def delete_outbox(self, set_id):
+        async with self._lock:
+            await asyncio.to_thread(self._delete_outbox, set_id)
+
+    def put(self, set_id, **fields):
+        row = self.rows.get(set_id) or self._load("set_id", str(set_id))
+        if row is None:
+            row = {c: None for c in COLUMNS}
+            row.update(set_id=set_id, score1=0, score2=0, view_state=VIEW_NONE)
+            self.rows[set_id] = row
+        row.update(fields)
+        row["updated_at"] = self.clock()
+        self._dirty.add(set_id)
+
+    def delete(self, set_id):
+        if self.rows.pop(set_id, None) is not None:
+            self._dirty.add(set_id)
+
+    def get(self, set_id) -> Optional[dict]:
+        return self.rows.get(set_id) or self._load("set_id", str(set_id))
+
+    # メッセージIDから対戦カードを探す (一覧から外れたカードのボタンが押されたときだけ使う)
+    def find_by_message(self, message_id: int) -> Optional[tuple]:
+        for set_id, row in self.rows.items():
+            if row["message_id"] == message_id:
+                return set_id, row
+        row = self._load("message_id", message_id)
+        return (row["set_id"], row) if row else None
+
+    # 対戦台の記録がある全セット (メモリから外した行も含む)．(set_id, 大会, 対戦台) を返す
+    # 起動時 (状態の復元) だけ使うので，読み込み専用の接続で読む
+    def stations(self):
+        for set_id, row in self.rows.items():
+            if row["station"] is not None:
+                yield set_id, row["tournament"], row["station"]
+        if not self.evict_after:
+            return
+        for raw, tournament, station in self._reader.execute("SELECT set_id, tournament, station FROM matches WHERE station IS NOT NULL"):
+            set_id = _decode_set_id(raw)
+            if set_id not in self.rows and set_id not in self._dirty:
+                yield set_id, tournament, station
+
+    # 受付中のカードがなく，evict_after 秒更新のない行をメモリから外す (書き込み済みのものだけ)．外した件数を返す
+    def evict(self) -> int:
+        if not self.evict_after or self._lock.locked():
+            return 0
+        deadline = self.clock() - self.evict_after
+        stale = [
+            set_id for set_id, row in self.rows.items()
+            if row["view_state"] != VIEW_ACTIVE and (row["updated_at"] or 0) < deadline and set_id not in self._dirty
+        ]
+        for set_id in stale:
+            del self.rows[set_id]
+        self.evicted += len(stale)
+        return len(stale)
+
+    # 大会ごとの最終同期時刻などの小さな値 (対戦の状態と一緒にまとめて書き込む)
+    def get_meta(self, key: str) -> Optional[str]:
+        return self.meta.get(key)
+
+    def set_meta(self, key: str, value):
+        value = str(value)
+        if self.meta.get(key) == value:
+            return
+        self.meta[key] = value
+        self._meta_dirty[key] = value
+
+    def _write(self, upserts: list[tuple], deletes: list[tuple], meta: Optional[list[tuple]] = None):
+        with self._conn:
+            if meta:
+                self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta)
+            if upserts:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO matches ({', '.join(COLUMNS)}) "
+                    f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM matches WHERE set_id = ?", deletes)
+
+    def _take_dirty(self) -> tuple[list[tuple], list[tuple]]:
+        upserts, deletes = [], []
+        for set_id in self._dirty:
+            row = self.rows.get(set_id)
+            if row is None:
+                deletes.append((str(set_id),))
+            else:
+                upserts.append(tuple(str(set_id) if c == "set_id" else row[c] for c in COLUMNS))
+        self._dirty.clear()
+        return upserts, deletes
+
+    async def flush(self):
+        if not (self._dirty or self._meta_dirty) or self._conn is None:
+            return
+        async with self._lock:
+            pending = set(self._dirty)
+            meta = list(self._meta_dirty.items())
+            self._meta_dirty.clear()
+            upserts, deletes = self._take_dirty()
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes, meta)
+            except Exception:
+                # 次回のフラッシュで書き直す
+                self._dirty |= pending
+                self._meta_dirty = {**dict(meta), **self._meta_dirty}
+                raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[ERROR] 状態の保存に失敗しました: {e}")
+                continue
+            # 行の追い出しは1分に1回まで
+            now = self.clock()
+            if self.evict_after and now - self._last_evict >= min(60, self.evict_after):
+                self._last_evict = now
+                self.evict()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            await self.flush()
+            self._conn.close()
+            self._conn = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,59 @@
+import asyncio
+import json
+from typing import Optional
+
+from board import StationBoard
+from cadence import PollCadence
+from diff import SetDiffer
+from entrants import EntrantDirectory
+from registry import MatchRegistry
+from routing import Router
+
+
+# 大会ごとの状態 (1つのプロセスで複数の大会・サーバーを扱う)
+class Tournament:
+    def __init__(self, slug: str, channel_id: int, guild_id: Optional[int] = None):
+        self.slug = slug
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.router = Router()  # 対戦カードの送信先の振り分け (ルールがなければ channel_id に送る)
+
+        # ポーリング
+        self.initial_scan_done = False
+        self.board_scan_pending = False  # 再起動後に対戦中のセットを一度取り直して対戦台の一覧を埋める
+        self.baseline: Optional[asyncio.Task] = None  # 初回の読み込み (通知せずに現在の状態を記録する)
+        self.last_synced_at: Optional[int] = None  # 最後に取得が完了したポーリングの開始時刻 (UNIX秒)
+        self.last_full_scan_at = 0.0
+        self.event_ids: list[int] = []
+        self.event_per_page: dict[int, int] = {}  # {event_id: perPage}
+        self.pages_fetched = 0  # 取得したページ数の累計 (メトリクス用)
+        self.changes_detected = 0  # 検出した変化の件数の累計 (間隔の調整用)
+        self.cadence = PollCadence()  # ポーリングの間隔
+        self.next_poll_at = 0.0  # 次にポーリングする時刻 (UNIX秒)
+
+        # 対戦台と対戦カード
+        self.sets = SetDiffer()  # セットごとの前回の要約 (対戦台・状態・スコア)
+        self.matches = MatchRegistry()  # 受付中の対戦カード (ID・View)
+        self.board: Optional[StationBoard] = None  # 対戦台の一覧
+
+        self.entrants: Optional[EntrantDirectory] = None
+
+
+# 設定ファイルから大会とチャンネルの紐づけを読み込む
+# [{"slug": "...", "channel_id": 123, "guild_id": 456, "routes": [...]}, ...]
+# routes は routing.RouteRule の形式 (省略可)
+def load_bindings(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("tournaments", [])
+
+    bindings = []
+    for item in data:
+        bindings.append({
+            "slug": item["slug"],
+            "channel_id": int(item["channel_id"]),
+            "guild_id": int(item["guild_id"]) if item.get("guild_id") else None,
+            "routes": item.get("routes"),
+        })
+    return bindings
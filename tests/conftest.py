@@ -0,0 +1,5 @@
+import os
+import sys
+
+# apps/ のモジュールはパッケージではなく，apps/ を起点に読み込まれる
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "apps"))
@@ -0,0 +1,29 @@
+from diff import COMPLETED, CORRECTED, SCORE_CHANGED, SetDiffer
+
+
+def node(state, winner_id=None, games=(), station=1):
+    return {
+        "id": 1,
+        "state": state,
+        "station": {"number": station},
+        "winnerId": winner_id,
+        "slots": [{"entrant": {"id": 10}}, {"entrant": {"id": 20}}],
+        "games": [{"winnerId": g} for g in games],
+    }
+
+
+def kinds(differ, n):
+    return [e.kind for e in differ.diff(n)]
+
+
+# 終了後に勝者・スコアが修正されたら，修正として通知する
+def test_correction_of_completed_set_emits_event():
+    differ = SetDiffer()
+    differ.seed(node(2, games=(10,)))
+    assert kinds(differ, node(2, games=(10, 20))) == [SCORE_CHANGED]
+    assert kinds(differ, node(3, 10, (10, 20, 10))) == [COMPLETED]
+    assert differ.snapshots[1].winner_id == 10
+    assert kinds(differ, node(3, 20, (10, 20, 20))) == [CORRECTED]
+    assert kinds(differ, node(3, 20, (10, 20, 20))) == []
+    # 勝者は同じでゲームごとの勝者だけ直した場合も拾う
+    assert kinds(differ, node(3, 20, (20, 20))) == [CORRECTED]
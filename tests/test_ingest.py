@@ -0,0 +1,70 @@
+import asyncio
+import socket
+import time
+
+import aiohttp
+
+from ingest import PushBackend, is_loopback
+
+SECRET = "s3cret"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# 手元で立てたプッシュの受信口に，署名あり・なしのイベントを送る
+# 返り値: [(HTTPステータス, 処理に届いたノード, 受信から処理までの秒数)]
+async def push(requests: list[tuple[dict, dict]]) -> list[tuple[int, list, float]]:
+    received: asyncio.Queue = asyncio.Queue()
+
+    async def handler(nodes: list[dict]):
+        await received.put((nodes, time.perf_counter()))
+
+    # start.gg上の正しい状態 (送られてきた本文は使わない)
+    async def resolver(set_id):
+        return {"id": set_id, "state": 2, "station": {"number": 5}}
+
+    port = free_port()
+    backend = PushBackend(handler, resolver, host="127.0.0.1", port=port, secret=SECRET)
+    await backend.start()
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for body, headers in requests:
+                started = time.perf_counter()
+                async with session.post(f"http://127.0.0.1:{port}/startgg/sets", json=body, headers=headers) as resp:
+                    status = resp.status
+                try:
+                    nodes, handled_at = await asyncio.wait_for(received.get(), 0.5)
+                    results.append((status, nodes, handled_at - started))
+                except asyncio.TimeoutError:
+                    results.append((status, [], 0.0))
+    finally:
+        await backend.stop()
+    return results
+
+
+def test_signed_push_reaches_handler_with_refetched_set():
+    body = {"set": {"id": 7, "state": 3, "station": {"number": 1}, "slots": []}}
+    [(status, nodes, latency)] = asyncio.run(push([(body, {"X-Webhook-Secret": SECRET})]))
+    assert status == 202
+    # 本文の内容 (終了・対戦台1) ではなく，取り直したノードが渡る
+    assert nodes == [{"id": 7, "state": 2, "station": {"number": 5}}]
+    assert latency < 0.5
+
+
+def test_unsigned_or_wrongly_signed_push_is_rejected():
+    body = {"setId": 7}
+    results = asyncio.run(push([(body, {}), (body, {"X-Webhook-Secret": "wrong"})]))
+    assert [(status, nodes) for status, nodes, _ in results] == [(401, []), (401, [])]
+
+
+def test_loopback_hosts():
+    assert is_loopback("127.0.0.1")
+    assert is_loopback("::1")
+    assert is_loopback("localhost")
+    assert not is_loopback("0.0.0.0")
+    assert not is_loopback("192.168.1.10")
@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+# main.py は読み込み時に環境変数を検証する (interaction_bench が計測用の値を入れる)
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import interaction_bench  # noqa: E402
+import main  # noqa: E402
+
+
+# 1つのセットでプレイヤー2人とスタッフがスコアのボタンとOKを同時に押しても，
+# 送信は1回だけで，表示・送信したスコア・保存した状態が一致する
+def test_concurrent_clicks_on_one_set_are_serialized():
+    async def run():
+        try:
+            return [
+                await interaction_bench.run(sets, clicks=8, spread=0.05, discord_latency=0.002, startgg_latency=0.01, unsafe=False, seed=seed)
+                for sets, seed in ((1, 0), (1, 2), (20, 2))
+            ]
+        finally:
+            await main.report_outbox.close()
+
+    results = asyncio.run(run())
+    for result in results:
+        assert result["errors"] == 0, result["examples"]
+        assert result["violations"] == 0, result["examples"]
+    # 1セットの回は実際に同時押しが重なり，スコアは1回だけ送信される
+    for result in results[:2]:
+        assert result["contended"] > 0
+        assert result["submitted"] == 1
+    assert results[2]["submitted"] > 0
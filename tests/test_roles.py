@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+from roles import sync_member_cache
+
+
+# _remove_member のない discord.py のギルド
+class OldGuild:
+    def __init__(self, cached: list[int], me: int = 1):
+        self._members = {uid: SimpleNamespace(id=uid) for uid in cached}
+        self.me = SimpleNamespace(id=me)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, uid):
+        return self._members.get(uid)
+
+    async def query_members(self, user_ids, limit, cache):
+        found = [SimpleNamespace(id=uid) for uid in user_ids]
+        if cache:
+            self._members.update((m.id, m) for m in found)
+        return found
+
+
+class FakeGuild(OldGuild):
+    def _remove_member(self, member):
+        del self._members[member.id]
+
+
+# 参加者と自分だけがキャッシュに残る
+def test_only_participants_stay_cached():
+    guild = FakeGuild(cached=[1, 2, 3])
+    cached, dropped = asyncio.run(sync_member_cache(guild, {3, 4}))
+    assert (cached, dropped) == (2, 1)
+    assert sorted(m.id for m in guild.members) == [1, 3, 4]
+
+
+# 外す手段がない discord.py では外さずに続ける
+def test_missing_private_removal_is_skipped():
+    guild = OldGuild(cached=[1, 2])
+    cached, dropped = asyncio.run(sync_member_cache(guild, {3}))
+    assert (cached, dropped) == (1, 0)
+    assert sorted(m.id for m in guild.members) == [1, 2, 3]
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from gql_bench import BENCH_QUERY, StandInStartgg
+from startgg import GqlClient
+
+
+async def _execute_many(count: int, concurrency: int, sequential: bool = False):
+    server = StandInStartgg(rtt=0.005)
+    await server.start()
+    client = GqlClient(server.url, "test", max_concurrency=concurrency)
+    try:
+        if sequential:
+            results = [await client.execute(BENCH_QUERY, {"eventId": 1}) for _ in range(count)]
+        else:
+            results = await asyncio.gather(*(client.execute(BENCH_QUERY, {"eventId": 1}) for _ in range(count)))
+    finally:
+        await client.close()
+        await server.stop()
+    return server, results
+
+
+# 同時に送っても，接続は max_concurrency 本までしか開かない
+def test_concurrent_requests_reuse_pooled_connections():
+    server, results = asyncio.run(_execute_many(60, concurrency=4))
+    assert server.requests == 60
+    assert all(r["data"]["event"]["sets"]["nodes"] for r in results)
+    assert 1 <= len(server.peers) <= 4
+
+
+# 続けて送ったリクエストは1本の接続を使い回す
+def test_sequential_requests_share_one_connection():
+    server, _ = asyncio.run(_execute_many(20, concurrency=4, sequential=True))
+    assert server.requests == 20
+    assert len(server.peers) == 1
+
+
+# リクエストごとの指定がなければ，セッションのタイムアウト (GQL_TIMEOUT) が効く
+def test_session_timeout_applies_without_per_request_timeout():
+    async def run():
+        server = StandInStartgg(rtt=0.5)
+        await server.start()
+        client = GqlClient(server.url, "test", timeout_sec=0.2)
+        try:
+            await client.execute(BENCH_QUERY, {"eventId": 1})
+        finally:
+            await client.close()
+            await server.stop()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
@@ -0,0 +1,28 @@
+import asyncio
+
+from store import VIEW_ACTIVE, StateStore
+
+
+# 大会の登録はフラッシュと同じ接続に書くので，同時に走っても両方とも書き込まれる
+def test_tournament_writes_do_not_interleave_with_flush(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def run():
+        store = StateStore(path)
+        store.open()
+        for set_id in range(500):
+            store.put(set_id, tournament="a", station=set_id, view_state=VIEW_ACTIVE)
+        await asyncio.gather(store.flush(), store.save_tournament("a", 1, 2), store.save_tournament("b", 3, None))
+        await store.delete_tournament("b")
+        await store.close()
+
+        reopened = StateStore(path)
+        reopened.open()
+        try:
+            return reopened.load_tournaments(), len(reopened.rows)
+        finally:
+            await reopened.close()
+
+    tournaments, rows = asyncio.run(run())
+    assert tournaments == [{"slug": "a", "channel_id": 1, "guild_id": 2}]
+    assert rows == 500